@@ -5,6 +5,8 @@ Quick script to add money for testing
 
 import sqlite3
 
+import etags
+
 def add_balance():
     print("=" * 60)
     print("ADD BALANCE TO USER")
@@ -30,7 +32,7 @@ def add_balance():
         amount = float(input("Enter amount to add (Rs): "))
         
         # Check if user exists
-        cursor.execute("SELECT balance FROM users WHERE username = ?", (username,))
+        cursor.execute("SELECT balance, id FROM users WHERE username = ?", (username,))
         user = cursor.fetchone()
         
         if not user:
@@ -44,6 +46,7 @@ def add_balance():
         # Update balance
         cursor.execute("UPDATE users SET balance = balance + ? WHERE username = ?", 
                       (amount, username))
+        etags.bump(cursor, 'sqlite', user[1])  # the dashboard's cached copy is stale now
         conn.commit()
         
         print("\n✅ SUCCESS!")
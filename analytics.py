@@ -0,0 +1,170 @@
+"""
+Analytics Console - Streamlit dashboard for admins
+Reads the daily rollups instead of raw tables, and every query result is
+cached with a TTL and shared by all viewers, so the production database
+sees at most a handful of small queries per TTL no matter how many
+people have the console open.
+
+Run:
+    streamlit run analytics.py
+"""
+
+from datetime import date, timedelta
+
+import pandas as pd
+import streamlit as st
+
+import forecast
+import rollups
+from app import ADMIN_PASSWORD, get_db_connection
+
+ROLLUP_TTL = 300      # seconds between incremental rollup refreshes
+LIABILITY_TTL = 120
+FUNNEL_TTL = 600
+MAX_RANGE_DAYS = 365  # the one rollup read every range is filtered from
+
+RANGES = {
+    'Last 7 days': 7,
+    'Last 30 days': 30,
+    'Last 90 days': 90,
+    'Last 365 days': 365,
+}
+
+st.set_page_config(page_title="Magic Impact Analytics", page_icon="📊", layout="wide")
+
+
+@st.cache_data(ttl=ROLLUP_TTL, show_spinner=False)
+def load_rollups():
+    """Refresh the rollups incrementally and read the last MAX_RANGE_DAYS of them"""
+    conn, db_type = get_db_connection()
+    try:
+        rollups.refresh(conn, db_type)
+        since = date.today() - timedelta(days=MAX_RANGE_DAYS)
+        rows = rollups.fetch_rollups(conn.cursor(), db_type, since)
+    finally:
+        conn.close()
+    df = pd.DataFrame(rows, columns=['day', 'metric', 'dimension', 'count', 'total'])
+    df['day'] = pd.to_datetime(df['day'])
+    return df
+
+
+@st.cache_data(ttl=LIABILITY_TTL, show_spinner=False)
+def load_liabilities():
+    return forecast.load_forecast(get_db_connection).summary()
+
+
+@st.cache_data(ttl=FUNNEL_TTL, show_spinner=False)
+def load_referral_conversions(days):
+    """Referred users in the range who went on to invest / get an investment approved"""
+    since = (date.today() - timedelta(days=days)).isoformat()
+    conn, db_type = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        placeholder = '%s' if db_type == 'postgres' else '?'
+        cursor.execute(f'''
+            SELECT COUNT(DISTINCT u.id) AS invested,
+                   COUNT(DISTINCT CASE WHEN i.status IN ('active', 'completed') THEN u.id END) AS approved
+            FROM users u
+            JOIN investments i ON i.user_id = u.id
+            WHERE u.referred_by IS NOT NULL AND u.created_at >= {placeholder}
+        ''', (since,))
+        row = cursor.fetchone()
+    finally:
+        conn.close()
+    return int(row['invested'] or 0), int(row['approved'] or 0)
+
+
+def require_admin():
+    if st.session_state.get('admin'):
+        return
+    st.title("🔒 Admin Analytics")
+    password = st.text_input("Admin password", type="password")
+    if password and password == ADMIN_PASSWORD:
+        st.session_state['admin'] = True
+        st.rerun()
+    elif password:
+        st.error("Invalid admin credentials!")
+    st.stop()
+
+
+def daily_series(df, metric, value, days, by_dimension=False):
+    """Pivot one metric into a day-indexed frame covering every day in the range"""
+    index = pd.date_range(date.today() - timedelta(days=days - 1), date.today(), freq='D')
+    rows = df[df['metric'] == metric]
+    if by_dimension:
+        series = rows.pivot_table(index='day', columns='dimension', values=value, aggfunc='sum')
+    else:
+        series = rows.groupby('day')[value].sum().to_frame(metric)
+    return series.reindex(index, fill_value=0).fillna(0)
+
+
+def main():
+    require_admin()
+
+    st.title("📊 Magic Impact Analytics")
+    range_label = st.sidebar.selectbox("Time range", list(RANGES), index=1)
+    days = RANGES[range_label]
+    if st.sidebar.button("Clear cache"):
+        st.cache_data.clear()
+
+    df = load_rollups()
+    since = pd.Timestamp(date.today() - timedelta(days=days - 1))
+    df = df[df['day'] >= since]
+
+    def total(metric, value='count', prefix=None):
+        rows = df[df['metric'] == metric]
+        if prefix:
+            rows = rows[rows['dimension'].str.endswith(prefix)]
+        return rows[value].sum()
+
+    # Headline numbers
+    cols = st.columns(5)
+    cols[0].metric("Signups", int(total('registration')))
+    cols[1].metric("Referral Signups", int(total('referral_signup')))
+    cols[2].metric("Deposits Submitted", f"Rs {total('investment_new', 'total'):,.0f}")
+    cols[3].metric("Deposits Approved", f"Rs {total('investment_approved', 'total'):,.0f}")
+    cols[4].metric("Withdrawals Approved", f"Rs {total('withdrawal', 'total', ':approved'):,.0f}")
+
+    st.subheader("Signups")
+    signups = daily_series(df, 'registration', 'count', days).join(
+        daily_series(df, 'referral_signup', 'count', days))
+    st.line_chart(signups)
+
+    st.subheader("Deposits by plan (Rs)")
+    st.bar_chart(daily_series(df, 'investment_approved', 'total', days, by_dimension=True))
+
+    st.subheader("Withdrawals by method and status (Rs)")
+    st.bar_chart(daily_series(df, 'withdrawal', 'total', days, by_dimension=True))
+
+    st.subheader("Referral funnel")
+    invested, approved = load_referral_conversions(days)
+    funnel = pd.DataFrame({
+        'stage': ['All signups', 'Referred signups', 'Referred & invested', 'Referred & approved'],
+        'users': [int(total('registration')), int(total('referral_signup')), invested, approved],
+    })
+    st.dataframe(funnel, hide_index=True, width='stretch')
+
+    st.subheader("Outstanding liabilities")
+    liability = load_liabilities()
+    cols = st.columns(len(liability['horizons']) + 2)
+    cols[0].metric("Due Today", f"Rs {liability['due_today']:,.0f}")
+    for col, (horizon, owed) in zip(cols[1:], liability['horizons'].items()):
+        col.metric(f"Next {horizon} Days", f"Rs {owed:,.0f}")
+    cols[-1].metric(f"Pending Withdrawals ({liability['pending_withdrawals']['count']})",
+                    f"Rs {liability['pending_withdrawals']['total']:,.0f}")
+    schedule = pd.DataFrame(
+        {'due': liability['daily_schedule']},
+        index=pd.date_range(date.today(), periods=len(liability['daily_schedule']), freq='D'),
+    )
+    st.area_chart(schedule)
+    if liability['plans']:
+        st.dataframe(pd.DataFrame([
+            {'plan': p['plan_name'], 'active': p['active'], 'daily': p['daily'],
+             **{f'{h} days': v for h, v in p['horizons'].items()}}
+            for p in liability['plans']
+        ]), hide_index=True, width='stretch')
+
+    st.caption(f"Rollups refresh every {ROLLUP_TTL // 60} min, liabilities every {LIABILITY_TTL // 60} min.")
+
+
+main()
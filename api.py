@@ -0,0 +1,382 @@
+"""
+JSON API v1 - the data behind dashboard(), withdraw(), referral() and admin_panel()
+
+    GET /api/v1/me                     balance, totals, payout numbers
+    GET /api/v1/investments            my investments        (paginated)
+    GET /api/v1/withdrawals            my withdrawals        (paginated)
+    GET /api/v1/referrals              users I referred      (paginated)
+    GET /api/v1/admin/stats            admin panel counters + liability forecast
+    GET /api/v1/admin/queue?type=investments|withdrawals[&status=pending]
+    GET /api/v1/admin/users
+    GET /api/v1/admin/users/search?q=  username / email / payout numbers, ranked
+
+List endpoints take ?limit= (max 200), ?cursor= (the next_cursor of the
+previous page; keyset on id, so deep pages cost the same as the first)
+and ?fields=a,b,c to select only the columns the client needs. Search
+results are ranked rather than ordered by id, so their cursor is an
+offset into the ranking (see usersearch.py).
+
+Money and timestamps are converted to plain floats/strings in SQL, so
+rows serialize with no per-value Python hooks (orjson when installed).
+screenshot_url comes back as a signed /screenshots/ link for the caller.
+"""
+
+import base64
+import json
+
+from flask import Blueprint, Response, request, session
+
+import etags
+import forecast
+import screenshots
+import usersearch
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+
+api = Blueprint('api_v1', __name__, url_prefix='/api/v1')
+_get_db_connection = None
+
+if ORJSON_AVAILABLE:
+    def dumps(obj):
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+else:
+    _encoder = json.JSONEncoder(separators=(',', ':'), ensure_ascii=False)  # int keys become strings
+
+    def dumps(obj):
+        return _encoder.encode(obj).encode('utf-8')
+
+
+def init_app(app, get_db_connection):
+    global _get_db_connection
+    _get_db_connection = get_db_connection
+    app.register_blueprint(api)
+
+
+def json_response(data, status=200):
+    return Response(dumps(data), status=status, mimetype='application/json')
+
+
+def error(message, status):
+    return json_response({'error': message}, status)
+
+
+class ApiError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+@api.errorhandler(ApiError)
+def handle_api_error(e):
+    return error(e.message, e.status)
+
+
+# --- column specs: field -> (SQL expression, kind) -------------------------
+
+def _expr(db_type, expr, kind):
+    """SQL that already yields a JSON-native value for this kind"""
+    if kind == 'money':
+        if db_type == 'postgres':
+            return f"CAST(ROUND({expr}, 2) AS DOUBLE PRECISION)"
+        return f"ROUND({expr}, 2)"
+    if kind == 'time' and db_type == 'postgres':
+        return f"CAST({expr} AS TEXT)"
+    return expr
+
+
+INVESTMENT_FIELDS = {
+    'id': ('i.id', 'int'),
+    'plan_name': ('i.plan_name', 'text'),
+    'amount': ('i.amount', 'money'),
+    'daily_income': ('i.daily_income', 'money'),
+    'total_return': ('i.total_return', 'money'),
+    'days_remaining': ('i.days_remaining', 'int'),
+    'days_completed': ('i.days_completed', 'int'),
+    'screenshot_url': ('i.screenshot_url', 'text'),
+    'status': ('i.status', 'text'),
+    'created_at': ('i.created_at', 'time'),
+    'approved_at': ('i.approved_at', 'time'),
+}
+
+WITHDRAWAL_FIELDS = {
+    'id': ('w.id', 'int'),
+    'amount': ('w.amount', 'money'),
+    'payment_method': ('w.payment_method', 'text'),
+    'account_number': ('w.account_number', 'text'),
+    'status': ('w.status', 'text'),
+    'created_at': ('w.created_at', 'time'),
+    'processed_at': ('w.processed_at', 'time'),
+}
+
+OWNER_FIELDS = {
+    'user_id': ('u.id', 'int'),
+    'username': ('u.username', 'text'),
+    'whatsapp_number': ('u.whatsapp_number', 'text'),
+}
+
+REFERRAL_FIELDS = {
+    'id': ('u.id', 'int'),
+    'username': ('u.username', 'text'),
+    'created_at': ('u.created_at', 'time'),
+}
+
+USER_FIELDS = {
+    'id': ('u.id', 'int'),
+    'username': ('u.username', 'text'),
+    'email': ('u.email', 'text'),
+    'balance': ('u.balance', 'money'),
+    'referral_code': ('u.referral_code', 'text'),
+    'referred_by': ('u.referred_by', 'text'),
+    'whatsapp_number': ('u.whatsapp_number', 'text'),
+    'easypaisa_number': ('u.easypaisa_number', 'text'),
+    'jazzcash_number': ('u.jazzcash_number', 'text'),
+    'created_at': ('u.created_at', 'time'),
+}
+
+
+def _selected_fields(spec):
+    requested = request.args.get('fields')
+    if not requested:
+        return list(spec)
+    fields = [f.strip() for f in requested.split(',') if f.strip()]
+    unknown = [f for f in fields if f not in spec]
+    if unknown:
+        raise ApiError(f"Unknown field(s): {', '.join(unknown)}. Available: {', '.join(spec)}")
+    if 'id' not in fields:
+        fields.insert(0, 'id')  # needed for the cursor
+    return fields
+
+
+def _encode_cursor(row_id):
+    return base64.urlsafe_b64encode(str(row_id).encode()).decode().rstrip('=')
+
+
+def _decode_cursor(value):
+    if not value:
+        return None
+    try:
+        return int(base64.urlsafe_b64decode(value + '=' * (-len(value) % 4)).decode())
+    except ValueError:
+        raise ApiError("Invalid cursor")
+
+
+def _limit():
+    try:
+        limit = int(request.args.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        raise ApiError("limit must be an integer")
+    return max(1, min(limit, MAX_LIMIT))
+
+
+def _page(spec, from_sql, where, params):
+    """One keyset page (newest first) of the selected fields"""
+    conn, db_type = _get_db_connection()
+    placeholder = '%s' if db_type == 'postgres' else '?'
+    fields = _selected_fields(spec)
+    limit = _limit()
+    where = list(where)
+    params = list(params)
+
+    id_expr = spec['id'][0]
+    after = _decode_cursor(request.args.get('cursor'))
+    if after is not None:
+        where.append(f"{id_expr} < ?")
+        params.append(after)
+
+    select = ', '.join(f"{_expr(db_type, *spec[f])} AS {f}" for f in fields)
+    sql = f"SELECT {select} FROM {from_sql}"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += f" ORDER BY {id_expr} DESC LIMIT ?"
+    params.append(limit + 1)
+
+    try:
+        cursor = conn.cursor()
+        cursor.execute(sql.replace('?', placeholder), params)
+        rows = cursor.fetchall()
+    finally:
+        conn.close()
+
+    items = [dict(row) for row in rows[:limit]]
+    if 'screenshot_url' in fields:
+        for item in items:
+            item['screenshot_url'] = screenshots.signed_url(item['screenshot_url'])
+    next_cursor = _encode_cursor(items[-1]['id']) if len(rows) > limit else None
+    return json_response({'data': items, 'next_cursor': next_cursor})
+
+
+def _user_id():
+    if 'user_id' not in session:
+        raise ApiError("Please login first!", 401)
+    return session['user_id']
+
+
+def _require_admin():
+    if 'admin' not in session:
+        raise ApiError("Unauthorized access!", 401)
+
+
+# --- user endpoints -------------------------------------------------------
+
+@api.route('/me')
+@etags.conditional('api-me', lambda: _get_db_connection())
+def me():
+    user_id = _user_id()
+    conn, db_type = _get_db_connection()
+    placeholder = '%s' if db_type == 'postgres' else '?'
+
+    def money(expr):
+        return _expr(db_type, f"COALESCE({expr}, 0)", 'money')
+
+    try:
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            SELECT u.id, u.username, {money('u.balance')} AS balance, u.referral_code,
+                   u.whatsapp_number, u.easypaisa_number, u.jazzcash_number,
+                   {money('a.invested')} AS total_invested,
+                   {money('a.daily')} AS total_daily_income,
+                   {money('a.earned')} AS total_earned,
+                   COALESCE(a.active, 0) AS active_investments
+            FROM users u
+            LEFT JOIN (
+                SELECT user_id, SUM(amount) AS invested, SUM(daily_income) AS daily,
+                       SUM(daily_income * days_completed) AS earned, COUNT(*) AS active
+                FROM investments WHERE user_id = {placeholder} AND status = 'active'
+                GROUP BY user_id
+            ) a ON a.user_id = u.id
+            WHERE u.id = {placeholder}
+        ''', (user_id, user_id))
+        row = cursor.fetchone()
+    finally:
+        conn.close()
+
+    if not row:
+        raise ApiError("User not found", 404)
+    return json_response({'data': dict(row)})
+
+
+@api.route('/investments')
+def investments():
+    user_id = _user_id()
+    where, params = ['i.user_id = ?'], [user_id]
+    if request.args.get('status'):
+        where.append('i.status = ?')
+        params.append(request.args['status'])
+    return _page(INVESTMENT_FIELDS, 'investments i', where, params)
+
+
+@api.route('/withdrawals')
+def withdrawals():
+    user_id = _user_id()
+    where, params = ['w.user_id = ?'], [user_id]
+    if request.args.get('status'):
+        where.append('w.status = ?')
+        params.append(request.args['status'])
+    return _page(WITHDRAWAL_FIELDS, 'withdrawals w', where, params)
+
+
+@api.route('/referrals')
+def referrals():
+    user_id = _user_id()
+    conn, db_type = _get_db_connection()
+    placeholder = '%s' if db_type == 'postgres' else '?'
+    try:
+        cursor = conn.cursor()
+        cursor.execute(f'SELECT referral_code FROM users WHERE id = {placeholder}', (user_id,))
+        row = cursor.fetchone()
+    finally:
+        conn.close()
+    code = row['referral_code'] if row else None
+    if not code:
+        return json_response({'data': [], 'next_cursor': None})
+    return _page(REFERRAL_FIELDS, 'users u', ['u.referred_by = ?'], [code])
+
+
+# --- admin endpoints ------------------------------------------------------
+
+@api.route('/admin/stats')
+def admin_stats():
+    _require_admin()
+    conn, db_type = _get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            SELECT
+                (SELECT COUNT(*) FROM investments WHERE status = 'pending') AS pending_investments,
+                (SELECT COUNT(*) FROM withdrawals WHERE status = 'pending') AS pending_withdrawals,
+                (SELECT COUNT(*) FROM users) AS total_users,
+                (SELECT {_expr(db_type, 'COALESCE(SUM(amount), 0)', 'money')}
+                 FROM investments WHERE status = 'active') AS total_invested
+        ''')
+        stats = dict(cursor.fetchone())
+    finally:
+        conn.close()
+
+    summary = forecast.get_forecast(_get_db_connection).summary()
+    stats['liability'] = {key: summary[key] for key in
+                          ('due_today', 'horizons', 'pending_withdrawals', 'total_exposure')}
+    return json_response({'data': stats})
+
+
+@api.route('/admin/queue')
+def admin_queue():
+    _require_admin()
+    kind = request.args.get('type', 'investments')
+    status = request.args.get('status', 'pending')
+    if kind == 'investments':
+        spec = dict(INVESTMENT_FIELDS, **OWNER_FIELDS)
+        from_sql = 'investments i JOIN users u ON i.user_id = u.id'
+        where = ['i.status = ?']
+    elif kind == 'withdrawals':
+        spec = dict(WITHDRAWAL_FIELDS, **OWNER_FIELDS)
+        from_sql = 'withdrawals w JOIN users u ON w.user_id = u.id'
+        where = ['w.status = ?']
+    else:
+        raise ApiError("type must be 'investments' or 'withdrawals'")
+    return _page(spec, from_sql, where, [status])
+
+
+@api.route('/admin/users')
+def admin_users():
+    _require_admin()
+    return _page(USER_FIELDS, 'users u', [], [])
+
+
+@api.route('/admin/users/search')
+def admin_user_search():
+    _require_admin()
+    text = request.args.get('q', '').strip()
+    if not text:
+        raise ApiError("q is required")
+    fields = _selected_fields(USER_FIELDS)
+    limit = _limit()
+    offset = _decode_cursor(request.args.get('cursor')) or 0
+
+    conn, db_type = _get_db_connection()
+    placeholder = '%s' if db_type == 'postgres' else '?'
+    try:
+        ids, truncated = usersearch.search(conn, db_type, text)
+        page = ids[offset:offset + limit]
+        rows = []
+        if page:
+            select = ', '.join(f"{_expr(db_type, *USER_FIELDS[f])} AS {f}" for f in fields)
+            cursor = conn.cursor()
+            cursor.execute(f"SELECT {select} FROM users u WHERE u.id IN ({', '.join([placeholder] * len(page))})",
+                           page)
+            rows = cursor.fetchall()
+    finally:
+        conn.close()
+
+    by_id = {row['id']: dict(row) for row in rows}
+    items = [by_id[user_id] for user_id in page if user_id in by_id]
+    next_cursor = _encode_cursor(offset + limit) if offset + limit < len(ids) else None
+    return json_response({'data': items, 'next_cursor': next_cursor,
+                          'total': len(ids), 'truncated': truncated})
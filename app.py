@@ -1,17 +1,45 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash
+from flask import Flask, render_template, request, redirect, url_for, session, flash, Response, jsonify
 import sqlite3
 import hashlib
+import importlib.util
+import inspect
+import json
 import os
+import time
+import uuid
 from datetime import timedelta, datetime
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.middleware.proxy_fix import ProxyFix
 from werkzeug.utils import secure_filename
 
-# PostgreSQL support
+import api
+import archive
+import assets
+import availability
+import compression
+import db_pool
+import earnings
+import etags
+import events
+import exports
+import forecast
+import green
+import jobs
+import payouts
+import phash
+import ratelimit
+import render_cache
+import screenshots
+import uploads
+import usersearch
+
 try:
-    import psycopg2
-    from psycopg2.extras import RealDictCursor
-    POSTGRES_AVAILABLE = True
-except ImportError:
-    POSTGRES_AVAILABLE = False
+    import fcntl
+except ImportError:  # Windows: no cross-process lock for the schema check
+    fcntl = None
+
+# PostgreSQL support (psycopg2 itself is imported by the pool on first connect)
+POSTGRES_AVAILABLE = importlib.util.find_spec('psycopg2') is not None
 
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', 'your-secret-key-change-this-in-production')
@@ -25,19 +53,68 @@ os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 5 * 1024 * 1024  # 5MB max file size
 
+# Fingerprinted, precompressed CSS/JS built by `python assets.py`
+assets.init_app(app)
+
+# Precompiled templates + pre-rendered landing/login/register pages
+page_cache = render_cache.PageCache(app)
+
+# gzip/brotli for dynamic responses (dashboard, admin, referral, exports)
+compressor = compression.CompressionMiddleware(app.wsgi_app)
+app.wsgi_app = compressor
+
+# Behind Railway's proxy the client IP (used by rate limits) is in X-Forwarded-For
+PROXY_COUNT = int(os.environ.get('PROXY_COUNT', 1 if os.environ.get('RAILWAY_ENVIRONMENT') else 0))
+if PROXY_COUNT:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=PROXY_COUNT, x_proto=PROXY_COUNT)
+
 # Check if running on Railway (PostgreSQL) or local (SQLite)
 DATABASE_URL = os.environ.get('DATABASE_URL')
 
+def db_target():
+    """Short stable id of the configured database, for per-database cache files"""
+    return hashlib.sha256((DATABASE_URL or os.path.abspath('database/users.db')).encode()).hexdigest()[:16]
+
+# Pooled connections: close() hands them back (safe under gthread workers)
+postgres_pool = db_pool.PostgresPool(DATABASE_URL) if DATABASE_URL else None
+sqlite_pool = db_pool.SQLitePool('database/users.db', timeout=30.0)
+
 def get_db_connection():
     """Get database connection - PostgreSQL on Railway, SQLite locally"""
     if DATABASE_URL and POSTGRES_AVAILABLE:
-        conn = psycopg2.connect(DATABASE_URL, cursor_factory=RealDictCursor)
-        return conn, 'postgres'
-    else:
-        # Add timeout to prevent lock issues
-        conn = sqlite3.connect('database/users.db', timeout=30.0)
+        return postgres_pool.connect(), 'postgres'
+    elif green.enabled:
+        # gevent: threadpool-backed, one connection per call
+        conn = green.connect_sqlite('database/users.db', timeout=30.0)
         conn.row_factory = sqlite3.Row
         return conn, 'sqlite'
+    else:
+        # Add timeout to prevent lock issues
+        return sqlite_pool.connect(), 'sqlite'
+
+# JSON API (/api/v1/...) for the dashboard, withdraw, referral and admin data
+api.init_app(app, get_db_connection)
+
+# Live admin queue: write paths publish, /admin/events streams to admin.html
+events.broker.init(get_db_connection)
+
+# invest() screenshots are checked while they stream in and written straight to disk
+uploads.init_app(app, get_db_connection, UPLOAD_FOLDER)
+
+# ...and only ever served to their owner or an admin, through signed links
+screenshots.init_app(app, UPLOAD_FOLDER)
+
+# Bloom filters of usernames / emails / referral codes for the register form
+availability.index.init(get_db_connection)
+
+# Perceptual hashes of every screenshot, to flag reused payment proofs
+phash.index.init(get_db_connection, os.path.join('.cache', f'phash-{db_target()}.npz'))
+
+# Token buckets shared by all workers + fast 503s when a worker is overloaded
+limiter = ratelimit.RateLimiter()
+limiter.init_app(app)
+shedder = ratelimit.LoadShedder(app.wsgi_app, pool_wait=postgres_pool.recent_wait if postgres_pool else None)
+app.wsgi_app = shedder
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
@@ -105,6 +182,16 @@ def init_db():
             )
         ''')
         
+        etags.ensure_table(cursor, db_type)
+        events.ensure_table(cursor, db_type)
+        jobs.ensure_table(cursor, db_type)
+        payouts.ensure_table(cursor, db_type)
+        phash.ensure_table(cursor, db_type)
+        uploads.ensure_table(cursor, db_type)
+        archive.ensure_table(cursor, db_type)
+        earnings.ensure_table(cursor, db_type)
+        usersearch.ensure_table(cursor, db_type)
+        
         print("✅ PostgreSQL Database initialized successfully!")
         
     else:
@@ -157,7 +244,21 @@ def init_db():
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 )
             ''')
-        
+
+        # Tables upgraded by the ALTER above have no index on referral_code;
+        # every referral check and referred signup looks a code up
+        cursor.execute('''
+            SELECT 1 FROM pragma_index_list('users') l, pragma_index_info(l.name) i
+            WHERE i.name = 'referral_code'
+        ''')
+        if not cursor.fetchone():
+            print("🔧 Indexing users.referral_code...")
+            try:
+                cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_users_referral_code ON users (referral_code)")
+            except sqlite3.IntegrityError:
+                print("⚠️  Duplicate referral codes found, indexing users.referral_code without UNIQUE")
+                cursor.execute("CREATE INDEX IF NOT EXISTS idx_users_referral_code ON users (referral_code)")
+
         # Check and recreate investments table if needed
         cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='investments'")
         inv_exists = cursor.fetchone()
@@ -204,6 +305,12 @@ def init_db():
             )
         ''')
         
+        cursor.execute("PRAGMA table_info(withdrawals)")
+        wd_columns = [column[1] for column in cursor.fetchall()]
+        if 'processed_at' not in wd_columns:
+            print("🔧 Adding 'processed_at' column to withdrawals...")
+            cursor.execute("ALTER TABLE withdrawals ADD COLUMN processed_at TIMESTAMP")
+        
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS daily_earnings (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -216,11 +323,104 @@ def init_db():
             )
         ''')
         
+        cursor.execute("PRAGMA table_info(daily_earnings)")
+        de_columns = [column[1] for column in cursor.fetchall()]
+        if 'user_id' not in de_columns:
+            print("🔧 Adding 'user_id' column to daily_earnings...")
+            cursor.execute("ALTER TABLE daily_earnings ADD COLUMN user_id INTEGER")
+        
+        etags.ensure_table(cursor, db_type)
+        events.ensure_table(cursor, db_type)
+        jobs.ensure_table(cursor, db_type)
+        payouts.ensure_table(cursor, db_type)
+        phash.ensure_table(cursor, db_type)
+        uploads.ensure_table(cursor, db_type)
+        archive.ensure_table(cursor, db_type)
+        earnings.ensure_table(cursor, db_type)
+        usersearch.ensure_table(cursor, db_type)
+        
         print("✅ SQLite Database initialized successfully!")
     
     conn.commit()
     conn.close()
 
+SCHEMA_CACHE = os.path.join('.cache', 'schema.json')
+
+def schema_fingerprint(cursor, db_type):
+    """Hash of the live schema, read in a single query"""
+    if db_type == 'postgres':
+        cursor.execute('''
+            SELECT string_agg(table_name || '.' || column_name || ':' || data_type, ','
+                              ORDER BY table_name, column_name) AS schema
+            FROM information_schema.columns WHERE table_schema = 'public'
+        ''')
+    else:
+        cursor.execute('''
+            SELECT group_concat(sql, ';') AS schema
+            FROM (SELECT sql FROM sqlite_master WHERE sql IS NOT NULL ORDER BY name)
+        ''')
+    row = cursor.fetchone()
+    return hashlib.sha256((row['schema'] or '').encode()).hexdigest()
+
+def _read_fingerprint():
+    conn, db_type = get_db_connection()
+    try:
+        return db_type, schema_fingerprint(conn.cursor(), db_type)
+    finally:
+        conn.close()
+
+def ensure_schema():
+    """Run init_db() only when the schema or the code creating it changed since the last check"""
+    started = time.perf_counter()
+    if not DATABASE_URL:
+        os.makedirs('database', exist_ok=True)
+    os.makedirs('.cache', exist_ok=True)
+    
+    # Code that defines the schema; editing any of it forces a full init_db()
+    code = ''.join(inspect.getsource(f) for f in (init_db, etags.ensure_table, events.ensure_table,
+                                                jobs.ensure_table, payouts.ensure_table,
+                                                phash.ensure_table, uploads.ensure_table,
+                                                archive.ensure_table, earnings.ensure_table,
+                                                usersearch.ensure_table))
+    code_stamp = hashlib.sha256(code.encode()).hexdigest()[:16]
+    target = db_target()
+    
+    with open(SCHEMA_CACHE + '.lock', 'w') as lock:
+        if fcntl:
+            fcntl.flock(lock, fcntl.LOCK_EX)  # workers starting together check one at a time
+        try:
+            with open(SCHEMA_CACHE) as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            cached = {}
+        
+        db_type, fingerprint = _read_fingerprint()
+        if cached.get(target) == [code_stamp, fingerprint]:
+            print(f"✅ Schema unchanged ({db_type}), skipped init_db in {1000 * (time.perf_counter() - started):.1f}ms")
+            return False
+        
+        init_db()
+        db_type, fingerprint = _read_fingerprint()
+        cached[target] = [code_stamp, fingerprint]
+        with open(SCHEMA_CACHE, 'w') as f:
+            json.dump(cached, f)
+    print(f"✅ Schema verified ({db_type}) in {1000 * (time.perf_counter() - started):.1f}ms")
+    return True
+
+def release_connections():
+    """Close pooled connections in the gunicorn master before it forks workers"""
+    sqlite_pool.close_idle()
+    if postgres_pool:
+        postgres_pool.close()
+
+def after_fork():
+    """Start a forked worker with its own connections, SSE poller and forecast"""
+    sqlite_pool.reset()
+    if postgres_pool:
+        postgres_pool.reset()
+    events.broker.reset()
+    forecast.reset()
+
 def hash_password(password):
     return hashlib.sha256(password.encode()).hexdigest()
 
@@ -231,6 +431,7 @@ def index():
     return redirect(url_for('login'))
 
 @app.route('/register', methods=['GET', 'POST'])
+@limiter.limit('register', per_ip='5/600')
 def register():
     if request.method == 'POST':
         username = request.form['username']
@@ -242,10 +443,21 @@ def register():
             flash('Passwords do not match!', 'error')
             return redirect(url_for('register'))
         
+        # Most names are free: that's answered from memory, only a maybe-taken one costs a query
+        if availability.is_taken(get_db_connection, 'username', username):
+            flash('Username already taken!', 'error')
+            return redirect(url_for('register'))
+        if availability.is_taken(get_db_connection, 'email', email):
+            flash('Email already registered!', 'error')
+            return redirect(url_for('register'))
+        
         hashed_password = hash_password(password)
         
-        # Get referral code from URL if present
-        referral_code = request.args.get('ref', '').strip()
+        # Get referral code from URL if present (the form copies it into a hidden field)
+        referral_code = (request.args.get('ref') or request.form.get('ref') or '').strip()
+        if referral_code and not availability.exists(get_db_connection, 'ref', referral_code):
+            print(f"⚠️  Unknown referral code ignored: {referral_code}")
+            referral_code = ''
         
         try:
             conn, db_type = get_db_connection()
@@ -262,8 +474,10 @@ def register():
                     (username, email, hashed_password, referral_code if referral_code else None)
                 )
             
+            etags.bump_referrer(cursor, db_type, referral_code)
             conn.commit()
             conn.close()
+            availability.index.add(username=username, email=email)
             
             print(f"✅ User registered: {username}, {email}" + (f" (Referred by: {referral_code})" if referral_code else ""))
             flash('Registration successful! Please login. You received 100 Rs signup bonus!', 'success')
@@ -274,11 +488,24 @@ def register():
             flash('Username or email already exists!', 'error')
             return redirect(url_for('register'))
     
-    # For GET request, get referral code from URL
-    referral_code = request.args.get('ref', '')
-    return render_template('register.html', referral_code=referral_code)
+    # GET request - static form, served from the page cache
+    return page_cache.render('register.html')
+
+@app.route('/register/check')
+@limiter.limit('register_check', per_ip='60/60', methods=('GET',))
+def register_check():
+    """Live form validation: ?field=username|email|ref&value=..."""
+    field = request.args.get('field', '')
+    value = request.args.get('value', '').strip()
+    if field not in availability.FIELDS or not value:
+        return jsonify({'error': 'field must be username, email or ref, with a value'}), 400
+    if field == 'ref':
+        # Codes are made by UPDATE on any worker: exact lookup, never the filter
+        return jsonify({'field': field, 'valid': availability.exists(get_db_connection, field, value)})
+    return jsonify({'field': field, 'available': not availability.is_taken(get_db_connection, field, value)})
 
 @app.route('/login', methods=['GET', 'POST'])
+@limiter.limit('login', per_ip='10/60')
 def login():
     if request.method == 'POST':
         username = request.form['username']
@@ -312,14 +539,25 @@ def login():
             flash('Invalid username or password!', 'error')
             return redirect(url_for('login'))
     
-    return render_template('login.html')
+    return page_cache.render('login.html')
 
 @app.route('/invest', methods=['POST'])
+@limiter.limit('invest', per_ip='20/3600', per_user='10/3600')
 def invest():
     if 'username' not in session:
         flash('Please login first!', 'error')
         return redirect(url_for('login'))
     
+    # Parsing the form streams the screenshot to disk, rejecting junk early
+    try:
+        request.files
+    except uploads.UploadRejected as e:
+        flash(e.description, 'error')
+        return redirect(url_for('home'))
+    except RequestEntityTooLarge:
+        flash('Screenshot is larger than 5 MB!', 'error')
+        return redirect(url_for('home'))
+    
     # Get form data with validation
     plan_name = request.form.get('plan_name', '').strip()
     amount_str = request.form.get('amount', '').strip()
@@ -369,11 +607,18 @@ def invest():
     # Save screenshot
     screenshot_url = None
     try:
-        filename = secure_filename(f"{session['user_id']}_{int(datetime.now().timestamp())}_{screenshot.filename}")
+        upload = screenshot.stream
+        # Random part keeps two uploads in the same second (other threads/workers) apart;
+        # the extension comes from the detected image type, not the client's filename
+        stem = os.path.splitext(screenshot.filename)[0]
+        filename = secure_filename(f"{session['user_id']}_{int(datetime.now().timestamp())}_{uuid.uuid4().hex[:8]}_{stem}.{upload.kind or 'png'}")
         filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        screenshot.save(filepath)
+        upload_size = upload.commit(filepath)
         screenshot_url = f'/static/uploads/screenshots/{filename}'
-        print(f"✅ Screenshot saved: {filename}")
+        print(f"✅ Screenshot saved: {filename} ({upload.width}x{upload.height}, {upload_size // 1024} KB)")
+    except uploads.UploadRejected as e:
+        flash(e.description, 'error')
+        return redirect(url_for('home'))
     except Exception as e:
         print(f"❌ Error saving screenshot: {str(e)}")
         flash('Error uploading screenshot. Please try again.', 'error')
@@ -398,14 +643,32 @@ def invest():
                 INSERT INTO investments 
                 (user_id, plan_name, amount, daily_income, total_return, screenshot_url, status)
                 VALUES (%s, %s, %s, %s, %s, %s, %s)
+                RETURNING id
             ''', (session['user_id'], plan_name, amount, daily_income, total_return, screenshot_url, 'pending'))
+            investment_id = cursor.fetchone()['id']
         else:
             cursor.execute('''
                 INSERT INTO investments 
                 (user_id, plan_name, amount, daily_income, total_return, screenshot_url, status)
                 VALUES (?, ?, ?, ?, ?, ?, ?)
             ''', (session['user_id'], plan_name, amount, daily_income, total_return, screenshot_url, 'pending'))
+            investment_id = cursor.lastrowid
         
+        # Compared with every earlier screenshot by the job worker (flagged for the admin, never blocked)
+        if phash.AVAILABLE:
+            jobs.enqueue(cursor, db_type, 'phash.check', {
+                'investment_id': investment_id, 'user_id': session['user_id'], 'screenshot_url': screenshot_url,
+            })
+        uploads.record_usage(cursor, db_type, session['user_id'], upload_size)
+        
+        etags.bump(cursor, db_type, session['user_id'])
+        events.publish(cursor, db_type, 'investment.created', {
+            'id': investment_id, 'username': session['username'], 'plan_name': plan_name,
+            'amount': amount, 'daily_income': daily_income, 'whatsapp_number': whatsapp_number,
+            'screenshot_url': screenshot_url, 'screenshot_src': screenshots.signed_url(screenshot_url, 'admin'),
+            'status': 'pending',
+            'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        })
         conn.commit()
         conn.close()
         
@@ -415,11 +678,17 @@ def invest():
         
     except Exception as e:
         conn.close()
+        try:
+            os.remove(filepath)  # nothing references it now
+        except OSError:
+            pass
         print(f"❌ Investment error: {str(e)}")
         flash(f'Investment failed: {str(e)}', 'error')
         return redirect(url_for('home'))
 
 @app.route('/withdraw', methods=['GET', 'POST'])
+@limiter.limit('withdraw', per_ip='20/3600', per_user='5/3600')
+@etags.conditional('withdraw', get_db_connection)
 def withdraw():
     if 'username' not in session:
         flash('Please login first!', 'error')
@@ -477,7 +746,9 @@ def withdraw():
                 cursor.execute('''
                     INSERT INTO withdrawals (user_id, amount, payment_method, account_number, status)
                     VALUES (%s, %s, %s, %s, %s)
+                    RETURNING id
                 ''', (session['user_id'], amount, payment_method, account_number, 'pending'))
+                withdrawal_id = cursor.fetchone()['id']
                 
                 cursor.execute('''
                     UPDATE users SET balance = balance - %s WHERE id = %s
@@ -494,6 +765,7 @@ def withdraw():
                     INSERT INTO withdrawals (user_id, amount, payment_method, account_number, status)
                     VALUES (?, ?, ?, ?, ?)
                 ''', (session['user_id'], amount, payment_method, account_number, 'pending'))
+                withdrawal_id = cursor.lastrowid
                 
                 cursor.execute('UPDATE users SET balance = balance - ? WHERE id = ?', 
                              (amount, session['user_id']))
@@ -505,7 +777,14 @@ def withdraw():
                     cursor.execute('UPDATE users SET jazzcash_number = ? WHERE id = ?', 
                                  (account_number, session['user_id']))
             
+            etags.bump(cursor, db_type, session['user_id'])
+            events.publish(cursor, db_type, 'withdrawal.created', {
+                'id': withdrawal_id, 'username': session['username'], 'amount': amount,
+                'payment_method': payment_method, 'account_number': account_number, 'status': 'pending',
+                'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            })
             conn.commit()
+            forecast.on_withdrawals_changed(cursor)
             conn.close()
             
             print(f"✅ Withdrawal request: Rs {amount} via {payment_method} by {session['username']}")
@@ -543,6 +822,7 @@ def withdraw():
                          jazzcash=jazzcash)
 
 @app.route('/dashboard')
+@etags.conditional('dashboard', get_db_connection)
 def dashboard():
     if 'username' not in session:
         flash('Please login first!', 'error')
@@ -560,16 +840,18 @@ def dashboard():
     user = cursor.fetchone()
     balance = float(user['balance'] if isinstance(user, dict) else user[0])
     
-    # Get all investments for this user
+    # Get all investments for this user (closed ones from the archive too with ?history=1)
+    history = request.args.get('history') == '1'
+    investments_from = archive.source(conn, db_type, 'investments') if history else 'investments'
     if db_type == 'postgres':
-        cursor.execute('''
-            SELECT * FROM investments 
+        cursor.execute(f'''
+            SELECT * FROM {investments_from} investments 
             WHERE user_id = %s
             ORDER BY created_at DESC
         ''', (session['user_id'],))
     else:
-        cursor.execute('''
-            SELECT * FROM investments 
+        cursor.execute(f'''
+            SELECT * FROM {investments_from} investments 
             WHERE user_id = ?
             ORDER BY created_at DESC
         ''', (session['user_id'],))
@@ -623,16 +905,18 @@ def dashboard():
                          total_invested=round(total_invested, 2),
                          total_daily_income=round(total_daily_income, 2),
                          total_earned=round(total_earned, 2),
-                         investments=investments)
+                         investments=investments,
+                         history=history)
 
 @app.route('/home')
 def home():
     if 'username' not in session:
         flash('Please login first!', 'error')
         return redirect(url_for('login'))
-    return render_template('index.html', username=session['username'])
+    return page_cache.render('index.html', username=session['username'])
 
 @app.route('/referral')
+@etags.conditional('referral', get_db_connection)
 def referral():
     if 'username' not in session:
         flash('Please login first!', 'error')
@@ -677,6 +961,7 @@ def referral():
         else:
             cursor.execute('UPDATE users SET referral_code = ? WHERE id = ?', 
                          (referral_code, session['user_id']))
+        etags.bump(cursor, db_type, session['user_id'])
         conn.commit()
     
     # Get referral stats
@@ -743,6 +1028,7 @@ ADMIN_USERNAME = os.environ.get('ADMIN_USERNAME', 'admin')
 ADMIN_PASSWORD = os.environ.get('ADMIN_PASSWORD', 'admin123')
 
 @app.route('/admin/login', methods=['GET', 'POST'])
+@limiter.limit('admin_login', per_ip='5/300')
 def admin_login():
     if request.method == 'POST':
         username = request.form.get('username')
@@ -767,42 +1053,54 @@ def admin_panel():
     conn, db_type = get_db_connection()
     cursor = conn.cursor()
     
-    # Get pending investments with user info
+    # Get pending investments with user info (archived ones too with ?history=1)
+    history = request.args.get('history') == '1'
+    investments_from = archive.source(conn, db_type, 'investments') if history else 'investments'
+    withdrawals_from = archive.source(conn, db_type, 'withdrawals') if history else 'withdrawals'
     if db_type == 'postgres':
-        cursor.execute('''
-            SELECT i.*, u.username, u.whatsapp_number 
-            FROM investments i
+        cursor.execute(f'''
+            SELECT i.*, u.username, u.whatsapp_number,
+                   sh.duplicate_of, sh.distance AS duplicate_distance, du.username AS duplicate_username
+            FROM {investments_from} i
             JOIN users u ON i.user_id = u.id
+            LEFT JOIN screenshot_hashes sh ON sh.investment_id = i.id
+            LEFT JOIN users du ON du.id = sh.duplicate_user_id
             ORDER BY i.created_at DESC
         ''')
     else:
-        cursor.execute('''
-            SELECT i.*, u.username, u.whatsapp_number 
-            FROM investments i
+        cursor.execute(f'''
+            SELECT i.*, u.username, u.whatsapp_number,
+                   sh.duplicate_of, sh.distance AS duplicate_distance, du.username AS duplicate_username
+            FROM {investments_from} i
             JOIN users u ON i.user_id = u.id
+            LEFT JOIN screenshot_hashes sh ON sh.investment_id = i.id
+            LEFT JOIN users du ON du.id = sh.duplicate_user_id
             ORDER BY i.created_at DESC
         ''')
     investments = cursor.fetchall()
     
     # Get pending withdrawals with user info
     if db_type == 'postgres':
-        cursor.execute('''
+        cursor.execute(f'''
             SELECT w.*, u.username 
-            FROM withdrawals w
+            FROM {withdrawals_from} w
             JOIN users u ON w.user_id = u.id
             ORDER BY w.created_at DESC
         ''')
     else:
-        cursor.execute('''
+        cursor.execute(f'''
             SELECT w.*, u.username 
-            FROM withdrawals w
+            FROM {withdrawals_from} w
             JOIN users u ON w.user_id = u.id
             ORDER BY w.created_at DESC
         ''')
     withdrawals = cursor.fetchall()
     
-    # Get all users
-    cursor.execute('SELECT * FROM users ORDER BY created_at DESC')
+    # Newest users only; the rest are found through the search box (usersearch.py)
+    cursor.execute('''
+        SELECT id, username, email, balance, whatsapp_number, easypaisa_number, jazzcash_number, created_at
+        FROM users ORDER BY created_at DESC LIMIT 200
+    ''')
     users = cursor.fetchall()
     
     # Get stats
@@ -824,6 +1122,8 @@ def admin_panel():
     
     conn.close()
     
+    liability = forecast.get_forecast(get_db_connection).summary()
+    
     # Format data for template
     investments_list = []
     for inv in investments:
@@ -843,7 +1143,10 @@ def admin_panel():
                 'status': inv[9],
                 'created_at': inv[10],
                 'username': inv[12],
-                'whatsapp_number': inv[13] if len(inv) > 13 else None
+                'whatsapp_number': inv[13] if len(inv) > 13 else None,
+                'duplicate_of': inv['duplicate_of'],
+                'duplicate_distance': inv['duplicate_distance'],
+                'duplicate_username': inv['duplicate_username']
             })
     
     withdrawals_list = []
@@ -862,19 +1165,7 @@ def admin_panel():
                 'username': wd[8]
             })
     
-    users_list = []
-    for user in users:
-        if isinstance(user, dict):
-            users_list.append(dict(user))
-        else:
-            users_list.append({
-                'id': user[0],
-                'username': user[1],
-                'email': user[2],
-                'balance': user[4],
-                'whatsapp_number': user[5] if len(user) > 5 else None,
-                'created_at': user[8] if len(user) > 8 else user[7]
-            })
+    users_list = [dict(user) for user in users]
     
     return render_template('admin.html',
                          investments=investments_list,
@@ -883,7 +1174,9 @@ def admin_panel():
                          pending_investments_count=pending_investments_count,
                          pending_withdrawals_count=pending_withdrawals_count,
                          total_users=total_users,
-                         total_invested=total_invested)
+                         total_invested=total_invested,
+                         liability=liability,
+                         history=history)
 
 @app.route('/admin/approve-investment/<int:investment_id>', methods=['POST'])
 def approve_investment(investment_id):
@@ -909,7 +1202,10 @@ def approve_investment(investment_id):
                 WHERE id = ?
             ''', ('active', investment_id))
         
+        etags.bump_owner(cursor, db_type, 'investments', investment_id)
+        events.publish(cursor, db_type, 'investment.status', {'id': investment_id, 'status': 'active'})
         conn.commit()
+        forecast.on_investment_approved(cursor, db_type, investment_id)
         conn.close()
         
         flash('Investment approved successfully!', 'success')
@@ -946,7 +1242,10 @@ def reject_investment(investment_id):
                 WHERE id = ?
             ''', ('rejected', investment_id))
         
+        etags.bump_owner(cursor, db_type, 'investments', investment_id)
+        events.publish(cursor, db_type, 'investment.status', {'id': investment_id, 'status': 'rejected'})
         conn.commit()
+        forecast.on_investment_completed(investment_id)
         conn.close()
         
         flash('Investment rejected!', 'success')
@@ -982,7 +1281,11 @@ def approve_withdrawal(withdrawal_id):
                 WHERE id = ?
             ''', ('approved', withdrawal_id))
         
+        payouts.add_withdrawal(cursor, db_type, withdrawal_id)
+        etags.bump_owner(cursor, db_type, 'withdrawals', withdrawal_id)
+        events.publish(cursor, db_type, 'withdrawal.status', {'id': withdrawal_id, 'status': 'approved'})
         conn.commit()
+        forecast.on_withdrawals_changed(cursor)
         conn.close()
         
         flash('Withdrawal approved successfully!', 'success')
@@ -1019,12 +1322,17 @@ def reject_withdrawal(withdrawal_id):
             # Refund balance
             if db_type == 'postgres':
                 cursor.execute('UPDATE users SET balance = balance + %s WHERE id = %s', (amount, user_id))
-                cursor.execute('UPDATE withdrawals SET status = %s WHERE id = %s', ('rejected', withdrawal_id))
+                cursor.execute('UPDATE withdrawals SET status = %s, processed_at = CURRENT_TIMESTAMP WHERE id = %s',
+                               ('rejected', withdrawal_id))
             else:
                 cursor.execute('UPDATE users SET balance = balance + ? WHERE id = ?', (amount, user_id))
-                cursor.execute('UPDATE withdrawals SET status = ? WHERE id = ?', ('rejected', withdrawal_id))
+                cursor.execute('UPDATE withdrawals SET status = ?, processed_at = CURRENT_TIMESTAMP WHERE id = ?',
+                               ('rejected', withdrawal_id))
             
+            etags.bump(cursor, db_type, user_id)
+            events.publish(cursor, db_type, 'withdrawal.status', {'id': withdrawal_id, 'status': 'rejected'})
             conn.commit()
+            forecast.on_withdrawals_changed(cursor)
             flash(f'Withdrawal rejected! Rs {amount} refunded to user balance.', 'success')
             print(f"❌ Withdrawal #{withdrawal_id} rejected, Rs {amount} refunded")
         
@@ -1042,6 +1350,98 @@ def admin_logout():
     flash('Admin logged out successfully!', 'success')
     return redirect(url_for('admin_login'))
 
+@app.route('/admin/export/<table>')
+def admin_export(table):
+    if 'admin' not in session:
+        flash('Please login as admin first!', 'error')
+        return redirect(url_for('admin_login'))
+    
+    fmt = request.args.get('format', 'csv')
+    if table not in exports.TABLES or fmt not in exports.FORMATS:
+        flash('Unknown export requested!', 'error')
+        return redirect(url_for('admin_panel'))
+    
+    filters = exports.filters_from(request.args, table)
+    filename = f"{table}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{fmt}"
+    print(f"📤 Export started: {table} ({fmt}) filters={filters}")
+    
+    # Generator response: rows are fetched and sent chunk by chunk
+    return Response(exports.stream_export(get_db_connection, table, fmt, filters),
+                    mimetype=exports.FORMATS[fmt],
+                    headers={'Content-Disposition': f'attachment; filename={filename}',
+                             'X-Accel-Buffering': 'no'})
+
+@app.route('/admin/events')
+def admin_events():
+    if 'admin' not in session:
+        return Response('Unauthorized', status=401)
+    
+    # One long-lived stream per open admin tab; the browser reconnects
+    # with Last-Event-ID when it ends, so nothing is missed in between
+    return Response(events.broker.stream(request.headers.get('Last-Event-ID')),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache',
+                             'X-Accel-Buffering': 'no'})
+
+@app.route('/admin/compression-stats')
+def compression_stats():
+    if 'admin' not in session:
+        return jsonify({'error': 'unauthorized'}), 401
+    # Per worker process: each gunicorn worker keeps its own counters
+    return jsonify({
+        'pid': os.getpid(),
+        'level': compressor.level,
+        'min_size': compressor.min_size,
+        'brotli': compression.BROTLI_AVAILABLE,
+        'endpoints': compressor.stats.snapshot(),
+    })
+
+@app.route('/admin/load-stats')
+def load_stats():
+    if 'admin' not in session:
+        return jsonify({'error': 'unauthorized'}), 401
+    # Per worker process, like compression-stats
+    return jsonify({
+        'pid': os.getpid(),
+        'rate_limits': ratelimit.ENABLED,
+        'rate_limited': limiter.limited,
+        'inflight': shedder.inflight,
+        'shed': shedder.shed,
+        'db_pool_wait': round(postgres_pool.recent_wait(), 4) if postgres_pool else None,
+    })
+
+@app.route('/admin/job-stats')
+def job_stats():
+    if 'admin' not in session:
+        return jsonify({'error': 'unauthorized'}), 401
+    return jsonify({'jobs': jobs.stats(get_db_connection)})
+
+@app.route('/admin/payouts')
+def admin_payouts():
+    if 'admin' not in session:
+        return jsonify({'error': 'unauthorized'}), 401
+    conn, db_type = get_db_connection()
+    try:
+        return jsonify(payouts.summary(conn.cursor(), db_type))
+    finally:
+        conn.close()
+
+@app.route('/admin/payouts/retry/<int:item_id>', methods=['POST'])
+def retry_payout(item_id):
+    if 'admin' not in session:
+        flash('Unauthorized access!', 'error')
+        return redirect(url_for('admin_login'))
+    
+    conn, db_type = get_db_connection()
+    cursor = conn.cursor()
+    if payouts.retry_item(cursor, db_type, item_id):
+        conn.commit()
+        flash(f'Payout #{item_id} will be sent again in the next batch.', 'success')
+    else:
+        flash(f'Payout #{item_id} is not in a failed state!', 'error')
+    conn.close()
+    return redirect(url_for('admin_panel'))
+
 # Debug route (remove in production)
 @app.route('/debug-db')
 def debug_db():
@@ -1122,7 +1522,7 @@ if __name__ == '__main__':
         os.makedirs('database', exist_ok=True)
     os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
-    init_db()
+    ensure_schema()
 
     # Use PORT for local run
     port = int(os.environ.get('PORT', 5000))
@@ -0,0 +1,306 @@
+"""
+Archive - move closed investments, processed withdrawals and old earnings
+out of the live tables
+
+    python archive.py run [--dry-run]   # archive everything eligible now
+    python archive.py status            # live vs archived row counts
+
+Rows older than ARCHIVE_AFTER_DAYS that can no longer change are moved:
+
+    investments      completed / rejected, no earnings left in daily_earnings
+    withdrawals      approved / rejected, no payout still pending
+    daily_earnings   earned_date before the cutoff
+
+Postgres: into <table>_archive, range-partitioned by month (partitions
+are created as rows for a new month arrive, plus a default one for NULL
+dates). Each chunk is one DELETE ... RETURNING feeding an INSERT, so a
+row is always in exactly one place. Foreign keys pointing at archived
+tables are dropped, since a row may now live in either table.
+
+SQLite: into the same tables in an attached database file (ARCHIVE_DB,
+default database/archive.db). Each chunk is INSERT OR IGNORE + DELETE in
+one transaction, so a chunk cut short by a crash is finished next run.
+
+Chunks of ARCHIVE_BATCH_SIZE rows commit one at a time; stopping halfway
+loses nothing, the next run carries on. The 'archive.run' job runs daily.
+
+Live pages read only the hot tables. dashboard() and admin_panel() with
+?history=1, the rollups and the exports read source(table) instead: the
+live table UNION ALL its archive.
+
+Env: ARCHIVE_AFTER_DAYS (default 90), ARCHIVE_BATCH_SIZE (default 1000),
+ARCHIVE_DB (SQLite only), ARCHIVE_INTERVAL (seconds, default 86400)
+"""
+
+import os
+import sys
+from datetime import date, datetime, timedelta
+
+import etags
+import jobs
+from db_pool import sql
+
+AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS', 90))
+BATCH_SIZE = int(os.environ.get('ARCHIVE_BATCH_SIZE', 1000))
+ARCHIVE_DB = os.environ.get('ARCHIVE_DB', os.path.join('database', 'archive.db'))
+ARCHIVE_INTERVAL = int(os.environ.get('ARCHIVE_INTERVAL', 86400))
+
+# table -> (partition / age column, what makes a row archivable; cutoff is the one parameter)
+TABLES = {
+    'daily_earnings': ('earned_date', 'earned_date < ?'),
+    'withdrawals': ('created_at', '''
+        status IN ('approved', 'rejected') AND COALESCE(processed_at, created_at) < ?
+        AND NOT EXISTS (SELECT 1 FROM payout_items p WHERE p.withdrawal_id = withdrawals.id AND p.status = 'pending')
+    '''),
+    'investments': ('created_at', '''
+        status IN ('completed', 'rejected') AND created_at < ?
+        AND NOT EXISTS (SELECT 1 FROM daily_earnings de WHERE de.investment_id = investments.id)
+    '''),
+}
+# Foreign keys into archived tables (a referenced row may have moved)
+FOREIGN_KEYS = (
+    ('daily_earnings', 'daily_earnings_investment_id_fkey'),
+    ('payout_items', 'payout_items_withdrawal_id_fkey'),
+    ('screenshot_hashes', 'screenshot_hashes_investment_id_fkey'),
+)
+
+_columns = {}
+
+
+def _connection():
+    from app import get_db_connection
+    return get_db_connection()
+
+
+def ensure_table(cursor, db_type):
+    if db_type != 'postgres':
+        return  # SQLite archive tables are created in the attached file on first use
+    for table, (key, _) in TABLES.items():
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS {table}_archive (LIKE {table}) PARTITION BY RANGE ({key})
+        ''')
+        cursor.execute(f'CREATE TABLE IF NOT EXISTS {table}_archive_default PARTITION OF {table}_archive DEFAULT')
+        _add_missing_columns(cursor, db_type, table)
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_investments_archive_user ON investments_archive (user_id, created_at)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_investments_archive_id ON investments_archive (id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_withdrawals_archive_user ON withdrawals_archive (user_id, created_at)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_withdrawals_archive_id ON withdrawals_archive (id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_daily_earnings_archive_user ON daily_earnings_archive (user_id, earned_date)')
+    for table, constraint in FOREIGN_KEYS:
+        cursor.execute(f'ALTER TABLE IF EXISTS {table} DROP CONSTRAINT IF EXISTS {constraint}')
+
+
+def _add_missing_columns(cursor, db_type, table):
+    """Columns added to a live table later get added to its archive too"""
+    if db_type == 'postgres':
+        cursor.execute('''
+            SELECT a.attname AS name, format_type(a.atttypid, a.atttypmod) AS type
+            FROM pg_attribute a
+            WHERE a.attrelid = %s::regclass AND a.attnum > 0 AND NOT a.attisdropped
+              AND a.attname NOT IN (SELECT attname FROM pg_attribute
+                                    WHERE attrelid = %s::regclass AND attnum > 0 AND NOT attisdropped)
+            ORDER BY a.attnum
+        ''', (table, f'{table}_archive'))
+        for row in cursor.fetchall():
+            cursor.execute(f'ALTER TABLE {table}_archive ADD COLUMN {row["name"]} {row["type"]}')
+        return
+    cursor.execute(f'PRAGMA main.table_info({table})')
+    live = [(row[1], row[2]) for row in cursor.fetchall()]
+    cursor.execute(f'PRAGMA archive.table_info({table})')
+    archived = {row[1] for row in cursor.fetchall()}
+    if not archived:
+        columns = ', '.join(f'{name} {kind}' for name, kind in live)
+        cursor.execute(f'CREATE TABLE archive.{table} ({columns}, PRIMARY KEY (id))')
+        if table == 'daily_earnings':
+            cursor.execute('CREATE INDEX IF NOT EXISTS archive.idx_daily_earnings_user ON daily_earnings (user_id, earned_date)')
+        else:
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS archive.idx_{table}_user ON {table} (user_id, created_at)')
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS archive.idx_{table}_created_at ON {table} (created_at)')
+        if table == 'investments':
+            cursor.execute('CREATE INDEX IF NOT EXISTS archive.idx_investments_approved_at ON investments (approved_at)')
+        if table == 'withdrawals':
+            cursor.execute('CREATE INDEX IF NOT EXISTS archive.idx_withdrawals_processed_at ON withdrawals (processed_at)')
+        return
+    for name, kind in live:
+        if name not in archived:
+            cursor.execute(f'ALTER TABLE archive.{table} ADD COLUMN {name} {kind}')
+
+
+def attach(conn, create=False):
+    """Attach the SQLite archive file to this connection; False if there's none yet"""
+    cursor = conn.cursor()
+    cursor.execute('PRAGMA database_list')
+    if any(row[1] == 'archive' for row in cursor.fetchall()):
+        return True
+    if not create and not os.path.exists(ARCHIVE_DB):
+        return False
+    cursor.execute('ATTACH DATABASE ? AS archive', (ARCHIVE_DB,))
+    if create:
+        for table in TABLES:
+            _add_missing_columns(cursor, 'sqlite', table)
+    return True
+
+
+def _archive_table(db_type, table):
+    return f'{table}_archive' if db_type == 'postgres' else f'archive.{table}'
+
+
+def columns(conn, db_type, table):
+    """Live column names, in table order (cached per process)"""
+    if (db_type, table) not in _columns:
+        cursor = conn.cursor()
+        cursor.execute(f'SELECT * FROM {table} WHERE 1 = 0')
+        _columns[db_type, table] = [d[0] for d in cursor.description]
+    return _columns[db_type, table]
+
+
+def archived(conn, db_type, table):
+    """Name of `table`'s archive table, or None while there is none"""
+    if db_type == 'postgres':
+        cursor = conn.cursor()
+        cursor.execute('SELECT to_regclass(%s) AS archive', (f'{table}_archive',))
+        if cursor.fetchone()['archive'] is None:
+            return None
+    elif not attach(conn):
+        return None
+    return _archive_table(db_type, table)
+
+
+def source(conn, db_type, table):
+    """FROM-clause text for live + archived rows of `table` (alias it at the call site)"""
+    archive_table = archived(conn, db_type, table)
+    if archive_table is None:
+        return table
+    cols = ', '.join(columns(conn, db_type, table))
+    return f'(SELECT {cols} FROM {table} UNION ALL SELECT {cols} FROM {archive_table})'
+
+
+def _month(value):
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        value = value.date()
+    if not isinstance(value, date):
+        value = date.fromisoformat(str(value)[:10])
+    return value.replace(day=1)
+
+
+def ensure_partitions(cursor, table, keys):
+    """Create the monthly partitions of <table>_archive rows with these keys go to"""
+    for start in sorted({_month(key) for key in keys} - {None}):
+        end = (start + timedelta(days=32)).replace(day=1)
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS {table}_archive_{start:%Y_%m} PARTITION OF {table}_archive
+            FOR VALUES FROM ('{start}') TO ('{end}')
+        ''')
+
+
+def _move_chunk(conn, db_type, table, cutoff, batch_size):
+    """Move one chunk; returns the number of rows moved"""
+    key, condition = TABLES[table]
+    cursor = conn.cursor()
+    lock = ' FOR UPDATE SKIP LOCKED' if db_type == 'postgres' else ''
+    cursor.execute(sql(db_type, f'''
+        SELECT id, user_id, {key} AS archive_key FROM {table} WHERE {condition} ORDER BY id LIMIT ?{lock}
+    '''), (cutoff, batch_size))
+    rows = cursor.fetchall()
+    if not rows:
+        conn.rollback()
+        return 0
+    ids = [row['id'] for row in rows]
+    cols = ', '.join(columns(conn, db_type, table))
+
+    if db_type == 'postgres':
+        ensure_partitions(cursor, table, [row['archive_key'] for row in rows])
+        cursor.execute(f'''
+            WITH moved AS (DELETE FROM {table} WHERE id = ANY(%s) RETURNING {cols})
+            INSERT INTO {table}_archive ({cols}) SELECT {cols} FROM moved
+        ''', (ids,))
+    else:
+        placeholders = ', '.join('?' for _ in ids)
+        cursor.execute(f'INSERT OR IGNORE INTO archive.{table} ({cols}) '
+                       f'SELECT {cols} FROM main.{table} WHERE id IN ({placeholders})', ids)
+        cursor.execute(f'DELETE FROM main.{table} WHERE id IN ({placeholders})', ids)
+
+    # Archived rows drop off the owners' live pages
+    if table != 'daily_earnings':
+        for user_id in {row['user_id'] for row in rows if row['user_id'] is not None}:
+            etags.bump(cursor, db_type, user_id)
+    conn.commit()
+    return len(ids)
+
+
+def eligible(conn, db_type, table, cutoff):
+    key, condition = TABLES[table]
+    cursor = conn.cursor()
+    cursor.execute(sql(db_type, f'SELECT COUNT(*) AS n FROM {table} WHERE {condition}'), (cutoff,))
+    return cursor.fetchone()['n']
+
+
+def run(conn, db_type, after_days=AFTER_DAYS, batch_size=BATCH_SIZE, dry_run=False):
+    """Archive everything eligible, table by table; returns {table: rows}"""
+    cutoff = (date.today() - timedelta(days=after_days)).isoformat()
+    if db_type != 'postgres':
+        attach(conn, create=True)
+    moved = {}
+    for table in TABLES:  # earnings first: they hold investments back
+        if dry_run:
+            moved[table] = eligible(conn, db_type, table, cutoff)
+            continue
+        moved[table] = 0
+        while True:
+            count = _move_chunk(conn, db_type, table, cutoff, batch_size)
+            moved[table] += count
+            if count < batch_size:
+                break
+    return moved
+
+
+def status(conn, db_type):
+    counts = {}
+    archived = db_type == 'postgres' or attach(conn)
+    cursor = conn.cursor()
+    for table in TABLES:
+        cursor.execute(f'SELECT COUNT(*) AS n FROM {table}')
+        live = cursor.fetchone()['n']
+        old = 0
+        if archived:
+            cursor.execute(f'SELECT COUNT(*) AS n FROM {_archive_table(db_type, table)}')
+            old = cursor.fetchone()['n']
+        counts[table] = (live, old)
+    return counts
+
+
+@jobs.periodic('archive.run', every=ARCHIVE_INTERVAL, max_attempts=1)
+def archive_job(payload):
+    conn, db_type = _connection()
+    try:
+        moved = run(conn, db_type)
+    finally:
+        conn.close()
+    if any(moved.values()):
+        print("✅ Archived " + ", ".join(f"{count} {table}" for table, count in moved.items()))
+
+
+def main():
+    command = sys.argv[1] if len(sys.argv) > 1 else 'status'
+    import app
+    app.ensure_schema()
+    conn, db_type = app.get_db_connection()
+    try:
+        if command == 'run':
+            dry_run = '--dry-run' in sys.argv
+            moved = run(conn, db_type, dry_run=dry_run)
+            verb = 'Would archive' if dry_run else 'Archived'
+            print(f"✅ {verb} " + ", ".join(f"{count} {table}" for table, count in moved.items()))
+        elif command == 'status':
+            for table, (live, old) in status(conn, db_type).items():
+                print(f"{table:<15} live {live:>10}  archived {old:>10}")
+        else:
+            raise SystemExit("usage: python archive.py run [--dry-run] | status")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
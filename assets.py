@@ -0,0 +1,166 @@
+"""
+Static Assets - fingerprinted, minified, precompressed CSS/JS
+
+Build (run once per deploy, before gunicorn starts):
+    python assets.py
+
+For every file under static/css and static/js this writes
+static/dist/<dir>/<name>.<hash>.<ext> plus .gz (and .br when the brotli
+package is installed) next to it, and static/dist/manifest.json mapping
+the original name to the hashed one.
+
+At runtime init_app() makes url_for('static', filename='css/custom.css')
+resolve to the hashed file, and /static/dist/ is served with one-year
+immutable caching, picking the best precompressed variant the client
+accepts. Nothing is compressed per request.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+
+from flask import abort, request, send_from_directory
+
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+
+STATIC_FOLDER = 'static'
+DIST_DIR = 'dist'
+SOURCE_DIRS = ('css', 'js')
+MANIFEST = 'manifest.json'
+CACHE_MAX_AGE = 365 * 24 * 3600
+
+# Preferred order when the client accepts several encodings
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def minify_css(text):
+    text = re.sub(r'/\*.*?\*/', '', text, flags=re.S)
+    text = re.sub(r'\s+', ' ', text)
+    text = re.sub(r'\s*([{};,>])\s*', r'\1', text)
+    text = re.sub(r':\s+', ':', text)
+    return text.replace(';}', '}').strip()
+
+
+def minify_js(text):
+    """Conservative: drop whole-line // comments, indentation and blank lines.
+
+    Statements are never joined, so automatic semicolon insertion and
+    string contents are left exactly as written.
+    """
+    lines = []
+    for line in text.splitlines():
+        stripped = line.strip()
+        if not stripped or stripped.startswith('//'):
+            continue
+        lines.append(stripped)
+    return '\n'.join(lines) + '\n'
+
+
+MINIFIERS = {
+    '.css': minify_css,
+    '.js': minify_js,
+}
+
+
+def _write_variants(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+    with open(path + '.gz', 'wb') as f:
+        # mtime=0 keeps the output byte-identical between builds
+        f.write(gzip.compress(data, compresslevel=9, mtime=0))
+    if BROTLI_AVAILABLE:
+        with open(path + '.br', 'wb') as f:
+            f.write(brotli.compress(data, quality=11))
+
+
+def build(static_folder=STATIC_FOLDER):
+    """Minify, fingerprint and precompress every source asset; returns the manifest"""
+    dist = os.path.join(static_folder, DIST_DIR)
+    shutil.rmtree(dist, ignore_errors=True)
+    manifest = {}
+
+    for source_dir in SOURCE_DIRS:
+        root = os.path.join(static_folder, source_dir)
+        for dirpath, _, filenames in os.walk(root):
+            for filename in sorted(filenames):
+                name, ext = os.path.splitext(filename)
+                minify = MINIFIERS.get(ext)
+                if minify is None:
+                    continue
+
+                source = os.path.join(dirpath, filename)
+                logical = os.path.relpath(source, static_folder).replace(os.sep, '/')
+                with open(source, encoding='utf-8') as f:
+                    data = minify(f.read()).encode('utf-8')
+
+                digest = hashlib.sha256(data).hexdigest()[:12]
+                hashed = f"{os.path.splitext(logical)[0]}.{digest}{ext}"
+                target = os.path.join(dist, hashed)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                _write_variants(target, data)
+
+                manifest[logical] = f"{DIST_DIR}/{hashed}"
+                print(f"✅ {logical} -> {manifest[logical]} ({os.path.getsize(source)} -> {len(data)} bytes)")
+
+    with open(os.path.join(dist, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    if not BROTLI_AVAILABLE:
+        print("⚠️  brotli not installed - only gzip variants were written")
+    return manifest
+
+
+def load_manifest(static_folder):
+    try:
+        with open(os.path.join(static_folder, DIST_DIR, MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _pick_variant(directory, filename):
+    """Best precompressed file for this request's Accept-Encoding, or the plain file"""
+    accepted = request.accept_encodings
+    for encoding, suffix in ENCODINGS:
+        if accepted[encoding] and os.path.isfile(os.path.join(directory, filename + suffix)):
+            return filename + suffix, encoding
+    return filename, None
+
+
+def init_app(app):
+    """Rewrite static URLs to fingerprinted files and serve them with far-future caching"""
+    manifest = load_manifest(app.static_folder)
+    dist_folder = os.path.join(app.static_folder, DIST_DIR)
+    if manifest:
+        print(f"✅ Static manifest loaded: {len(manifest)} fingerprinted asset(s)")
+
+    @app.url_defaults
+    def fingerprint_static_urls(endpoint, values):
+        if endpoint == 'static' and values.get('filename') in manifest:
+            values['filename'] = manifest[values['filename']]
+
+    @app.route('/static/dist/<path:filename>')
+    def static_dist(filename):
+        if filename.endswith(('.gz', '.br')) or filename == MANIFEST:
+            abort(404)
+        served, encoding = _pick_variant(dist_folder, filename)
+        mimetype = 'text/css' if filename.endswith('.css') else (
+            'application/javascript' if filename.endswith('.js') else None)
+        response = send_from_directory(dist_folder, served, mimetype=mimetype, max_age=CACHE_MAX_AGE)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        response.headers['Cache-Control'] = f'public, max-age={CACHE_MAX_AGE}, immutable'
+        response.vary.add('Accept-Encoding')
+        return response
+
+    return manifest
+
+
+if __name__ == "__main__":
+    build()
@@ -0,0 +1,213 @@
+"""
+Availability - is a username / email taken, usually without a query
+
+One Bloom filter per field, in NumPy bit arrays, built from a single
+streaming scan of users on first use in each worker:
+
+- not in the filter: definitely free - answered from memory, the common
+  case while someone types
+- in the filter: maybe taken (AVAILABILITY_FP_RATE false positives), so
+  one indexed lookup confirms it
+
+register() adds what it writes. Other workers' writes arrive by a
+catch-up scan of ids above the last one seen (at most every
+AVAILABILITY_REFRESH seconds), and a full rebuild every
+AVAILABILITY_REBUILD seconds resizes the filters as users grow. A
+username or email shown as free can still be taken a moment later, so
+the UNIQUE constraint stays the final check in register().
+
+Referral codes are always looked up exactly (exists()): they are set by
+UPDATE in referral(), which a catch-up by id never sees, and a link is
+usually opened seconds after its code was made.
+
+Env: AVAILABILITY_FP_RATE (default 0.001), AVAILABILITY_REFRESH (seconds,
+default 5), AVAILABILITY_REBUILD (seconds, default 900)
+"""
+
+import hashlib
+import math
+import os
+import threading
+import time
+
+import numpy as np
+
+from db_pool import sql
+
+FP_RATE = float(os.environ.get('AVAILABILITY_FP_RATE', 0.001))
+REFRESH_SECONDS = float(os.environ.get('AVAILABILITY_REFRESH', 5))
+REBUILD_SECONDS = float(os.environ.get('AVAILABILITY_REBUILD', 900))
+MIN_CAPACITY = 100_000
+SCAN_CHUNK = 10_000
+
+# field -> users column
+FIELDS = {'username': 'username', 'email': 'email', 'ref': 'referral_code'}
+FILTERED = ('username', 'email')
+
+_MASK64 = (1 << 64) - 1
+
+
+def _digests(values):
+    """Two 64-bit hashes per value (double hashing gives the k positions)"""
+    raw = b''.join(hashlib.blake2b(v.encode(), digest_size=16).digest() for v in values)
+    return np.frombuffer(raw, dtype='<u8').reshape(-1, 2)
+
+
+class BloomFilter:
+    def __init__(self, capacity, fp_rate=FP_RATE):
+        self.capacity = capacity
+        self.size = max(64, math.ceil(-capacity * math.log(fp_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = np.zeros((self.size + 7) // 8, dtype=np.uint8)
+        self.count = 0
+
+    def add_many(self, values):
+        values = [v for v in values if v]
+        if not values:
+            return
+        h = _digests(values)
+        steps = np.arange(self.hashes, dtype=np.uint64)
+        positions = np.unique(((h[:, :1] + steps * h[:, 1:]) % np.uint64(self.size)).ravel())
+        # positions are unique, so summing the bit masks per byte equals OR-ing them
+        masks = np.left_shift(1, (positions & np.uint64(7)).astype(np.int64))
+        self.bits |= np.bincount((positions >> np.uint64(3)).astype(np.int64), weights=masks,
+                                 minlength=len(self.bits)).astype(np.uint8)
+        self.count += len(values)
+
+    def add(self, value):
+        self.add_many([value])
+
+    def __contains__(self, value):
+        if not value:
+            return False
+        h1, h2 = (int(x) for x in _digests([value])[0])
+        for i in range(self.hashes):
+            position = ((h1 + i * h2) & _MASK64) % self.size
+            if not self.bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+
+class AvailabilityIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._first_build = threading.Lock()
+        self._get_db_connection = None
+        self._filters = None
+        self._last_id = 0
+        self._refreshed = self._built = 0.0
+        self._busy = False
+
+    def init(self, get_db_connection):
+        self._get_db_connection = get_db_connection
+
+    def _scan(self, cursor, db_type, after_id):
+        columns = ', '.join(FIELDS[field] for field in FILTERED)
+        cursor.execute(sql(db_type, f'SELECT id, {columns} FROM users WHERE id > ?'), (after_id,))
+        while True:
+            rows = cursor.fetchmany(SCAN_CHUNK)
+            if not rows:
+                break
+            yield rows
+
+    def _fill(self, filters, cursor, db_type, after_id):
+        last_id = after_id
+        for rows in self._scan(cursor, db_type, after_id):
+            for field in FILTERED:
+                filters[field].add_many([row[FIELDS[field]] for row in rows])
+            last_id = max(last_id, max(row['id'] for row in rows))
+        return last_id
+
+    def _rebuild(self):
+        conn, db_type = self._get_db_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('SELECT COUNT(*) AS n FROM users')
+            capacity = max(MIN_CAPACITY, cursor.fetchone()['n'] * 2)
+            filters = {field: BloomFilter(capacity) for field in FILTERED}
+            if db_type == 'postgres':
+                cursor = conn.cursor(name=f'availability_{os.getpid()}')
+                cursor.itersize = SCAN_CHUNK
+            last_id = self._fill(filters, cursor, db_type, 0)
+        finally:
+            conn.close()
+        with self._lock:
+            self._filters, self._last_id = filters, last_id
+            self._refreshed = self._built = time.monotonic()
+
+    def _catch_up(self):
+        conn, db_type = self._get_db_connection()
+        try:
+            chunks = list(self._scan(conn.cursor(), db_type, self._last_id))
+        finally:
+            conn.close()
+        with self._lock:  # add() writes the same bit arrays
+            for rows in chunks:
+                for field in FILTERED:
+                    self._filters[field].add_many([row[FIELDS[field]] for row in rows])
+                self._last_id = max(self._last_id, max(row['id'] for row in rows))
+
+    def _current(self):
+        if self._filters is None:
+            with self._first_build:  # first use: everyone waits for the one scan
+                if self._filters is None:
+                    started = time.perf_counter()
+                    self._rebuild()
+                    print(f"✅ Availability filters built: {self._filters['username'].count} user(s) "
+                          f"in {time.perf_counter() - started:.2f}s")
+            return self._filters
+
+        # Later rebuilds and catch-ups are done by one request while the rest use what's there
+        now = time.monotonic()
+        with self._lock:
+            filters = self._filters
+            rebuild = not self._busy and (now - self._built > REBUILD_SECONDS
+                                          or filters['username'].count > filters['username'].capacity)
+            catch_up = not self._busy and not rebuild and now - self._refreshed > REFRESH_SECONDS
+            if rebuild or catch_up:
+                self._busy = True
+                self._refreshed = now
+        if rebuild or catch_up:
+            try:
+                self._rebuild() if rebuild else self._catch_up()
+            finally:
+                self._busy = False
+        return self._filters
+
+    def maybe_taken(self, field, value):
+        """False means definitely free; True means check the database"""
+        return value in self._current()[field]
+
+    def add(self, username=None, email=None):
+        """Record a write (after its commit)"""
+        if self._filters is None:
+            return
+        with self._lock:
+            for field, value in (('username', username), ('email', email)):
+                if value:
+                    self._filters[field].add(value)
+
+    def reset(self):
+        with self._lock:
+            self._filters = None
+
+
+index = AvailabilityIndex()
+
+
+def exists(get_db_connection, field, value):
+    """The exact answer, from the UNIQUE index behind the column"""
+    conn, db_type = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(sql(db_type, f'SELECT 1 FROM users WHERE {FIELDS[field]} = ?'), (value,))
+        return cursor.fetchone() is not None
+    finally:
+        conn.close()
+
+
+def is_taken(get_db_connection, field, value):
+    """Filter first; the database only when the filter says maybe"""
+    if field not in FILTERED:
+        return exists(get_db_connection, field, value)
+    return index.maybe_taken(field, value) and exists(get_db_connection, field, value)
@@ -6,6 +6,8 @@ Complete testing tool
 import sqlite3
 from datetime import datetime
 
+import etags
+
 def show_menu():
     print("\n" + "=" * 60)
     print("💰 BALANCE MANAGER")
@@ -51,7 +53,7 @@ def add_balance():
     conn = sqlite3.connect('database/users.db')
     cursor = conn.cursor()
     
-    cursor.execute("SELECT balance FROM users WHERE username = ?", (username,))
+    cursor.execute("SELECT balance, id FROM users WHERE username = ?", (username,))
     user = cursor.fetchone()
     
     if not user:
@@ -64,6 +66,7 @@ def add_balance():
     
     cursor.execute("UPDATE users SET balance = balance + ? WHERE username = ?", 
                   (amount, username))
+    etags.bump(cursor, 'sqlite', user[1])
     conn.commit()
     conn.close()
     
@@ -80,7 +83,7 @@ def remove_balance():
     conn = sqlite3.connect('database/users.db')
     cursor = conn.cursor()
     
-    cursor.execute("SELECT balance FROM users WHERE username = ?", (username,))
+    cursor.execute("SELECT balance, id FROM users WHERE username = ?", (username,))
     user = cursor.fetchone()
     
     if not user:
@@ -102,6 +105,7 @@ def remove_balance():
     
     cursor.execute("UPDATE users SET balance = balance - ? WHERE username = ?", 
                   (amount, username))
+    etags.bump(cursor, 'sqlite', user[1])
     conn.commit()
     conn.close()
     
@@ -118,7 +122,7 @@ def set_exact_balance():
     conn = sqlite3.connect('database/users.db')
     cursor = conn.cursor()
     
-    cursor.execute("SELECT balance FROM users WHERE username = ?", (username,))
+    cursor.execute("SELECT balance, id FROM users WHERE username = ?", (username,))
     user = cursor.fetchone()
     
     if not user:
@@ -130,6 +134,7 @@ def set_exact_balance():
     
     cursor.execute("UPDATE users SET balance = ? WHERE username = ?", 
                   (new_balance, username))
+    etags.bump(cursor, 'sqlite', user[1])
     conn.commit()
     conn.close()
     
@@ -149,7 +154,7 @@ def test_withdrawal():
     conn = sqlite3.connect('database/users.db')
     cursor = conn.cursor()
     
-    cursor.execute("SELECT balance FROM users WHERE username = ?", (username,))
+    cursor.execute("SELECT balance, id FROM users WHERE username = ?", (username,))
     user = cursor.fetchone()
     
     if not user:
@@ -170,6 +175,7 @@ def test_withdrawal():
     
     cursor.execute("UPDATE users SET balance = balance - ? WHERE username = ?", 
                   (amount, username))
+    etags.bump(cursor, 'sqlite', user[1])
     conn.commit()
     conn.close()
     
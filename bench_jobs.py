@@ -0,0 +1,138 @@
+"""
+Job Queue Benchmark - enqueue and processing throughput of jobs.py
+
+    python bench_jobs.py                              # 20000 jobs, 1/2/4 processes
+    python bench_jobs.py --jobs 50000 --processes 4 8 --batch 50 100
+    python bench_jobs.py --database-url postgresql://...  # scratch Postgres database
+
+Runs against a throwaway SQLite file (WAL) in a temp dir unless
+--database-url is given; the jobs table there is emptied between runs,
+so never point it at production. Each run enqueues --jobs no-op jobs
+(batched inserts, like a request enqueueing in its own transaction
+would be one per commit) and drains them with N worker processes.
+Reported: enqueue jobs/s, processing jobs/s, and a check that every
+job ran exactly once.
+"""
+
+import argparse
+import multiprocessing
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+
+import jobs
+
+ENQUEUE_CHUNK = 1000
+
+
+@jobs.task('bench.noop', max_attempts=1)
+def noop(payload):
+    pass
+
+
+def connection_factory(target):
+    if target.startswith('postgres'):
+        def connect():
+            import psycopg2
+            from psycopg2.extras import RealDictCursor
+            return psycopg2.connect(target, cursor_factory=RealDictCursor), 'postgres'
+    else:
+        def connect():
+            conn = sqlite3.connect(target, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA synchronous=NORMAL')  # per connection, unlike journal_mode
+            return conn, 'sqlite'
+    return connect
+
+
+def reset(connect):
+    conn, db_type = connect()
+    cursor = conn.cursor()
+    if db_type == 'sqlite':
+        cursor.execute('PRAGMA journal_mode=WAL')  # persists in the database file
+    jobs.ensure_table(cursor, db_type)
+    cursor.execute('DELETE FROM jobs')
+    conn.commit()
+    conn.close()
+
+
+def enqueue(connect, count):
+    conn, db_type = connect()
+    cursor = conn.cursor()
+    started = time.perf_counter()
+    for start in range(0, count, ENQUEUE_CHUNK):
+        jobs.enqueue_many(cursor, db_type, 'bench.noop',
+                          ({'n': n} for n in range(start, min(count, start + ENQUEUE_CHUNK))))
+        conn.commit()
+    elapsed = time.perf_counter() - started
+    conn.close()
+    return elapsed
+
+
+def drain(target, batch):
+    worker = jobs.Worker(connection_factory(target), batch_size=batch)
+    worker.run(until_empty=True)
+
+
+def check(connect, count):
+    conn, _ = connect()
+    cursor = conn.cursor()
+    cursor.execute("SELECT COUNT(*) AS n, SUM(attempts) AS attempts FROM jobs WHERE status = 'done'")
+    row = cursor.fetchone()
+    conn.close()
+    return row['n'] == count and row['attempts'] == count
+
+
+def run(target, count, processes, batch):
+    connect = connection_factory(target)
+    reset(connect)
+    enqueue_seconds = enqueue(connect, count)
+
+    workers = [multiprocessing.Process(target=drain, args=(target, batch)) for _ in range(processes)]
+    started = time.perf_counter()
+    for p in workers:
+        p.start()
+    for p in workers:
+        p.join()
+    process_seconds = time.perf_counter() - started
+    return {
+        'enqueue_rate': count / enqueue_seconds,
+        'process_rate': count / process_seconds,
+        'exactly_once': check(connect, count),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure job queue throughput")
+    parser.add_argument('--jobs', type=int, default=20000)
+    parser.add_argument('--processes', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--batch', type=int, nargs='+', default=[jobs.BATCH_SIZE, 100])
+    parser.add_argument('--database-url', help="scratch Postgres database (default: temp SQLite file)")
+    args = parser.parse_args()
+
+    root = None
+    target = args.database_url
+    if not target:
+        root = tempfile.mkdtemp(prefix='bench-jobs-')
+        target = os.path.join(root, 'jobs.db')
+    results = []
+    try:
+        for processes in args.processes:
+            for batch in args.batch:
+                print(f"🔧 {args.jobs} jobs, {processes} process(es), batch {batch}")
+                results.append((processes, batch, run(target, args.jobs, processes, batch)))
+    finally:
+        if root:
+            shutil.rmtree(root, ignore_errors=True)
+
+    print()
+    print(f"{'processes':>9}{'batch':>7}{'enqueue/s':>12}{'jobs/s':>10}{'exactly once':>14}")
+    for processes, batch, r in results:
+        print(f"{processes:>9}{batch:>7}{r['enqueue_rate']:>12.0f}{r['process_rate']:>10.0f}"
+              f"{'yes' if r['exactly_once'] else 'NO':>14}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+"""
+Worker Benchmark - concurrent request capacity and memory per gunicorn mode
+
+    python bench_workers.py                          # sync vs gthread vs gevent
+    python bench_workers.py --modes gevent --slow 20 --duration 20
+    python bench_workers.py --modes gthread --workers 1 2 4 --threads 2 4 8
+
+Each mode is started with gunicorn.conf.py against a throwaway copy of
+the app (fresh SQLite database in a temp dir, the real one is never
+touched). While --slow clients trickle a POST body like a phone on a bad
+connection uploading a screenshot, --clients fast clients loop over
+/dashboard, /api/v1/me and /login. Reported per mode: fast-request
+throughput, p50/p95 latency, errors/timeouts and total RSS of the
+gunicorn master + workers. gthread runs every --workers x --threads pair.
+"""
+
+import argparse
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+REPO = os.path.dirname(os.path.abspath(__file__))
+FAST_PATHS = ('/dashboard', '/api/v1/me', '/login')
+REQUEST_TIMEOUT = 10
+USER = {'username': 'bench', 'email': 'bench@example.com', 'password': 'bench-pass',
+        'confirm_password': 'bench-pass', 'whatsapp_number': '03000000000'}
+
+
+def prepare_tree():
+    """Copy the app into a temp dir with an empty, initialized database"""
+    root = tempfile.mkdtemp(prefix='bench-')
+    tree = os.path.join(root, 'app')
+    shutil.copytree(REPO, tree, ignore=shutil.ignore_patterns(
+        '.git', '__pycache__', '.cache', '*.db', 'uploads', 'dist'))
+    os.makedirs(os.path.join(tree, 'database'), exist_ok=True)
+    subprocess.run([sys.executable, '-c', 'import app; app.init_db()'], cwd=tree, check=True,
+                   stdout=subprocess.DEVNULL)
+    return root, tree
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(tree, port, env_overrides):
+    env = dict(os.environ, PORT=str(port), **env_overrides)
+    env.pop('DATABASE_URL', None)
+    proc = subprocess.Popen([sys.executable, '-m', 'gunicorn', 'app:app', '-c', 'gunicorn.conf.py',
+                             '--bind', f'127.0.0.1:{port}'],
+                            cwd=tree, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base = f'http://127.0.0.1:{port}'
+    for _ in range(100):
+        try:
+            requests.get(base + '/login', timeout=1)
+            return proc, base
+        except requests.RequestException:
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError(f"gunicorn did not start ({env_overrides})")
+
+
+def stop_server(proc):
+    proc.terminate()
+    try:
+        proc.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+
+
+def process_tree_rss(pid):
+    """Total RSS in MB of a process and its direct children (Linux /proc)"""
+    pids = [pid]
+    for entry in os.listdir('/proc'):
+        if entry.isdigit():
+            try:
+                with open(f'/proc/{entry}/stat') as f:
+                    if int(f.read().rsplit(')', 1)[1].split()[1]) == pid:
+                        pids.append(int(entry))
+            except (OSError, IndexError, ValueError):
+                pass
+    total_kb = 0
+    for p in pids:
+        try:
+            with open(f'/proc/{p}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total_kb += int(line.split()[1])
+        except OSError:
+            pass
+    return total_kb / 1024
+
+
+def login(base):
+    session = requests.Session()
+    session.post(base + '/register', data=USER, timeout=REQUEST_TIMEOUT)
+    session.post(base + '/login', data={'username': USER['username'], 'password': USER['password']},
+                 timeout=REQUEST_TIMEOUT)
+    return session.cookies.get_dict()
+
+
+def slow_client(port, seconds, stop):
+    """POST a small form body one byte at a time over `seconds`"""
+    body = b'username=nobody&password=' + b'x' * 40
+    delay = seconds / len(body)
+    while not stop.is_set():
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=REQUEST_TIMEOUT + seconds) as s:
+                s.sendall(b'POST /login HTTP/1.1\r\nHost: localhost\r\n'
+                          b'Content-Type: application/x-www-form-urlencoded\r\n'
+                          b'Content-Length: ' + str(len(body)).encode() + b'\r\nConnection: close\r\n\r\n')
+                for i in range(len(body)):
+                    if stop.is_set():
+                        return
+                    s.sendall(body[i:i + 1])
+                    time.sleep(delay)
+                s.recv(1024)
+        except OSError:
+            time.sleep(0.1)
+
+
+def fast_client(base, cookies, stop, latencies, errors):
+    session = requests.Session()
+    session.cookies.update(cookies)
+    i = 0
+    while not stop.is_set():
+        path = FAST_PATHS[i % len(FAST_PATHS)]
+        i += 1
+        started = time.perf_counter()
+        try:
+            response = session.get(base + path, timeout=REQUEST_TIMEOUT, allow_redirects=False)
+            if response.status_code >= 500:
+                errors.append(response.status_code)
+            else:
+                latencies.append(time.perf_counter() - started)
+        except requests.RequestException:
+            errors.append('timeout')
+
+
+def run_load(proc, base, port, clients, slow, slow_seconds, duration):
+    cookies = login(base)
+    stop = threading.Event()
+    latencies, errors = [], []
+    threads = [threading.Thread(target=slow_client, args=(port, slow_seconds, stop), daemon=True)
+               for _ in range(slow)]
+    threads += [threading.Thread(target=fast_client, args=(base, cookies, stop, latencies, errors), daemon=True)
+                for _ in range(clients)]
+    for t in threads:
+        t.start()
+
+    peak_rss = 0.0
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        peak_rss = max(peak_rss, process_tree_rss(proc.pid))
+        time.sleep(0.5)
+    stop.set()
+    for t in threads:
+        t.join(timeout=REQUEST_TIMEOUT + slow_seconds)
+
+    ordered = sorted(latencies)
+    return {
+        'requests': len(latencies),
+        'rps': len(latencies) / duration,
+        'p50_ms': 1000 * statistics.median(ordered) if ordered else float('nan'),
+        'p95_ms': 1000 * ordered[int(len(ordered) * 0.95) - 1] if ordered else float('nan'),
+        'errors': len(errors),
+        'rss_mb': peak_rss,
+    }
+
+
+def configurations(args):
+    for mode in args.modes:
+        for workers in args.workers:
+            env = {'WORKER_MODE': mode, 'WEB_CONCURRENCY': str(workers)}
+            if mode != 'gthread':
+                yield f"{mode} {workers}w", env
+                continue
+            for threads in args.threads:
+                yield f"{mode} {workers}w x {threads}t", dict(env, WORKER_THREADS=str(threads))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare gunicorn worker modes under slow + fast clients")
+    parser.add_argument('--modes', nargs='+', default=['sync', 'gthread', 'gevent'])
+    parser.add_argument('--workers', type=int, nargs='+', default=[2])
+    parser.add_argument('--threads', type=int, nargs='+', default=[4], help="gthread threads per worker")
+    parser.add_argument('--clients', type=int, default=20, help="fast clients")
+    parser.add_argument('--slow', type=int, default=4, help="clients trickling a request body")
+    parser.add_argument('--slow-seconds', type=float, default=3.0, help="time to send one slow body")
+    parser.add_argument('--duration', type=float, default=15.0)
+    args = parser.parse_args()
+
+    root, tree = prepare_tree()
+    results = []
+    try:
+        for label, env in configurations(args):
+            port = free_port()
+            print(f"🔧 {label}: {args.clients} fast + {args.slow} slow clients for {args.duration:.0f}s")
+            proc, base = start_server(tree, port, env)
+            try:
+                results.append((label, run_load(proc, base, port, args.clients, args.slow,
+                                                args.slow_seconds, args.duration)))
+            finally:
+                stop_server(proc)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    print()
+    print(f"{'mode':<20}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'errors':>8}{'RSS MB':>9}")
+    for label, r in results:
+        print(f"{label:<20}{r['rps']:>9.1f}{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}{r['errors']:>8}{r['rss_mb']:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+"""
+Response Compression - gzip/brotli WSGI middleware for dynamic HTML
+
+- compresses text responses (HTML, JSON, CSS/JS, CSV/NDJSON) above a
+  size threshold at a configurable level
+- responses without a Content-Length (streamed exports, SSE) are
+  compressed chunk by chunk with a sync flush, so they keep streaming
+- skips anything already encoded (precompressed static assets) and
+  binary media like the PNG screenshots
+- keeps per-endpoint counters (ratio, CPU seconds spent compressing)
+  for tuning level vs. CPU
+- a compressed response's ETag gets a -gzip / -br suffix, so caches and
+  If-Range never take it for the identity body; the suffix is stripped
+  from If-None-Match on the way in (and put back on the 304), so the
+  views' own ETag checks keep working
+
+Env: COMPRESS_LEVEL (gzip 1-9, default 6), COMPRESS_MIN_SIZE (bytes, default 1024)
+"""
+
+import os
+import re
+import threading
+import time
+import zlib
+
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+
+COMPRESSIBLE_TYPES = (
+    'text/',
+    'application/json',
+    'application/javascript',
+    'application/x-ndjson',
+    'application/xml',
+    'image/svg+xml',
+)
+
+_ID_SEGMENT = re.compile(r'/\d+(?=/|$)')
+
+
+def endpoint_key(environ):
+    """Group stats by path with numeric ids collapsed: /admin/approve-investment/<id>"""
+    return _ID_SEGMENT.sub('/<id>', environ.get('PATH_INFO', '') or '/')
+
+
+class _GzipStream:
+    def __init__(self, level):
+        self._z = zlib.compressobj(level, zlib.DEFLATED, 31)  # 31 = gzip container
+
+    def compress(self, data):
+        return self._z.compress(data)
+
+    def flush(self):
+        return self._z.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._z.flush(zlib.Z_FINISH)
+
+
+class _BrotliStream:
+    def __init__(self, quality):
+        self._c = brotli.Compressor(quality=quality)
+
+    def compress(self, data):
+        return self._c.process(data)
+
+    def flush(self):
+        return self._c.flush()
+
+    def finish(self):
+        return self._c.finish()
+
+
+class CompressionStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = {}
+
+    def record(self, endpoint, encoding, raw, compressed, cpu):
+        with self._lock:
+            s = self._endpoints.setdefault(endpoint, {
+                'responses': 0, 'raw_bytes': 0, 'compressed_bytes': 0, 'cpu_seconds': 0.0, 'encodings': {},
+            })
+            s['responses'] += 1
+            s['raw_bytes'] += raw
+            s['compressed_bytes'] += compressed
+            s['cpu_seconds'] += cpu
+            s['encodings'][encoding] = s['encodings'].get(encoding, 0) + 1
+
+    def snapshot(self):
+        with self._lock:
+            result = {}
+            for endpoint, s in self._endpoints.items():
+                result[endpoint] = dict(s, encodings=dict(s['encodings']),
+                                        ratio=round(s['raw_bytes'] / s['compressed_bytes'], 2)
+                                        if s['compressed_bytes'] else None,
+                                        cpu_ms_per_response=round(1000 * s['cpu_seconds'] / s['responses'], 3))
+            return result
+
+
+class CompressionMiddleware:
+    def __init__(self, app, level=None, min_size=None, brotli_quality=5):
+        self.app = app
+        self.level = int(level if level is not None else os.environ.get('COMPRESS_LEVEL', 6))
+        self.min_size = int(min_size if min_size is not None else os.environ.get('COMPRESS_MIN_SIZE', 1024))
+        self.brotli_quality = brotli_quality
+        self.stats = CompressionStats()
+
+    def _choose_encoding(self, environ):
+        accept = environ.get('HTTP_ACCEPT_ENCODING', '').lower()
+        offered = {}
+        for item in accept.split(','):
+            name, _, params = item.strip().partition(';')
+            q = 1.0
+            if params.strip().startswith('q='):
+                try:
+                    q = float(params.strip()[2:])
+                except ValueError:
+                    q = 0.0
+            offered[name.strip()] = q
+        if BROTLI_AVAILABLE and offered.get('br', 0) > 0:
+            return 'br'
+        if offered.get('gzip', 0) > 0:
+            return 'gzip'
+        return None
+
+    def _compressor(self, encoding):
+        if encoding == 'br':
+            return _BrotliStream(self.brotli_quality)
+        return _GzipStream(self.level)
+
+    def _should_compress(self, status, headers):
+        if not status.startswith('200'):
+            return False
+        names = {k.lower(): v for k, v in headers}
+        if 'content-encoding' in names:
+            return False
+        if 'no-transform' in names.get('cache-control', ''):
+            return False
+        content_type = names.get('content-type', '').lower()
+        if not content_type.startswith(COMPRESSIBLE_TYPES):
+            return False
+        length = names.get('content-length')
+        if length is not None and int(length) < self.min_size:
+            return False
+        return True
+
+    def __call__(self, environ, start_response):
+        encoding = self._choose_encoding(environ)
+        if encoding is None or environ.get('REQUEST_METHOD') == 'HEAD':
+            return self.app(environ, start_response)
+
+        suffix = f'-{encoding}"'
+        if_none_match = environ.get('HTTP_IF_NONE_MATCH', '')
+        revalidating = suffix in if_none_match
+        if revalidating:
+            environ = dict(environ, HTTP_IF_NONE_MATCH=if_none_match.replace(suffix, '"'))
+
+        captured = []
+
+        def capture(status, headers, exc_info=None):
+            captured[:] = [status, headers, exc_info]
+            return lambda data: None  # legacy write() is not used by Flask
+
+        body = self.app(environ, capture)
+        iterator = iter(body)
+        pending = []
+        if not captured:
+            # start_response may be deferred until the first chunk
+            pending.append(next(iterator, b''))
+        status, headers, exc_info = captured
+
+        if not self._should_compress(status, headers):
+            if revalidating and status.startswith('304'):
+                headers = _tag_etag(headers, encoding)
+            start_response(status, headers, exc_info)
+            if not pending:
+                return body  # untouched, keeps wsgi.file_wrapper / sendfile
+            return _chain(pending, iterator, body)
+
+        headers = [(k, v) for k, v in _tag_etag(headers, encoding) if k.lower() != 'content-length']
+        headers.append(('Content-Encoding', encoding))
+        _add_vary(headers)
+        endpoint = endpoint_key(environ)
+        known_length = any(k.lower() == 'content-length' for k, _ in captured[1])
+
+        if known_length:
+            # Small fixed-size body (rendered page): compress in one go
+            raw = b''.join(pending) + b''.join(iterator)
+            if hasattr(body, 'close'):
+                body.close()
+            cpu = time.thread_time()
+            compressor = self._compressor(encoding)
+            data = compressor.compress(raw) + compressor.finish()
+            self.stats.record(endpoint, encoding, len(raw), len(data), time.thread_time() - cpu)
+            headers.append(('Content-Length', str(len(data))))
+            start_response(status, headers, exc_info)
+            return [data]
+
+        start_response(status, headers, exc_info)
+        return self._stream(encoding, endpoint, pending, iterator, body)
+
+    def _stream(self, encoding, endpoint, pending, iterator, body):
+        compressor = self._compressor(encoding)
+        raw = compressed = 0
+        cpu = 0.0
+        try:
+            for chunk in _chain(pending, iterator, None):
+                if not chunk:
+                    continue
+                started = time.thread_time()
+                data = compressor.compress(chunk) + compressor.flush()
+                cpu += time.thread_time() - started
+                raw += len(chunk)
+                compressed += len(data)
+                if data:
+                    yield data
+            started = time.thread_time()
+            data = compressor.finish()
+            cpu += time.thread_time() - started
+            compressed += len(data)
+            if data:
+                yield data
+        finally:
+            if hasattr(body, 'close'):
+                body.close()
+            self.stats.record(endpoint, encoding, raw, compressed, cpu)
+
+
+def _chain(pending, iterator, body):
+    try:
+        yield from pending
+        yield from iterator
+    finally:
+        if body is not None and hasattr(body, 'close'):
+            body.close()
+
+
+def _tag_etag(headers, encoding):
+    """'"abc"' -> '"abc-gzip"' (weak tags keep their W/)"""
+    return [(k, f'{v[:-1]}-{encoding}"' if k.lower() == 'etag' and v.endswith('"') else v)
+            for k, v in headers]
+
+
+def _add_vary(headers):
+    for i, (k, v) in enumerate(headers):
+        if k.lower() == 'vary':
+            if 'accept-encoding' not in v.lower():
+                headers[i] = (k, f'{v}, Accept-Encoding')
+            return
+    headers.append(('Vary', 'Accept-Encoding'))
@@ -0,0 +1,191 @@
+"""
+Connection Pools - thread-safe reuse of database connections
+
+get_db_connection() callers open a connection, use it and call close().
+With pooling, close() hands the connection back instead (after a rollback,
+so a request that bailed out mid-transaction never leaks locks):
+
+- SQLite: a small idle list per thread. sqlite3 connections must stay on
+  the thread that created them, and nested get_db_connection() calls on
+  one thread get separate connections.
+- Postgres: one ThreadedConnectionPool per worker process, bounded by a
+  semaphore so callers wait for a free connection instead of failing.
+
+Both pools notice a fork (pid change) and start empty in the child.
+
+Env: DB_POOL_SIZE (Postgres connections per worker, default 10),
+DB_POOL_TIMEOUT (seconds to wait for one, default 30)
+"""
+
+import os
+import sqlite3
+import threading
+import time
+
+POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))
+POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 30))
+WAIT_HALF_LIFE = 2.0        # seconds for the recent-wait signal to halve when idle
+MAX_IDLE_PER_THREAD = 2
+
+
+def sql(db_type, query):
+    """A query written with ? placeholders, as the driver wants it (%s for psycopg2)"""
+    return query.replace('?', '%s') if db_type == 'postgres' else query
+
+
+class PooledConnection:
+    """Proxy whose close() returns the connection to its pool"""
+    __slots__ = ('_conn', '_pool')
+
+    def __init__(self, conn, pool):
+        object.__setattr__(self, '_conn', conn)
+        object.__setattr__(self, '_pool', pool)
+
+    def close(self):
+        conn = self._conn
+        if conn is not None:
+            object.__setattr__(self, '_conn', None)
+            self._pool.release(conn)
+
+    def __del__(self):
+        # Safety net for code paths that return without close()
+        try:
+            self.close()
+        except Exception:
+            pass
+
+    def __enter__(self):
+        return self._conn.__enter__()
+
+    def __exit__(self, *exc):
+        return self._conn.__exit__(*exc)
+
+    def __getattr__(self, name):
+        if self._conn is None:
+            raise RuntimeError("Connection was already closed (returned to the pool)")
+        return getattr(self._conn, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._conn, name, value)
+
+
+class SQLitePool:
+    def __init__(self, path, timeout=30.0):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        self._pid = os.getpid()
+
+    def _idle(self):
+        if self._pid != os.getpid():
+            self._local = threading.local()
+            self._pid = os.getpid()
+        idle = getattr(self._local, 'idle', None)
+        if idle is None:
+            idle = self._local.idle = []
+        return idle
+
+    def connect(self):
+        idle = self._idle()
+        if idle:
+            conn = idle.pop()
+        else:
+            conn = sqlite3.connect(self.path, timeout=self.timeout)
+            conn.row_factory = sqlite3.Row
+        return PooledConnection(conn, self)
+
+    def close_idle(self):
+        """Close this thread's idle connections (the master, before forking)"""
+        for conn in self._idle():
+            conn.close()
+        self._local = threading.local()
+
+    def reset(self):
+        """Forget connections inherited from the parent process"""
+        self._local = threading.local()
+        self._pid = os.getpid()
+
+    def release(self, conn):
+        try:
+            conn.rollback()
+        except sqlite3.Error:
+            conn.close()
+            return
+        idle = self._idle()
+        if len(idle) < MAX_IDLE_PER_THREAD:
+            idle.append(conn)
+        else:
+            conn.close()
+
+
+class PostgresPool:
+    def __init__(self, dsn, size=POOL_SIZE, timeout=POOL_TIMEOUT):
+        self.dsn = dsn
+        self.size = size
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pid = None
+        self._wait = 0.0
+        self._wait_at = time.monotonic()
+
+    def recent_wait(self):
+        """Moving average of seconds spent waiting for a connection, decaying when idle"""
+        idle = time.monotonic() - self._wait_at
+        return self._wait * 0.5 ** (idle / WAIT_HALF_LIFE)
+
+    def _record_wait(self, seconds):
+        self._wait = 0.8 * self.recent_wait() + 0.2 * seconds
+        self._wait_at = time.monotonic()
+
+    def _get_pool(self):
+        if self._pool is None or self._pid != os.getpid():
+            with self._lock:
+                if self._pool is None or self._pid != os.getpid():
+                    from psycopg2.extras import RealDictCursor
+                    from psycopg2.pool import ThreadedConnectionPool
+                    # Connections inherited from a parent process are left alone
+                    self._pool = ThreadedConnectionPool(1, self.size, self.dsn, cursor_factory=RealDictCursor)
+                    self._slots = threading.BoundedSemaphore(self.size)
+                    self._pid = os.getpid()
+        return self._pool
+
+    def close(self):
+        with self._lock:
+            if self._pool is not None and self._pid == os.getpid():
+                self._pool.closeall()
+            self._pool = None
+
+    def reset(self):
+        """Drop (without closing) connections inherited from the parent process;
+        closing them here would terminate the parent's sessions"""
+        self._lock = threading.Lock()
+        self._pool = None
+
+    def connect(self):
+        pool = self._get_pool()
+        started = time.monotonic()
+        acquired = self._slots.acquire(timeout=self.timeout)
+        self._record_wait(time.monotonic() - started)
+        if not acquired:
+            raise RuntimeError(f"No database connection free after {self.timeout:.0f}s (pool size {self.size})")
+        try:
+            conn = pool.getconn()
+            if conn.closed:
+                pool.putconn(conn, close=True)
+                conn = pool.getconn()
+        except Exception:
+            self._slots.release()
+            raise
+        return PooledConnection(conn, self)
+
+    def release(self, conn):
+        pool = self._pool
+        try:
+            if not conn.closed:
+                conn.rollback()
+            pool.putconn(conn, close=bool(conn.closed))
+        except Exception:
+            pool.putconn(conn, close=True)
+        finally:
+            self._slots.release()
@@ -0,0 +1,359 @@
+"""
+Earnings Ledger - credited days stored as runs, not one row per day
+
+    python earnings.py accrue [--date YYYY-MM-DD]   # credit every day up to today / that date
+    python earnings.py compact                      # fold daily_earnings rows (archived too) into runs
+    python earnings.py stats                        # runs vs. the days they stand for
+    python earnings.py show <user_id>               # one user's credited days
+
+An investment earns the same amount every day for 30 days, so its
+credits are one earning_runs row (investment, start_day, days,
+daily_amount) instead of 30 daily_earnings rows. Days are date ordinals
+(as in forecast.py), which keeps "the day after this run" a plain
+integer sum on both databases.
+
+- accrue() credits one investment for one day: the run ending the day
+  before is extended (days + 1) or a new run starts
+- accrue_day() does the same for every due investment in chunks of
+  set-based statements, and also credits balances, counts down
+  days_remaining and completes finished investments
+- user_total() is one SUM(days * daily_amount) over the
+  (user_id, days, daily_amount) index, no table rows touched
+- expand() / credited_days() turn runs back into (date, amount) only
+  when a caller really needs days
+
+Nothing credited earnings automatically before this module, so the
+hourly 'earnings.accrue' job only runs with EARNINGS_ACCRUAL=on. It
+catches up from the last accrued day, so a missed hour or day is paid
+on the next run, never twice.
+
+Env: EARNINGS_ACCRUAL (on/off, default off), EARNINGS_BATCH_SIZE (default 1000)
+"""
+
+import os
+import sys
+from datetime import date, timedelta
+
+import archive
+import etags
+import jobs
+from db_pool import sql
+
+ACCRUAL_ENABLED = os.environ.get('EARNINGS_ACCRUAL', 'off').lower() in ('1', 'on', 'true', 'yes')
+BATCH_SIZE = int(os.environ.get('EARNINGS_BATCH_SIZE', 1000))
+STATE_KEY = 'accrual'
+
+
+def _connection():
+    from app import get_db_connection
+    return get_db_connection()
+
+
+def ensure_table(cursor, db_type):
+    if db_type == 'postgres':
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS earning_runs (
+                id SERIAL PRIMARY KEY,
+                investment_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                start_day INTEGER NOT NULL,
+                days INTEGER NOT NULL,
+                daily_amount DECIMAL(10,2) NOT NULL,
+                UNIQUE (investment_id, start_day)
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS earnings_state (
+                name VARCHAR(50) PRIMARY KEY,
+                last_day INTEGER NOT NULL
+            )
+        ''')
+    else:
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS earning_runs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                investment_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                start_day INTEGER NOT NULL,
+                days INTEGER NOT NULL,
+                daily_amount REAL NOT NULL,
+                UNIQUE (investment_id, start_day)
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS earnings_state (
+                name TEXT PRIMARY KEY,
+                last_day INTEGER NOT NULL
+            )
+        ''')
+    # Covers user_total(): the sum is answered from the index alone
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_earning_runs_user ON earning_runs (user_id, days, daily_amount)')
+
+
+def _ordinal(day):
+    return day.toordinal() if isinstance(day, date) else int(day)
+
+
+def accrue(cursor, db_type, investment_id, user_id, day, amount):
+    """Credit one investment for one day; call before the write's commit"""
+    day = _ordinal(day)
+    cursor.execute(sql(db_type, '''
+        UPDATE earning_runs SET days = days + 1
+        WHERE investment_id = ? AND start_day + days = ? AND daily_amount = ?
+    '''), (investment_id, day, amount))
+    if cursor.rowcount == 0:
+        cursor.execute(sql(db_type, '''
+            INSERT INTO earning_runs (investment_id, user_id, start_day, days, daily_amount)
+            VALUES (?, ?, ?, 1, ?)
+        '''), (investment_id, user_id, day, amount))
+
+
+def _in(db_type, ids):
+    return ', '.join(('%s' if db_type == 'postgres' else '?') for _ in ids)
+
+
+def accrue_day(conn, db_type, day, batch_size=BATCH_SIZE):
+    """Credit every active investment approved before `day` that isn't
+    credited for it yet; returns (investments, total amount)"""
+    day = _ordinal(day)
+    day_start = date.fromordinal(day).isoformat()
+    lock = ' FOR UPDATE SKIP LOCKED' if db_type == 'postgres' else ''
+    credited = total = 0
+    while True:
+        cursor = conn.cursor()
+        cursor.execute(sql(db_type, f'''
+            SELECT id, user_id, daily_income FROM investments i
+            WHERE status = 'active' AND days_remaining > 0 AND approved_at < ?
+              AND NOT EXISTS (SELECT 1 FROM earning_runs r
+                              WHERE r.investment_id = i.id AND r.start_day <= ? AND r.start_day + r.days > ?)
+            ORDER BY id LIMIT ?{lock}
+        '''), (day_start, day, day, batch_size))
+        rows = cursor.fetchall()
+        if not rows:
+            conn.rollback()
+            break
+        ids = [row['id'] for row in rows]
+        marks = _in(db_type, ids)
+
+        # Extend the runs that end the day before, start new runs for the rest
+        cursor.execute(sql(db_type, f'''
+            UPDATE earning_runs SET days = days + 1
+            WHERE investment_id IN ({marks}) AND start_day + days = ?
+              AND daily_amount = (SELECT daily_income FROM investments i WHERE i.id = earning_runs.investment_id)
+        '''), (*ids, day))
+        cursor.execute(sql(db_type, f'''
+            INSERT INTO earning_runs (investment_id, user_id, start_day, days, daily_amount)
+            SELECT id, user_id, ?, 1, daily_income FROM investments i
+            WHERE id IN ({marks}) AND NOT EXISTS (SELECT 1 FROM earning_runs r
+                                                 WHERE r.investment_id = i.id AND r.start_day + r.days > ?)
+        '''), (day, *ids, day))
+        cursor.execute(sql(db_type, f'''
+            UPDATE investments SET days_completed = days_completed + 1, days_remaining = days_remaining - 1,
+                                   status = CASE WHEN days_remaining <= 1 THEN 'completed' ELSE status END
+            WHERE id IN ({marks})
+        '''), ids)
+
+        per_user = {}
+        for row in rows:
+            per_user[row['user_id']] = per_user.get(row['user_id'], 0) + float(row['daily_income'])
+        cursor.executemany(sql(db_type, 'UPDATE users SET balance = balance + ? WHERE id = ?'),
+                           [(amount, user_id) for user_id, amount in per_user.items()])
+        for user_id in per_user:
+            etags.bump(cursor, db_type, user_id)
+        conn.commit()
+
+        credited += len(rows)
+        total += sum(per_user.values())
+        if len(rows) < batch_size:
+            break
+    return credited, total
+
+
+def accrue_until(conn, db_type, until=None):
+    """Accrue each day after the last accrued one up to `until` (default today);
+    the first run only does `until`. Returns [(day, investments, total)]"""
+    until = _ordinal(until or date.today())
+    cursor = conn.cursor()
+    cursor.execute(sql(db_type, 'SELECT last_day FROM earnings_state WHERE name = ?'), (STATE_KEY,))
+    row = cursor.fetchone()
+    first = row['last_day'] + 1 if row else until
+    done = []
+    for day in range(first, until + 1):
+        credited, total = accrue_day(conn, db_type, day)
+        cursor = conn.cursor()
+        cursor.execute(sql(db_type, '''
+            INSERT INTO earnings_state (name, last_day) VALUES (?, ?)
+            ON CONFLICT (name) DO UPDATE SET last_day = excluded.last_day
+        '''), (STATE_KEY, day))
+        conn.commit()
+        done.append((date.fromordinal(day), credited, total))
+    return done
+
+
+def user_total(cursor, db_type, user_id):
+    """Everything credited to a user, from the covering index"""
+    cursor.execute(sql(db_type, '''
+        SELECT COALESCE(SUM(days * daily_amount), 0) AS total FROM earning_runs WHERE user_id = ?
+    '''), (user_id,))
+    return float(cursor.fetchone()['total'])
+
+
+def earned_between(cursor, db_type, user_id, start, end):
+    """Credited to a user on days start..end (inclusive), clipping runs at the edges"""
+    low, high = _ordinal(start), _ordinal(end) + 1
+    greatest, least = ('GREATEST', 'LEAST') if db_type == 'postgres' else ('MAX', 'MIN')
+    cursor.execute(sql(db_type, f'''
+        SELECT COALESCE(SUM(({least}(start_day + days, ?) - {greatest}(start_day, ?)) * daily_amount), 0) AS total
+        FROM earning_runs WHERE user_id = ? AND start_day < ? AND start_day + days > ?
+    '''), (high, low, user_id, high, low))
+    return float(cursor.fetchone()['total'])
+
+
+def expand(runs):
+    """(date, amount) for every day a run stands for"""
+    for run in runs:
+        start = date.fromordinal(run['start_day'])
+        for offset in range(run['days']):
+            yield start + timedelta(days=offset), float(run['daily_amount'])
+
+
+def credited_days(cursor, db_type, user_id=None, investment_id=None):
+    """Runs for a user or an investment, expanded to (investment_id, date, amount)"""
+    column, value = ('investment_id', investment_id) if investment_id is not None else ('user_id', user_id)
+    cursor.execute(sql(db_type, f'''
+        SELECT investment_id, start_day, days, daily_amount FROM earning_runs
+        WHERE {column} = ? ORDER BY investment_id, start_day
+    '''), (value,))
+    for run in cursor.fetchall():
+        for day, amount in expand([run]):
+            yield run['investment_id'], day, amount
+
+
+def compact(conn, db_type, batch_size=BATCH_SIZE):
+    """Fold daily_earnings rows, live and archived, into runs (consecutive days,
+    same amount) and delete them; returns (rows folded, runs written).
+    A run overlapping days earning_runs already credits is not written, and
+    its rows stay where they are."""
+    earnings_from = archive.source(conn, db_type, 'daily_earnings')
+    investments_from = archive.source(conn, db_type, 'investments')
+    archived_earnings = archive.archived(conn, db_type, 'daily_earnings')
+    folded = written = 0
+    clashes = set()
+    after = 0
+    while True:
+        cursor = conn.cursor()
+        cursor.execute(sql(db_type, f'''
+            SELECT DISTINCT investment_id FROM {earnings_from} d WHERE investment_id > ?
+            ORDER BY investment_id LIMIT ?
+        '''), (after, batch_size))
+        ids = [row['investment_id'] for row in cursor.fetchall()]
+        if not ids:
+            break
+        after = ids[-1]
+        marks = _in(db_type, ids)
+        cursor.execute(sql(db_type, f'''
+            SELECT d.id, d.investment_id, COALESCE(d.user_id, i.user_id) AS user_id, d.amount, d.earned_date
+            FROM {earnings_from} d LEFT JOIN {investments_from} i ON i.id = d.investment_id
+            WHERE d.investment_id IN ({marks}) ORDER BY d.investment_id, d.earned_date
+        '''), ids)
+        rows = cursor.fetchall()
+        # No owner anywhere (investment deleted by hand): leave those rows be
+        orphaned = sorted({row['investment_id'] for row in rows if row['user_id'] is None})
+        if orphaned:
+            print(f"⚠️  Not folding earnings of investment(s) with no known user: {orphaned}")
+        runs = []
+        for row in rows:
+            if row['user_id'] is None:
+                continue
+            day = date.fromisoformat(str(row['earned_date'])[:10]).toordinal()
+            amount = float(row['amount'])
+            last = runs[-1] if runs else None
+            if (last and last['investment_id'] == row['investment_id'] and last['daily_amount'] == amount
+                    and last['start_day'] + last['days'] == day):
+                last['days'] += 1
+            elif last and last['investment_id'] == row['investment_id'] and last['start_day'] + last['days'] > day:
+                pass  # the same day twice: credited once
+            else:
+                runs.append({'investment_id': row['investment_id'], 'user_id': row['user_id'],
+                             'start_day': day, 'days': 1, 'daily_amount': amount, 'rows': []})
+            runs[-1]['rows'].append(row['id'])
+
+        for run in runs:
+            # Only where no existing run (accrue() / accrue_day()) credits any of its days
+            cursor.execute(sql(db_type, '''
+                INSERT INTO earning_runs (investment_id, user_id, start_day, days, daily_amount)
+                SELECT ?, ?, ?, ?, ?
+                WHERE NOT EXISTS (SELECT 1 FROM earning_runs r
+                                  WHERE r.investment_id = ? AND r.start_day < ? AND r.start_day + r.days > ?)
+            '''), (run['investment_id'], run['user_id'], run['start_day'], run['days'], run['daily_amount'],
+                  run['investment_id'], run['start_day'] + run['days'], run['start_day']))
+            if cursor.rowcount != 1:
+                clashes.add(run['investment_id'])
+                continue
+            marks = _in(db_type, run['rows'])
+            cursor.execute(sql(db_type, f'DELETE FROM daily_earnings WHERE id IN ({marks})'), run['rows'])
+            if archived_earnings:
+                cursor.execute(sql(db_type, f'DELETE FROM {archived_earnings} WHERE id IN ({marks})'), run['rows'])
+            folded += len(run['rows'])
+            written += 1
+        conn.commit()
+    if clashes:
+        print(f"⚠️  Not folding earnings that overlap days already in earning_runs, investment(s): {sorted(clashes)}")
+    return folded, written
+
+
+def stats(cursor):
+    cursor.execute('SELECT COUNT(*) AS runs, COALESCE(SUM(days), 0) AS days FROM earning_runs')
+    row = cursor.fetchone()
+    cursor.execute('SELECT COUNT(*) AS n FROM daily_earnings')
+    legacy = cursor.fetchone()['n']
+    return {'runs': row['runs'], 'days': int(row['days']), 'daily_earnings_rows': legacy}
+
+
+def accrue_job(payload):
+    conn, db_type = _connection()
+    try:
+        done = accrue_until(conn, db_type)
+    finally:
+        conn.close()
+    for day, credited, total in done:
+        if credited:
+            print(f"✅ Earnings for {day}: {credited} investment(s), Rs {total:,.2f}")
+
+
+if ACCRUAL_ENABLED:
+    jobs.periodic('earnings.accrue', every=3600, max_attempts=1)(accrue_job)
+
+
+def main():
+    command = sys.argv[1] if len(sys.argv) > 1 else 'stats'
+    import app
+    app.ensure_schema()
+    conn, db_type = app.get_db_connection()
+    try:
+        if command == 'accrue':
+            until = date.fromisoformat(sys.argv[sys.argv.index('--date') + 1]) if '--date' in sys.argv else None
+            for day, credited, total in accrue_until(conn, db_type, until):
+                print(f"✅ Earnings for {day}: {credited} investment(s), Rs {total:,.2f}")
+        elif command == 'compact':
+            folded, written = compact(conn, db_type)
+            print(f"✅ Folded {folded} daily_earnings row(s) into {written} run(s)")
+        elif command == 'stats':
+            s = stats(conn.cursor())
+            ratio = s['days'] / s['runs'] if s['runs'] else 0
+            print(f"{s['runs']} run(s) for {s['days']} credited day(s) ({ratio:.1f} days per row); "
+                  f"{s['daily_earnings_rows']} legacy daily_earnings row(s)")
+        elif command == 'show' and len(sys.argv) > 2:
+            user_id = int(sys.argv[2])
+            cursor = conn.cursor()
+            for investment_id, day, amount in credited_days(cursor, db_type, user_id=user_id):
+                print(f"#{investment_id}  {day}  Rs {amount:,.2f}")
+            print(f"Total: Rs {user_total(cursor, db_type, user_id):,.2f}")
+        else:
+            raise SystemExit("usage: python earnings.py accrue [--date YYYY-MM-DD] | compact | stats | show <user_id>")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Conditional GET - per-user version stamps and ETag/304 for user pages
+
+Every write that changes what a user sees (balance, investments,
+withdrawals, referrals) bumps that user's row in user_versions inside
+the same transaction. dashboard(), withdraw() and referral() derive
+their ETag from that number, so a refresh with a matching If-None-Match
+is answered 304 after one primary-key lookup - no investments query,
+no template render.
+"""
+
+import hashlib
+import os
+from functools import wraps
+
+from flask import make_response, request, session
+
+from db_pool import sql
+
+_table_ready = False
+
+
+def _deploy_stamp():
+    """Changes whenever templates/code are redeployed, so old ETags stop matching"""
+    stamp = os.environ.get('RAILWAY_GIT_COMMIT_SHA') or os.environ.get('RAILWAY_DEPLOYMENT_ID')
+    if stamp:
+        return stamp[:12]
+    digest = hashlib.sha1()
+    for folder in ('templates', '.'):
+        for name in sorted(os.listdir(folder)):
+            if name.endswith(('.html', '.py')):
+                digest.update(f"{name}:{os.path.getmtime(os.path.join(folder, name))}".encode())
+    return digest.hexdigest()[:12]
+
+
+DEPLOY_STAMP = _deploy_stamp()
+
+
+def ensure_table(cursor, db_type):
+    global _table_ready
+    if db_type == 'postgres':
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS user_versions (
+                user_id INTEGER PRIMARY KEY,
+                version BIGINT NOT NULL DEFAULT 0
+            )
+        ''')
+    else:
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS user_versions (
+                user_id INTEGER PRIMARY KEY,
+                version INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+    _table_ready = True
+
+
+def _ensure(cursor, db_type):
+    if not _table_ready:
+        ensure_table(cursor, db_type)
+
+
+def bump(cursor, db_type, user_id):
+    """Invalidate a user's cached pages; call before the write's commit"""
+    _ensure(cursor, db_type)
+    cursor.execute(sql(db_type, '''
+        INSERT INTO user_versions (user_id, version) VALUES (?, 1)
+        ON CONFLICT (user_id) DO UPDATE SET version = user_versions.version + 1
+    '''), (user_id,))
+
+
+def bump_owner(cursor, db_type, table, row_id):
+    """Bump the user owning an investments/withdrawals row"""
+    _ensure(cursor, db_type)
+    cursor.execute(sql(db_type, f'''
+        INSERT INTO user_versions (user_id, version)
+        SELECT user_id, 1 FROM {table} WHERE id = ? AND user_id IS NOT NULL
+        ON CONFLICT (user_id) DO UPDATE SET version = user_versions.version + 1
+    '''), (row_id,))
+
+
+def bump_referrer(cursor, db_type, referral_code):
+    """Bump the user whose referral code was just used"""
+    if not referral_code:
+        return
+    _ensure(cursor, db_type)
+    cursor.execute(sql(db_type, '''
+        INSERT INTO user_versions (user_id, version)
+        SELECT id, 1 FROM users WHERE referral_code = ?
+        ON CONFLICT (user_id) DO UPDATE SET version = user_versions.version + 1
+    '''), (referral_code,))
+
+
+def current_version(get_db_connection, user_id):
+    conn, db_type = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        _ensure(cursor, db_type)
+        cursor.execute(sql(db_type, 'SELECT version FROM user_versions WHERE user_id = ?'), (user_id,))
+        row = cursor.fetchone()
+    finally:
+        conn.close()
+    return row['version'] if row else 0
+
+
+def conditional(page, get_db_connection):
+    """Decorator: ETag a logged-in GET page by the user's version stamp"""
+    def decorator(view):
+        @wraps(view)
+        def wrapped(*args, **kwargs):
+            # Pages showing one-off flash messages must never be replayed from cache
+            if request.method != 'GET' or 'user_id' not in session or session.get('_flashes'):
+                return view(*args, **kwargs)
+
+            user_id = session['user_id']
+            etag = f"{page}-{user_id}-{current_version(get_db_connection, user_id)}-{DEPLOY_STAMP}"
+            if request.if_none_match.contains(etag):
+                response = make_response('', 304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return wrapped
+    return decorator
@@ -0,0 +1,214 @@
+"""
+Admin Events - live review queue pushed to admin.html over server-sent events
+
+Write paths call publish() inside their transaction, which appends a row
+to queue_events. Each worker runs one background poller that reads new
+rows (one small indexed query per interval, and only while an admin is
+connected) and fans them out to that worker's SSE subscribers, so an
+investment submitted on one gunicorn worker reaches admins connected to
+another. Publishing on the same worker wakes the poller immediately.
+
+Event ids are the queue_events ids, so a reconnecting EventSource sends
+Last-Event-ID and picks up exactly what it missed. On Postgres ids are
+handed out before commit, so a slow transaction can commit an id below
+one already sent: each poll re-reads the last OVERLAP ids and every
+subscriber skips the ones it has already delivered.
+
+Env: SSE_POLL_INTERVAL (seconds, default 1), SSE_MAX_SECONDS (stream
+lifetime before the browser reconnects, default 300)
+"""
+
+import json
+import os
+import queue
+import threading
+import time
+
+from db_pool import sql
+
+POLL_INTERVAL = float(os.environ.get('SSE_POLL_INTERVAL', 1))
+MAX_STREAM_SECONDS = int(os.environ.get('SSE_MAX_SECONDS', 300))
+KEEPALIVE_SECONDS = 15
+RETRY_MS = 3000
+WAKE_DELAY = 0.05
+REPLAY_LIMIT = 500          # most events replayed to one reconnecting client
+OVERLAP = 100               # ids re-read per poll (Postgres commits out of id order)
+SUBSCRIBER_BUFFER = 1000    # events queued for a slow client before it's dropped
+RETENTION_HOURS = 24
+
+
+def ensure_table(cursor, db_type):
+    if db_type == 'postgres':
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS queue_events (
+                id BIGSERIAL PRIMARY KEY,
+                kind VARCHAR(40) NOT NULL,
+                payload TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+    else:
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS queue_events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
+
+def publish(cursor, db_type, kind, payload):
+    """Record a queue change; call before the write's commit so it's atomic with it"""
+    cursor.execute(sql(db_type, 'INSERT INTO queue_events (kind, payload) VALUES (?, ?)'),
+                   (kind, json.dumps(payload, default=str, separators=(',', ':'))))
+    broker.wake()
+
+
+def format_event(event_id, kind, data):
+    return f"id: {event_id}\nevent: {kind}\ndata: {data}\n\n"
+
+
+class _Subscriber:
+    def __init__(self, last_id):
+        self.floor = last_id    # nothing at or below this is sent
+        self.last_id = last_id
+        self.sent = set()       # ids above the floor already delivered
+        self.queue = queue.Queue(SUBSCRIBER_BUFFER)
+        self.dropped = False
+
+    def since(self):
+        return max(self.floor, self.last_id - OVERLAP)
+
+    def wants(self, event_id):
+        return event_id > self.floor and event_id not in self.sent
+
+    def delivered(self, event_id):
+        self.sent.add(event_id)
+        self.last_id = max(self.last_id, event_id)
+        if len(self.sent) > 2 * OVERLAP:
+            self.floor = self.since()
+            self.sent = {i for i in self.sent if i > self.floor}
+
+
+class Broker:
+    def __init__(self, poll_interval=POLL_INTERVAL):
+        self.poll_interval = poll_interval
+        self.get_db_connection = None
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._last_prune = 0.0
+
+    def init(self, get_db_connection):
+        self.get_db_connection = get_db_connection
+
+    def reset(self):
+        """Fresh lock, subscribers and poller in a forked worker"""
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def wake(self):
+        self._wake.set()
+
+    def _latest_id(self):
+        conn, db_type = self.get_db_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('SELECT MAX(id) AS last_id FROM queue_events')
+            row = cursor.fetchone()
+        finally:
+            conn.close()
+        return (row['last_id'] if row else None) or 0
+
+    def subscribe(self, last_event_id=None):
+        latest = self._latest_id()
+        try:
+            start = int(last_event_id)
+        except (TypeError, ValueError):
+            start = latest
+        subscriber = _Subscriber(max(start, latest - REPLAY_LIMIT))
+        with self._lock:
+            self._subscribers.add(subscriber)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='sse-poller', daemon=True)
+                self._thread.start()
+        self.wake()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def _run(self):
+        while True:
+            if self._wake.wait(self.poll_interval):
+                time.sleep(WAKE_DELAY)  # publish() wakes us just before its commit
+            self._wake.clear()
+            with self._lock:
+                subscribers = list(self._subscribers)
+            if not subscribers:
+                continue
+            try:
+                self._poll(subscribers)
+            except Exception as e:
+                print(f"❌ SSE poll error: {str(e)}")
+
+    def _poll(self, subscribers):
+        since = min(s.since() for s in subscribers)
+        conn, db_type = self.get_db_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(sql(db_type, '''
+                SELECT id, kind, payload FROM queue_events WHERE id > ? ORDER BY id LIMIT ?
+            '''), (since, REPLAY_LIMIT))
+            rows = cursor.fetchall()
+            if time.time() - self._last_prune > 3600:
+                self._prune(cursor, db_type)
+                conn.commit()
+        finally:
+            conn.close()
+
+        for row in rows:
+            message = format_event(row['id'], row['kind'], row['payload'])
+            for subscriber in subscribers:
+                if not subscriber.wants(row['id']) or subscriber.dropped:
+                    continue
+                try:
+                    subscriber.queue.put_nowait(message)
+                    subscriber.delivered(row['id'])
+                except queue.Full:
+                    subscriber.dropped = True
+                    self.unsubscribe(subscriber)
+        if len(rows) == REPLAY_LIMIT:
+            self.wake()  # more to catch up on (the overlap is at most OVERLAP of them)
+
+    def _prune(self, cursor, db_type):
+        if db_type == 'postgres':
+            cursor.execute(f"DELETE FROM queue_events WHERE created_at < NOW() - INTERVAL '{RETENTION_HOURS} hours'")
+        else:
+            cursor.execute(f"DELETE FROM queue_events WHERE created_at < datetime('now', '-{RETENTION_HOURS} hours')")
+        self._last_prune = time.time()
+
+    def stream(self, last_event_id=None, max_seconds=MAX_STREAM_SECONDS):
+        """SSE body: replay since last_event_id, then live events until max_seconds"""
+        subscriber = self.subscribe(last_event_id)
+        deadline = time.monotonic() + max_seconds
+        try:
+            yield f"retry: {RETRY_MS}\n\n"
+            while not subscriber.dropped:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    yield subscriber.queue.get(timeout=min(KEEPALIVE_SECONDS, remaining))
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+        finally:
+            self.unsubscribe(subscriber)
+
+
+broker = Broker()
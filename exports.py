@@ -0,0 +1,203 @@
+"""
+Data Export - stream users, investments, withdrawals, daily earnings and
+earning runs as CSV or JSON Lines in constant memory
+
+Investments, withdrawals and daily earnings are read through
+archive.source(), so rows the archive job has moved out of the live
+tables are still exported.
+
+Rows are pulled in chunks (a named server-side cursor on PostgreSQL,
+fetchmany() on SQLite) and written out chunk by chunk, so an export
+starts immediately and never holds more than one chunk.
+
+Usage:
+    python exports.py investments --format csv --status active -o investments.csv
+    python exports.py withdrawals --format jsonl --since 2026-01-01 --payment_method easypaisa
+"""
+
+import argparse
+import csv
+import io
+import json
+import sys
+from datetime import date
+from itertools import count
+
+import archive
+
+CHUNK_SIZE = 2000
+
+# Exportable tables: columns (never the password hash), the date column used by
+# since/until, and which equality filters may be applied. earning_runs keeps
+# days as date ordinals (earnings.py): those columns are exported as dates and
+# since/until are compared as ordinals.
+TABLES = {
+    'users': {
+        'columns': ('id', 'username', 'email', 'balance', 'referral_code', 'referred_by',
+                    'whatsapp_number', 'easypaisa_number', 'jazzcash_number', 'created_at'),
+        'date_column': 'created_at',
+        'filters': ('referred_by',),
+    },
+    'investments': {
+        'columns': ('id', 'user_id', 'plan_name', 'amount', 'daily_income', 'total_return',
+                    'days_remaining', 'days_completed', 'screenshot_url', 'status',
+                    'created_at', 'approved_at'),
+        'date_column': 'created_at',
+        'filters': ('user_id', 'status', 'plan_name'),
+    },
+    'withdrawals': {
+        'columns': ('id', 'user_id', 'amount', 'payment_method', 'account_number', 'status',
+                    'created_at', 'processed_at'),
+        'date_column': 'created_at',
+        'filters': ('user_id', 'status', 'payment_method'),
+    },
+    'daily_earnings': {
+        'columns': ('id', 'investment_id', 'user_id', 'amount', 'earned_date'),
+        'date_column': 'earned_date',
+        'filters': ('user_id', 'investment_id'),
+    },
+    'earning_runs': {
+        'columns': ('id', 'investment_id', 'user_id', 'start_day', 'days', 'daily_amount'),
+        'date_column': 'start_day',
+        'ordinal_days': ('start_day',),
+        'filters': ('user_id', 'investment_id'),
+    },
+}
+
+FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+}
+
+_cursor_names = count(1)
+
+
+def build_query(table, filters, db_type, source=None):
+    """SELECT for one table (or `source`, a FROM clause standing for it) with
+    validated filters; returns (sql, params)"""
+    spec = TABLES[table]
+    placeholder = '%s' if db_type == 'postgres' else '?'
+    where = []
+    params = []
+    for name in spec['filters']:
+        value = filters.get(name)
+        if value not in (None, ''):
+            where.append(f"{name} = {placeholder}")
+            params.append(value)
+    for name, op in (('since', '>='), ('until', '<')):
+        value = filters.get(name)
+        if value:
+            if spec['date_column'] in spec.get('ordinal_days', ()):
+                value = date.fromisoformat(value).toordinal()
+            where.append(f"{spec['date_column']} {op} {placeholder}")
+            params.append(value)
+
+    sql = f"SELECT {', '.join(spec['columns'])} FROM {source or table} {table}"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY id"
+    return sql, params
+
+
+def iter_rows(conn, db_type, table, filters, chunk_size=CHUNK_SIZE):
+    """Yield lists of row tuples, chunk_size at a time"""
+    source = archive.source(conn, db_type, table) if table in archive.TABLES else table
+    sql, params = build_query(table, filters, db_type, source)
+    columns = TABLES[table]['columns']
+    ordinal = [c in TABLES[table].get('ordinal_days', ()) for c in columns]
+    if db_type == 'postgres':
+        # Named cursor = server-side portal; each fetchmany() is one FETCH round trip
+        cursor = conn.cursor(name=f'export_{table}_{next(_cursor_names)}')
+        cursor.itersize = chunk_size
+    else:
+        cursor = conn.cursor()
+    try:
+        cursor.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield [tuple(date.fromordinal(row[c]) if o else row[c] for c, o in zip(columns, ordinal))
+                   for row in rows]
+    finally:
+        cursor.close()
+
+
+def _csv_value(value):
+    return '' if value is None else value
+
+
+def iter_csv(columns, chunks):
+    """Encode chunks of rows as CSV, one bytes block per chunk"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for rows in chunks:
+        writer.writerows([_csv_value(v) for v in row] for row in rows)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def iter_jsonl(columns, chunks):
+    """Encode chunks of rows as JSON Lines, one bytes block per chunk"""
+    for rows in chunks:
+        lines = [json.dumps(dict(zip(columns, row)), default=str) for row in rows]
+        yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def stream_export(get_db_connection, table, fmt, filters, chunk_size=CHUNK_SIZE):
+    """Generator of encoded bytes for a whole export; owns its connection"""
+    if table not in TABLES:
+        raise ValueError(f"Unknown table: {table}")
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format: {fmt}")
+
+    encode = iter_csv if fmt == 'csv' else iter_jsonl
+    conn, db_type = get_db_connection()
+    try:
+        chunks = iter_rows(conn, db_type, table, filters, chunk_size)
+        yield from encode(TABLES[table]['columns'], chunks)
+    finally:
+        conn.close()
+
+
+def filters_from(mapping, table):
+    """Pick the filters a table accepts out of request args / CLI options"""
+    names = TABLES[table]['filters'] + ('since', 'until')
+    return {name: mapping.get(name) for name in names if mapping.get(name)}
+
+
+def main():
+    from app import get_db_connection
+
+    parser = argparse.ArgumentParser(description="Stream a table out as CSV or JSON Lines")
+    parser.add_argument('table', choices=sorted(TABLES))
+    parser.add_argument('--format', choices=sorted(FORMATS), default='csv')
+    parser.add_argument('-o', '--output', help="output file (default: stdout)")
+    parser.add_argument('--since', help="YYYY-MM-DD, inclusive")
+    parser.add_argument('--until', help="YYYY-MM-DD, exclusive")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    for name in sorted({f for spec in TABLES.values() for f in spec['filters']}):
+        parser.add_argument(f'--{name}')
+    args = parser.parse_args()
+
+    filters = filters_from(vars(args), args.table)
+    out = open(args.output, 'wb') if args.output else sys.stdout.buffer
+    written = 0
+    try:
+        for block in stream_export(get_db_connection, args.table, args.format, filters, args.chunk_size):
+            out.write(block)
+            written += len(block)
+    finally:
+        if args.output:
+            out.close()
+
+    if args.output:
+        print(f"✅ Exported {args.table} to {args.output} ({written / 1024:.1f} KB)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
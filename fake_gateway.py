@@ -0,0 +1,138 @@
+"""
+Fake Payout Gateway - local stand-in for the EasyPaisa / JazzCash payout APIs
+
+    python fake_gateway.py --port 8700 --latency 0.05 --fail-rate 0.05
+    PAYOUT_GATEWAY_URL=http://127.0.0.1:8700 python jobs.py worker --queues default,payouts
+
+Speaks the protocol payouts.HttpGateway expects:
+
+    POST /payouts {reference, method, account, amount}
+        200 {"status": "paid", "id": ...}
+        422 {"status": "rejected", "error": ...}   bad account / amount
+        503 {"error": ...}                         random, --fail-rate
+    GET  /payouts/<reference>                      stored outcome
+    GET  /stats                                    totals, duplicate sends
+
+A reference that already succeeded (or was rejected) returns the stored
+outcome again, like a real idempotent API. Nothing leaves the machine.
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeGateway:
+    def __init__(self, latency=0.05, fail_rate=0.0, reject_rate=0.0):
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.reject_rate = reject_rate
+        self.outcomes = {}      # reference -> (http status, body)
+        self.requests = 0
+        self.duplicates = 0
+        self.paid_total = 0.0
+        self._lock = threading.Lock()
+
+    def pay(self, data):
+        time.sleep(self.latency * random.uniform(0.5, 1.5))
+        reference = str(data.get('reference') or '')
+        with self._lock:
+            self.requests += 1
+            if reference in self.outcomes:
+                self.duplicates += 1
+                return self.outcomes[reference]
+        if random.random() < self.fail_rate:
+            return 503, {'error': 'Gateway temporarily unavailable'}
+
+        account = str(data.get('account') or '')
+        try:
+            amount = float(data.get('amount'))
+        except (TypeError, ValueError):
+            amount = 0
+        if not reference:
+            outcome = 422, {'status': 'rejected', 'error': 'Missing reference'}
+        elif not (account.isdigit() and len(account) == 11 and account.startswith('03')):
+            outcome = 422, {'status': 'rejected', 'error': 'Invalid mobile account number'}
+        elif amount <= 0:
+            outcome = 422, {'status': 'rejected', 'error': 'Invalid amount'}
+        elif random.random() < self.reject_rate:
+            outcome = 422, {'status': 'rejected', 'error': 'Account blocked by provider'}
+        else:
+            outcome = 200, {'status': 'paid', 'id': f"FG-{uuid.uuid4().hex[:12]}"}
+        with self._lock:
+            # First outcome for a reference wins, even if two sends raced
+            outcome = self.outcomes.setdefault(reference, outcome)
+            if outcome[0] == 200:
+                self.paid_total += amount
+        return outcome
+
+    def stats(self):
+        with self._lock:
+            paid = sum(1 for status, _ in self.outcomes.values() if status == 200)
+            return {'requests': self.requests, 'duplicates': self.duplicates, 'paid': paid,
+                    'rejected': len(self.outcomes) - paid, 'paid_total': round(self.paid_total, 2)}
+
+
+def make_handler(gateway):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def _send(self, status, body):
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_POST(self):
+            if self.path != '/payouts':
+                return self._send(404, {'error': 'Not found'})
+            try:
+                data = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            except ValueError:
+                return self._send(400, {'error': 'Invalid JSON'})
+            self._send(*gateway.pay(data))
+
+        def do_GET(self):
+            if self.path == '/stats':
+                return self._send(200, gateway.stats())
+            if self.path.startswith('/payouts/'):
+                outcome = gateway.outcomes.get(self.path[len('/payouts/'):])
+                return self._send(*(outcome or (404, {'error': 'Unknown reference'})))
+            self._send(404, {'error': 'Not found'})
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in payout gateway")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8700)
+    parser.add_argument('--latency', type=float, default=0.05, help="seconds per payout (average)")
+    parser.add_argument('--fail-rate', type=float, default=0.0, help="fraction answered with 503")
+    parser.add_argument('--reject-rate', type=float, default=0.0, help="fraction rejected outright")
+    args = parser.parse_args()
+
+    gateway = FakeGateway(args.latency, args.fail_rate, args.reject_rate)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(gateway))
+    server.daemon_threads = True
+    print(f"✅ Fake payout gateway on http://{args.host}:{args.port} "
+          f"(latency {args.latency}s, fail {args.fail_rate:.0%}, reject {args.reject_rate:.0%})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"📤 {json.dumps(gateway.stats())}")
+
+
+if __name__ == "__main__":
+    main()
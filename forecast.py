@@ -0,0 +1,333 @@
+"""
+Liability Forecast - how much the platform owes over the coming days
+Keeps active investments in NumPy arrays and computes payout obligations
+
+The forecast lives in each process. Hooks update it at once for writes
+made in this worker; everything else (other workers, the job worker's
+earnings accrual, day rollover) is picked up by comparing a one-row
+fingerprint of the active investments with the one it was loaded from,
+at most every FORECAST_REFRESH seconds, and reloading when it differs.
+
+Env: FORECAST_REFRESH (seconds, default 30)
+"""
+
+import os
+import threading
+import time
+from datetime import date, datetime
+
+import numpy as np
+
+HORIZONS = (30, 60, 90)
+MAX_HORIZON = max(HORIZONS)
+REFRESH_SECONDS = float(os.environ.get('FORECAST_REFRESH', 30))
+
+
+def _to_date(value):
+    """Parse approved_at from SQLite text or a Postgres datetime"""
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    try:
+        return datetime.fromisoformat(str(value)[:19]).date()
+    except ValueError:
+        return None
+
+
+class LiabilityForecast:
+    """Active investments as parallel arrays, one slot per investment.
+
+    Each investment pays `daily_income` once a day for `days_remaining`
+    days, starting the day after approval. Slots are added and removed
+    in O(1) (swap-with-last), so approvals and completions never force a
+    full reload; the summary is recomputed lazily in a few vectorized passes.
+    """
+
+    def __init__(self, capacity=1024):
+        self._lock = threading.Lock()
+        self._slots = {}  # investment_id -> slot index
+        self._ids = np.zeros(capacity, dtype=np.int64)
+        self._daily = np.zeros(capacity, dtype=np.float64)
+        self._remaining = np.zeros(capacity, dtype=np.int32)
+        self._start = np.zeros(capacity, dtype=np.int32)  # first payout day (ordinal)
+        self._plan = np.zeros(capacity, dtype=np.int32)
+        self._plan_codes = {}
+        self._plan_names = []
+        self._size = 0
+        self._version = 0
+        self._pending = {'count': 0, 'total': 0.0, 'by_method': {}}
+        self._cached = None
+        self._cached_key = None
+
+    def __len__(self):
+        return self._size
+
+    def _grow(self, needed):
+        capacity = len(self._ids)
+        if needed <= capacity:
+            return
+        new_capacity = max(needed, capacity * 2)
+        for name in ('_ids', '_daily', '_remaining', '_start', '_plan'):
+            old = getattr(self, name)
+            new = np.zeros(new_capacity, dtype=old.dtype)
+            new[:self._size] = old[:self._size]
+            setattr(self, name, new)
+
+    def _plan_code(self, plan_name):
+        code = self._plan_codes.get(plan_name)
+        if code is None:
+            code = len(self._plan_names)
+            self._plan_codes[plan_name] = code
+            self._plan_names.append(plan_name)
+        return code
+
+    def load(self, rows):
+        """Replace the whole state from (id, plan_name, daily_income, days_remaining, approved_date) rows"""
+        columns = np.array(list(rows), dtype=object).reshape(-1, 5)
+        n = len(columns)
+        today = date.today().toordinal()
+        with self._lock:
+            self._slots = None
+            self._size = 0
+            self._grow(n)
+            if n:
+                codes = np.fromiter((self._plan_code(p) for p in columns[:, 1]), dtype=np.int32, count=n)
+                # datetime64[D] counts days from 1970-01-01; shift to proleptic ordinals
+                approved_days = columns[:, 4].astype('datetime64[D]')
+                start = approved_days.astype(np.int64) + date(1970, 1, 1).toordinal() + 1
+                start[np.isnat(approved_days)] = today
+
+                self._ids[:n] = columns[:, 0].astype(np.int64)
+                self._daily[:n] = columns[:, 2].astype(np.float64)
+                self._remaining[:n] = columns[:, 3].astype(np.int32)
+                self._plan[:n] = codes
+                self._start[:n] = np.maximum(start, today)
+            self._size = n
+            self._version += 1
+
+    def _slot_index(self):
+        """investment_id -> slot, built on first incremental update after a bulk load"""
+        if self._slots is None:
+            self._slots = dict(zip(self._ids[:self._size].tolist(), range(self._size)))
+        return self._slots
+
+    @staticmethod
+    def _start_day(approved_at, today):
+        approved = _to_date(approved_at)
+        if approved is None:
+            return today
+        return max(today, approved.toordinal() + 1)
+
+    def add_investment(self, investment_id, plan_name, daily_income, days_remaining, approved_at=None):
+        """Add or replace one active investment"""
+        today = date.today().toordinal()
+        with self._lock:
+            slots = self._slot_index()
+            slot = slots.get(investment_id)
+            if slot is None:
+                self._grow(self._size + 1)
+                slot = self._size
+                self._size += 1
+                slots[investment_id] = slot
+            self._ids[slot] = investment_id
+            self._daily[slot] = float(daily_income)
+            self._remaining[slot] = int(days_remaining)
+            self._plan[slot] = self._plan_code(plan_name)
+            self._start[slot] = self._start_day(approved_at, today)
+            self._version += 1
+
+    def remove_investment(self, investment_id):
+        """Drop a completed or rejected investment"""
+        with self._lock:
+            slots = self._slot_index()
+            slot = slots.pop(investment_id, None)
+            if slot is None:
+                return
+            last = self._size - 1
+            if slot != last:
+                for name in ('_ids', '_daily', '_remaining', '_start', '_plan'):
+                    arr = getattr(self, name)
+                    arr[slot] = arr[last]
+                slots[int(self._ids[slot])] = slot
+            self._size = last
+            self._version += 1
+
+    def set_pending_withdrawals(self, rows):
+        """Record pending withdrawal exposure from (payment_method, count, total) rows"""
+        by_method = {}
+        for method, count, total in rows:
+            by_method[method] = {'count': int(count), 'total': round(float(total or 0), 2)}
+        with self._lock:
+            self._pending = {
+                'count': sum(m['count'] for m in by_method.values()),
+                'total': round(sum(m['total'] for m in by_method.values()), 2),
+                'by_method': by_method,
+            }
+            self._version += 1
+
+    def _daily_schedule(self, today):
+        """Per-day obligations for the next MAX_HORIZON days, total and per plan"""
+        n = self._size
+        n_plans = max(len(self._plan_names), 1)
+        if n == 0:
+            return np.zeros(MAX_HORIZON), np.zeros((n_plans, MAX_HORIZON))
+
+        daily = self._daily[:n]
+        first = np.clip(self._start[:n] - today, 0, MAX_HORIZON)
+        last = np.clip(first + self._remaining[:n], 0, MAX_HORIZON)
+        plan = self._plan[:n]
+
+        # Difference array: +daily at the first payout, -daily after the last,
+        # then a cumulative sum gives the amount due on every day.
+        width = MAX_HORIZON + 1
+        diff = np.bincount(plan * width + first, weights=daily, minlength=n_plans * width)
+        diff -= np.bincount(plan * width + last, weights=daily, minlength=n_plans * width)
+        per_plan = np.cumsum(diff.reshape(n_plans, width), axis=1)[:, :MAX_HORIZON]
+        return per_plan.sum(axis=0), per_plan
+
+    def summary(self):
+        """Forecast dict for the admin panel; memoized until state or date changes"""
+        today = date.today().toordinal()
+        with self._lock:
+            key = (self._version, today)
+            if self._cached_key == key:
+                return self._cached
+
+            total, per_plan = self._daily_schedule(today)
+            cumulative = np.cumsum(total)
+            plan_cumulative = np.cumsum(per_plan, axis=1)
+
+            horizons = {h: round(float(cumulative[h - 1]), 2) for h in HORIZONS}
+            plans = []
+            for code, name in enumerate(self._plan_names):
+                count = int(np.count_nonzero(self._plan[:self._size] == code))
+                if not count:
+                    continue
+                plans.append({
+                    'plan_name': name,
+                    'active': count,
+                    'daily': round(float(per_plan[code, 0]), 2),
+                    'horizons': {h: round(float(plan_cumulative[code, h - 1]), 2) for h in HORIZONS},
+                })
+            plans.sort(key=lambda p: p['horizons'][MAX_HORIZON], reverse=True)
+
+            result = {
+                'active_investments': self._size,
+                'due_today': round(float(total[0]), 2),
+                'daily_schedule': [round(float(v), 2) for v in total],
+                'horizons': horizons,
+                'plans': plans,
+                'pending_withdrawals': self._pending,
+                'total_exposure': round(horizons[MAX_HORIZON] + self._pending['total'], 2),
+            }
+            self._cached = result
+            self._cached_key = key
+            return result
+
+
+_forecast = None
+_forecast_lock = threading.Lock()
+_fingerprint = None
+_checked_at = 0.0
+
+
+def reset():
+    """Drop the cached forecast (a forked worker loads its own)"""
+    global _forecast, _forecast_lock, _fingerprint
+    _forecast = None
+    _forecast_lock = threading.Lock()
+    _fingerprint = None
+
+
+def _fetch_fingerprint(cursor):
+    """Changes whenever an investment is approved, credited, completed or
+    rejected, or a withdrawal is requested or processed"""
+    cursor.execute('''
+        SELECT COUNT(*) AS n, COALESCE(SUM(id), 0) AS ids, COALESCE(SUM(days_remaining), 0) AS days
+        FROM investments WHERE status = 'active' AND days_remaining > 0
+    ''')
+    row = cursor.fetchone()
+    return (int(row['n']), int(row['ids']), int(row['days']),
+            tuple(sorted((str(m), int(c), float(t or 0)) for m, c, t in _fetch_pending_withdrawals(cursor))))
+
+
+def _fetch_pending_withdrawals(cursor):
+    cursor.execute('''
+        SELECT payment_method, COUNT(*) AS count, SUM(amount) AS total
+        FROM withdrawals WHERE status = 'pending'
+        GROUP BY payment_method
+    ''')
+    return [(r['payment_method'], r['count'], r['total']) for r in cursor.fetchall()]
+
+
+def load_forecast(get_db_connection, with_fingerprint=False):
+    """Build a fresh forecast from the database"""
+    conn, db_type = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        fingerprint = _fetch_fingerprint(cursor)
+        cursor.execute('''
+            SELECT id, plan_name, daily_income, days_remaining, DATE(approved_at) AS approved_date
+            FROM investments WHERE status = 'active' AND days_remaining > 0
+        ''')
+        forecast = LiabilityForecast()
+        forecast.load(tuple(r) if db_type == 'sqlite' else tuple(r.values()) for r in cursor.fetchall())
+        forecast.set_pending_withdrawals(_fetch_pending_withdrawals(cursor))
+    finally:
+        conn.close()
+    return (forecast, fingerprint) if with_fingerprint else forecast
+
+
+def _changed(get_db_connection):
+    conn, _ = get_db_connection()
+    try:
+        return _fetch_fingerprint(conn.cursor()) != _fingerprint
+    finally:
+        conn.close()
+
+
+def get_forecast(get_db_connection):
+    """Return the process-wide forecast, loading it from the database on first
+    use and again whenever the database moved on without this worker"""
+    global _forecast, _fingerprint, _checked_at
+    with _forecast_lock:
+        now = time.monotonic()
+        if _forecast is not None and now - _checked_at > REFRESH_SECONDS:
+            _checked_at = now
+            if _changed(get_db_connection):
+                _forecast = None
+        if _forecast is None:
+            _forecast, _fingerprint = load_forecast(get_db_connection, with_fingerprint=True)
+            _checked_at = now
+            print(f"✅ Liability forecast loaded: {len(_forecast)} active investment(s)")
+        return _forecast
+
+
+def on_investment_approved(cursor, db_type, investment_id):
+    """Add a freshly approved investment to the cached forecast"""
+    if _forecast is None:
+        return
+    placeholder = '%s' if db_type == 'postgres' else '?'
+    cursor.execute(f'''
+        SELECT id, plan_name, daily_income, days_remaining, approved_at
+        FROM investments WHERE id = {placeholder}
+    ''', (investment_id,))
+    row = cursor.fetchone()
+    if row and row['days_remaining'] > 0:
+        _forecast.add_investment(row['id'], row['plan_name'], row['daily_income'],
+                                 row['days_remaining'], row['approved_at'])
+
+
+def on_investment_completed(investment_id):
+    """Remove a completed (or rejected) investment from the cached forecast"""
+    if _forecast is not None:
+        _forecast.remove_investment(investment_id)
+
+
+def on_withdrawals_changed(cursor):
+    """Refresh pending withdrawal exposure after a withdrawal is created or processed"""
+    if _forecast is not None:
+        _forecast.set_pending_withdrawals(_fetch_pending_withdrawals(cursor))
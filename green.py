@@ -0,0 +1,139 @@
+"""
+Green I/O - cooperative database and file access for gevent workers
+
+Under `WORKER_MODE=gevent` (see gunicorn.conf.py) one worker serves many
+requests as greenlets, which only works if nothing blocks the hub:
+
+- psycopg2 gets a wait callback, so queries yield while Postgres works
+- SQLite has no async API, so every call on a connection from
+  get_db_connection() runs in gevent's native threadpool
+- run_blocking() does the same for file writes (screenshot uploads)
+
+Outside gevent (sync workers, scripts, tests) enable() is never called
+and everything below is a plain pass-through.
+"""
+
+import os
+import sqlite3
+
+THREADPOOL_SIZE = int(os.environ.get('GREEN_THREADPOOL_SIZE', 10))
+
+enabled = False
+_threadpool = None
+
+
+def _gevent_wait_callback(conn, timeout=None):
+    """psycopg2 wait callback: poll the connection, parking the greenlet on its socket"""
+    from gevent.socket import wait_read, wait_write
+    from psycopg2 import OperationalError, extensions
+
+    while True:
+        state = conn.poll()
+        if state == extensions.POLL_OK:
+            break
+        elif state == extensions.POLL_READ:
+            wait_read(conn.fileno(), timeout=timeout)
+        elif state == extensions.POLL_WRITE:
+            wait_write(conn.fileno(), timeout=timeout)
+        else:
+            raise OperationalError(f"Bad result from poll: {state!r}")
+
+
+def enable():
+    """Switch to cooperative I/O; called once per gevent worker after fork"""
+    global enabled, _threadpool
+    from gevent import get_hub
+
+    _threadpool = get_hub().threadpool
+    _threadpool.maxsize = THREADPOOL_SIZE
+    try:
+        from psycopg2 import extensions
+        extensions.set_wait_callback(_gevent_wait_callback)
+        postgres = 'psycopg2 wait callback'
+    except ImportError:
+        postgres = 'no psycopg2'
+    enabled = True
+    print(f"✅ Green I/O enabled (pid {os.getpid()}): {postgres}, SQLite/file I/O on {THREADPOOL_SIZE} thread(s)")
+
+
+def run_blocking(func, *args, **kwargs):
+    """Call func off the event loop when running under gevent"""
+    if enabled:
+        return _threadpool.apply(func, args, kwargs)
+    return func(*args, **kwargs)
+
+
+class _GreenCursor:
+    __slots__ = ('_cursor',)
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, *args):
+        run_blocking(self._cursor.execute, *args)
+        return self
+
+    def executemany(self, *args):
+        run_blocking(self._cursor.executemany, *args)
+        return self
+
+    def fetchone(self):
+        return run_blocking(self._cursor.fetchone)
+
+    def fetchmany(self, *args):
+        return run_blocking(self._cursor.fetchmany, *args)
+
+    def fetchall(self):
+        return run_blocking(self._cursor.fetchall)
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    def __getattr__(self, name):
+        # lastrowid, rowcount, description, close, ...
+        return getattr(self._cursor, name)
+
+
+class _GreenConnection:
+    """sqlite3.Connection whose blocking calls run in the threadpool"""
+    __slots__ = ('_conn',)
+
+    def __init__(self, conn):
+        object.__setattr__(self, '_conn', conn)
+
+    def cursor(self):
+        return _GreenCursor(self._conn.cursor())
+
+    def execute(self, *args):
+        return self.cursor().execute(*args)
+
+    def commit(self):
+        run_blocking(self._conn.commit)
+
+    def rollback(self):
+        run_blocking(self._conn.rollback)
+
+    def close(self):
+        run_blocking(self._conn.close)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return run_blocking(self._conn.__exit__, *exc)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._conn, name, value)
+
+
+def connect_sqlite(path, timeout=30.0):
+    """sqlite3.connect(), threadpool-backed under gevent"""
+    if not enabled:
+        return sqlite3.connect(path, timeout=timeout)
+    # The connection is used from whichever pool thread picks up each call;
+    # a greenlet never runs two calls on it at once.
+    conn = run_blocking(sqlite3.connect, path, timeout=timeout, check_same_thread=False)
+    return _GreenConnection(conn)
@@ -0,0 +1,54 @@
+"""
+Gunicorn settings - loaded by `gunicorn app:app -c gunicorn.conf.py`
+
+WORKER_MODE       gthread (default), sync or gevent
+WEB_CONCURRENCY   worker processes (default 2)
+WORKER_THREADS    threads per gthread worker (default 8)
+WORKER_CONNECTIONS  concurrent requests per gevent worker (default 100)
+"""
+
+import os
+
+# 2 workers x 8 threads: best capacity per MB in bench_workers.py
+worker_mode = os.environ.get('WORKER_MODE', 'gthread')
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+
+if worker_mode == 'gevent':
+    worker_class = 'gevent'
+    worker_connections = int(os.environ.get('WORKER_CONNECTIONS', 100))
+elif worker_mode == 'gthread':
+    worker_class = 'gthread'
+    threads = int(os.environ.get('WORKER_THREADS', 8))
+else:
+    # A sync worker is killed after `timeout` seconds on one request, so
+    # admin SSE streams must end (and reconnect) well before that
+    os.environ.setdefault('SSE_MAX_SECONDS', '25')
+
+# Import the app once in the master and fork ready workers from it. gevent
+# must monkey-patch before the app's imports, so it loads per worker instead.
+preload_app = worker_mode != 'gevent'
+
+
+def when_ready(server):
+    """Master, after preload and before any worker is forked"""
+    if server.cfg.preload_app:
+        import app
+        app.ensure_schema()
+        app.release_connections()
+
+
+def post_fork(server, worker):
+    if server.cfg.preload_app:
+        import app
+        app.after_fork()
+
+
+def post_worker_init(worker):
+    if 'gevent' in worker.cfg.worker_class_str:
+        import green
+        green.enable()
+    if not worker.cfg.preload_app:
+        import app
+        app.ensure_schema()
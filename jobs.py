@@ -0,0 +1,358 @@
+"""
+Job Queue - durable background jobs stored in the app database
+
+    python jobs.py worker [--processes 2] [--queues default,payouts] [--batch 20]
+    python jobs.py stats
+
+Request handlers call enqueue() with their own cursor, so the job is
+committed together with the change that caused it and the response
+doesn't wait for the work. Worker processes claim jobs in batches -
+Postgres with FOR UPDATE SKIP LOCKED, SQLite with one atomic
+UPDATE ... RETURNING (the write lock makes the claim exclusive).
+
+- priorities (higher runs first) and delayed / scheduled run_at
+- retries with exponential backoff and jitter, then status 'failed'
+- visibility timeout: jobs held by a worker that died are requeued
+  once locked_until passes
+- @periodic schedules, enqueued by whichever worker wins a
+  compare-and-set on job_schedules, so each run happens once
+
+Tasks are registered with @task / @periodic (see tasks.py) and called
+with their JSON payload dict.
+"""
+
+import argparse
+import json
+import os
+import random
+import signal
+import socket
+import time
+import traceback
+
+from db_pool import sql
+
+BATCH_SIZE = int(os.environ.get('JOBS_BATCH_SIZE', 20))
+VISIBILITY_TIMEOUT = int(os.environ.get('JOBS_VISIBILITY_TIMEOUT', 300))
+POLL_INTERVAL = float(os.environ.get('JOBS_POLL_INTERVAL', 0.5))
+BACKOFF_BASE = 5            # seconds before the first retry
+BACKOFF_MAX = 3600
+TICK_SECONDS = 1.0          # schedules and visibility reaper
+
+TASKS = {}       # name -> (function, options)
+SCHEDULES = {}   # name -> (task name, every seconds, payload)
+
+DEFAULT_OPTIONS = {'queue': 'default', 'priority': 0, 'max_attempts': 5}
+
+
+def _in(db_type, values):
+    placeholder = '%s' if db_type == 'postgres' else '?'
+    return ', '.join([placeholder] * len(values))
+
+
+def task(name, **options):
+    """Register a job handler: @jobs.task('payouts.dispatch', queue='payouts', max_attempts=8)"""
+    def decorator(func):
+        TASKS[name] = (func, dict(DEFAULT_OPTIONS, **options))
+        return func
+    return decorator
+
+
+def periodic(name, every, payload=None, **options):
+    """Register a handler and run it every `every` seconds"""
+    def decorator(func):
+        task(name, **options)(func)
+        SCHEDULES[name] = (name, every, payload or {})
+        return func
+    return decorator
+
+
+def ensure_table(cursor, db_type):
+    if db_type == 'postgres':
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                id BIGSERIAL PRIMARY KEY,
+                queue VARCHAR(50) NOT NULL DEFAULT 'default',
+                task VARCHAR(100) NOT NULL,
+                payload TEXT NOT NULL DEFAULT '{}',
+                priority INTEGER NOT NULL DEFAULT 0,
+                status VARCHAR(10) NOT NULL DEFAULT 'queued',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                max_attempts INTEGER NOT NULL DEFAULT 5,
+                run_at DOUBLE PRECISION NOT NULL,
+                locked_until DOUBLE PRECISION,
+                locked_by VARCHAR(100),
+                last_error TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                finished_at DOUBLE PRECISION
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS job_schedules (
+                name VARCHAR(100) PRIMARY KEY,
+                next_run DOUBLE PRECISION NOT NULL
+            )
+        ''')
+    else:
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY,
+                queue TEXT NOT NULL DEFAULT 'default',
+                task TEXT NOT NULL,
+                payload TEXT NOT NULL DEFAULT '{}',
+                priority INTEGER NOT NULL DEFAULT 0,
+                status TEXT NOT NULL DEFAULT 'queued',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                max_attempts INTEGER NOT NULL DEFAULT 5,
+                run_at REAL NOT NULL,
+                locked_until REAL,
+                locked_by TEXT,
+                last_error TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                finished_at REAL
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS job_schedules (
+                name TEXT PRIMARY KEY,
+                next_run REAL NOT NULL
+            )
+        ''')
+    # Partial indexes keep the claim and reaper scans to live jobs only
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_jobs_ready ON jobs (queue, priority DESC, run_at)
+        WHERE status = 'queued'
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_jobs_running ON jobs (locked_until) WHERE status = 'running'
+    ''')
+
+
+def _job_row(name, payload, queue, priority, delay, run_at, max_attempts):
+    options = TASKS[name][1] if name in TASKS else DEFAULT_OPTIONS
+    return (
+        queue or options['queue'],
+        name,
+        json.dumps(payload or {}, default=str, separators=(',', ':')),
+        options['priority'] if priority is None else priority,
+        options['max_attempts'] if max_attempts is None else max_attempts,
+        run_at if run_at is not None else time.time() + delay,
+    )
+
+
+_INSERT = 'INSERT INTO jobs (queue, task, payload, priority, max_attempts, run_at) VALUES (?, ?, ?, ?, ?, ?)'
+
+
+def enqueue(cursor, db_type, name, payload=None, queue=None, priority=None, delay=0,
+            run_at=None, max_attempts=None):
+    """Add a job in the caller's transaction; it runs once that commits"""
+    cursor.execute(sql(db_type, _INSERT), _job_row(name, payload, queue, priority, delay, run_at, max_attempts))
+
+
+def enqueue_many(cursor, db_type, name, payloads, queue=None, priority=None, delay=0, max_attempts=None):
+    rows = [_job_row(name, p, queue, priority, delay, None, max_attempts) for p in payloads]
+    cursor.executemany(sql(db_type, _INSERT), rows)
+
+
+def backoff(attempts):
+    """Seconds before retry number `attempts`: exponential, with jitter"""
+    return min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempts - 1)) * random.uniform(0.5, 1.0)
+
+
+class Worker:
+    def __init__(self, get_db_connection, queues=('default',), batch_size=BATCH_SIZE,
+                 visibility_timeout=VISIBILITY_TIMEOUT, poll_interval=POLL_INTERVAL):
+        self.get_db_connection = get_db_connection
+        self.queues = tuple(queues)
+        self.batch_size = batch_size
+        self.visibility_timeout = visibility_timeout
+        self.poll_interval = poll_interval
+        self.name = f"{socket.gethostname()}:{os.getpid()}"
+        self.processed = 0
+        self.failed = 0
+        self._stopping = False
+        self._next_tick = 0.0
+
+    def stop(self, *_):
+        self._stopping = True
+
+    def claim(self):
+        now = time.time()
+        conn, db_type = self.get_db_connection()
+        try:
+            cursor = conn.cursor()
+            skip_locked = 'FOR UPDATE SKIP LOCKED' if db_type == 'postgres' else ''
+            cursor.execute(sql(db_type, f'''
+                UPDATE jobs SET status = 'running', attempts = attempts + 1, locked_by = ?, locked_until = ?
+                WHERE id IN (
+                    SELECT id FROM jobs
+                    WHERE status = 'queued' AND queue IN ({_in(db_type, self.queues)}) AND run_at <= ?
+                    ORDER BY priority DESC, run_at
+                    LIMIT ? {skip_locked}
+                )
+                RETURNING id, task, payload, attempts, max_attempts
+            '''), (self.name, now + self.visibility_timeout, *self.queues, now, self.batch_size))
+            jobs = [dict(row) for row in cursor.fetchall()]
+            conn.commit()
+        finally:
+            conn.close()
+        jobs.sort(key=lambda job: job['id'])
+        return jobs
+
+    def _finish(self, done, retries):
+        now = time.time()
+        conn, db_type = self.get_db_connection()
+        try:
+            cursor = conn.cursor()
+            if done:
+                cursor.execute(sql(db_type, f'''
+                    UPDATE jobs SET status = 'done', finished_at = ?, locked_by = NULL, locked_until = NULL
+                    WHERE id IN ({_in(db_type, done)}) AND locked_by = ?
+                '''), (now, *done, self.name))
+            if retries:
+                cursor.executemany(sql(db_type, '''
+                    UPDATE jobs SET status = ?, run_at = ?, last_error = ?, finished_at = ?,
+                                    locked_by = NULL, locked_until = NULL
+                    WHERE id = ? AND locked_by = ?
+                '''), [(status, run_at, error, now if status == 'failed' else None, job_id, self.name)
+                       for job_id, status, run_at, error in retries])
+            conn.commit()
+        finally:
+            conn.close()
+
+    def run_once(self):
+        """Claim and run one batch; returns the number of jobs claimed"""
+        jobs = self.claim()
+        done, retries = [], []
+        for job in jobs:
+            entry = TASKS.get(job['task'])
+            try:
+                if entry is None:
+                    raise LookupError(f"Unknown task '{job['task']}'")
+                entry[0](json.loads(job['payload']))
+                done.append(job['id'])
+                self.processed += 1
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+                final = entry is None or job['attempts'] >= job['max_attempts']
+                retries.append((job['id'], 'failed' if final else 'queued',
+                                time.time() + backoff(job['attempts']), traceback.format_exc()[-2000:]))
+                self.failed += 1
+                print(f"❌ Job #{job['id']} {job['task']} failed (attempt {job['attempts']}/"
+                      f"{job['max_attempts']}{', giving up' if final else ''}): {error}")
+        if jobs:
+            self._finish(done, retries)
+        return len(jobs)
+
+    def tick(self):
+        """Enqueue due periodic jobs and requeue jobs whose worker vanished"""
+        now = time.time()
+        conn, db_type = self.get_db_connection()
+        try:
+            cursor = conn.cursor()
+            for schedule, (name, every, payload) in SCHEDULES.items():
+                cursor.execute(sql(db_type, '''
+                    INSERT INTO job_schedules (name, next_run) VALUES (?, ?) ON CONFLICT (name) DO NOTHING
+                '''), (schedule, now))
+                cursor.execute(sql(db_type, '''
+                    UPDATE job_schedules SET next_run = ? WHERE name = ? AND next_run <= ?
+                '''), (now + every, schedule, now))
+                if cursor.rowcount == 1:
+                    enqueue(cursor, db_type, name, payload)
+            cursor.execute(sql(db_type, '''
+                UPDATE jobs SET
+                    status = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'queued' END,
+                    last_error = 'visibility timeout (worker ' || locked_by || ' stopped responding)',
+                    locked_by = NULL, locked_until = NULL, run_at = ?
+                WHERE status = 'running' AND locked_until < ?
+            '''), (now, now))
+            if cursor.rowcount:
+                print(f"⚠️  Requeued {cursor.rowcount} job(s) past their visibility timeout")
+            conn.commit()
+        finally:
+            conn.close()
+
+    def run(self, until_empty=False):
+        idle = self.poll_interval
+        while not self._stopping:
+            if time.monotonic() >= self._next_tick:
+                self._next_tick = time.monotonic() + TICK_SECONDS
+                try:
+                    self.tick()
+                except Exception as e:
+                    print(f"❌ Scheduler tick failed: {e}")
+            try:
+                claimed = self.run_once()
+            except Exception as e:
+                print(f"❌ Claim failed: {e}")
+                claimed = 0
+            if claimed:
+                idle = 0.01
+                continue
+            if until_empty:
+                break
+            time.sleep(idle)
+            idle = min(self.poll_interval, idle * 2)  # back off while the queue is empty
+
+
+def stats(get_db_connection):
+    conn, db_type = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT queue, task, status, COUNT(*) AS count FROM jobs
+            GROUP BY queue, task, status ORDER BY queue, task, status
+        ''')
+        return [dict(row) for row in cursor.fetchall()]
+    finally:
+        conn.close()
+
+
+def _worker_process(queues, batch_size):
+    from app import get_db_connection
+    import tasks  # noqa: F401  registers the app's tasks and schedules
+
+    worker = Worker(get_db_connection, queues, batch_size)
+    signal.signal(signal.SIGTERM, worker.stop)
+    signal.signal(signal.SIGINT, worker.stop)
+    print(f"✅ Job worker {worker.name} started (queues: {', '.join(queues)})")
+    worker.run()
+    print(f"✅ Job worker {worker.name} stopped: {worker.processed} done, {worker.failed} failed")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Background job queue")
+    sub = parser.add_subparsers(dest='command', required=True)
+    run = sub.add_parser('worker', help="run worker processes")
+    run.add_argument('--processes', type=int, default=int(os.environ.get('JOBS_PROCESSES', 2)))
+    run.add_argument('--queues', default=os.environ.get('JOBS_QUEUES', 'default'))
+    run.add_argument('--batch', type=int, default=BATCH_SIZE)
+    sub.add_parser('stats', help="job counts by queue, task and status")
+    args = parser.parse_args()
+
+    if args.command == 'stats':
+        from app import get_db_connection
+        for row in stats(get_db_connection):
+            print(f"{row['queue']:<12} {row['task']:<30} {row['status']:<8} {row['count']}")
+        return
+
+    import multiprocessing
+    queues = [q.strip() for q in args.queues.split(',') if q.strip()]
+    processes = [multiprocessing.Process(target=_worker_process, args=(queues, args.batch))
+                 for _ in range(args.processes)]
+    for p in processes:
+        p.start()
+
+    def shutdown(*_):
+        for p in processes:
+            p.terminate()  # SIGTERM: each worker finishes its current batch
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+    for p in processes:
+        p.join()
+
+
+if __name__ == "__main__":
+    # Go through the importable module: tasks.py registers into `jobs`, not `__main__`
+    import jobs
+    jobs.main()
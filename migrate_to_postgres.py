@@ -0,0 +1,310 @@
+"""
+SQLite -> PostgreSQL Migration
+Copies database/users.db into the Railway PostgreSQL database
+
+- streams each table out of SQLite in id order (keyset pages, constant memory)
+- loads every page with a single COPY FROM STDIN instead of per-row INSERTs
+- records progress in the same transaction as each page, so an interrupted
+  run picks up exactly where it stopped
+- copies database/archive.db too, when there is one: each table archive.py
+  moved rows into lands in <table>_archive, month partitions created first
+- resets SERIAL sequences past live and archived ids and verifies row
+  counts + checksums per table
+
+Usage:
+    DATABASE_URL=postgresql://... python migrate_to_postgres.py
+    DATABASE_URL=postgresql://... python migrate_to_postgres.py --verify-only
+    DATABASE_URL=postgresql://... python migrate_to_postgres.py --restart   # forget progress, truncate targets
+"""
+
+import argparse
+import hashlib
+import io
+import os
+import sqlite3
+import sys
+import time
+from datetime import date, datetime
+from decimal import ROUND_HALF_UP, Decimal
+
+SQLITE_PATH = 'database/users.db'
+ARCHIVE_PATH = os.environ.get('ARCHIVE_DB', os.path.join('database', 'archive.db'))
+BATCH_SIZE = 50000
+
+# Parents before children so foreign keys hold at every commit
+TABLES = ('users', 'investments', 'withdrawals', 'daily_earnings', 'earning_runs')
+# Tables archive.py moves rows out of (SQLite: same name in the archive file)
+ARCHIVED = ('investments', 'withdrawals', 'daily_earnings')
+
+
+def connect_postgres():
+    import psycopg2
+
+    database_url = os.environ.get('DATABASE_URL')
+    if not database_url:
+        print("❌ DATABASE_URL is not set!")
+        sys.exit(1)
+    return psycopg2.connect(database_url)
+
+
+def ensure_schema(pg):
+    """Create the app schema (same DDL as app.init_db) and the progress table"""
+    from app import init_db
+
+    init_db()
+    cursor = pg.cursor()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS migration_progress (
+            table_name VARCHAR(50) PRIMARY KEY,
+            last_id INTEGER NOT NULL DEFAULT 0,
+            rows_copied BIGINT NOT NULL DEFAULT 0,
+            finished BOOLEAN NOT NULL DEFAULT FALSE
+        )
+    ''')
+    pg.commit()
+
+
+def target_columns(pg, table):
+    """Postgres columns of a table in order, as (name, data_type)"""
+    cursor = pg.cursor()
+    cursor.execute('''
+        SELECT column_name, data_type FROM information_schema.columns
+        WHERE table_name = %s ORDER BY ordinal_position
+    ''', (table,))
+    return cursor.fetchall()
+
+
+def shared_columns(lite, pg, source, target):
+    """Columns present on both sides; extra legacy SQLite columns are ignored"""
+    present = {d[0] for d in lite.execute(f"SELECT * FROM {source} LIMIT 0").description}
+    columns = [(name, kind) for name, kind in target_columns(pg, target) if name in present]
+    if not columns or columns[0][0] != 'id':
+        raise RuntimeError(f"{target}: expected 'id' as the first shared column")
+    return columns
+
+
+def copy_plan(lite):
+    """(SQLite table, Postgres table) pairs: the live tables, then the archive's"""
+    present = {row[0] for row in lite.execute("SELECT name FROM main.sqlite_master WHERE type = 'table'")}
+    plan = [(table, table) for table in TABLES if table in present]
+    if any(row[1] == 'archive' for row in lite.execute('PRAGMA database_list')):
+        present = {row[0] for row in lite.execute("SELECT name FROM archive.sqlite_master WHERE type = 'table'")}
+        plan += [(f'archive.{table}', f'{table}_archive') for table in ARCHIVED if table in present]
+    return plan
+
+
+def _copy_text(value):
+    """One value in COPY text format"""
+    if value is None:
+        return '\\N'
+    if isinstance(value, bytes):
+        value = value.decode('utf-8', 'replace')
+    return (str(value).replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+
+def _canonical(value, kind):
+    """Normalize a value so SQLite REAL/TEXT and Postgres DECIMAL/TIMESTAMP compare equal"""
+    if value is None:
+        return ''
+    if kind in ('numeric', 'double precision', 'real'):
+        # NUMERIC(10,2) rounds the decimal text half-up (100.125 -> 100.13);
+        # formatting the binary float would round 100.125 down
+        return str(Decimal(str(value)).quantize(Decimal('0.01'), ROUND_HALF_UP))
+    if kind in ('integer', 'bigint', 'smallint'):
+        return str(int(value))
+    if kind.startswith('timestamp'):
+        if not isinstance(value, datetime):
+            value = datetime.fromisoformat(str(value))
+        return value.replace(tzinfo=None).isoformat(' ')
+    if kind == 'date':
+        if isinstance(value, datetime):
+            value = value.date()
+        if not isinstance(value, date):
+            value = date.fromisoformat(str(value)[:10])
+        return value.isoformat()
+    return str(value)
+
+
+def load_progress(pg):
+    cursor = pg.cursor()
+    cursor.execute('SELECT table_name, last_id, rows_copied, finished FROM migration_progress')
+    return {row[0]: {'last_id': row[1], 'rows': row[2], 'finished': row[3]} for row in cursor.fetchall()}
+
+
+def copy_table(lite, pg, source, target, progress, batch_size):
+    import archive
+
+    columns = shared_columns(lite, pg, source, target)
+    names = [name for name, _ in columns]
+    state = progress.get(target, {'last_id': 0, 'rows': 0, 'finished': False})
+    if state['finished']:
+        print(f"⏭️  {target}: already migrated ({state['rows']} rows)")
+        return
+
+    cursor = pg.cursor()
+    if state['last_id'] == 0:
+        cursor.execute(f'SELECT EXISTS (SELECT 1 FROM {target})')
+        if cursor.fetchone()[0]:
+            print(f"❌ {target}: target table already has rows and no progress is recorded.")
+            print("   Run with --restart to truncate the targets and start over.")
+            sys.exit(1)
+
+    # Archive targets are partitioned by month: rows COPY'd into the default
+    # partition would stop archive.py creating their month's partition later
+    partition = None
+    if target != source:
+        table = target[:-len('_archive')]
+        partition = (table, names.index(archive.TABLES[table][0]))
+
+    select = f"SELECT {', '.join(names)} FROM {source} WHERE id > ? ORDER BY id LIMIT ?"
+    copy_sql = f"COPY {target} ({', '.join(names)}) FROM STDIN"
+    last_id, copied = state['last_id'], state['rows']
+    started = time.time()
+
+    while True:
+        rows = lite.execute(select, (last_id, batch_size)).fetchall()
+        if not rows:
+            break
+
+        buffer = io.StringIO()
+        buffer.writelines('\t'.join(_copy_text(v) for v in row) + '\n' for row in rows)
+        buffer.seek(0)
+
+        last_id = rows[-1][0]
+        copied += len(rows)
+        if partition:
+            archive.ensure_partitions(cursor, partition[0], [row[partition[1]] for row in rows])
+        cursor.copy_expert(copy_sql, buffer)
+        cursor.execute('''
+            INSERT INTO migration_progress (table_name, last_id, rows_copied)
+            VALUES (%s, %s, %s)
+            ON CONFLICT (table_name) DO UPDATE
+            SET last_id = EXCLUDED.last_id, rows_copied = EXCLUDED.rows_copied
+        ''', (target, last_id, copied))
+        pg.commit()  # the page and its progress marker land together
+
+        rate = (copied - state['rows']) / max(time.time() - started, 1e-6)
+        print(f"   {target}: {copied} rows (up to id {last_id}, {rate:,.0f} rows/s)")
+
+    cursor.execute('''
+        INSERT INTO migration_progress (table_name, last_id, rows_copied, finished)
+        VALUES (%s, %s, %s, TRUE)
+        ON CONFLICT (table_name) DO UPDATE SET finished = TRUE
+    ''', (target, last_id, copied))
+    pg.commit()
+    print(f"✅ {target}: {copied} rows copied")
+
+
+def reset_sequence(pg, table):
+    """Point the SERIAL sequence past the highest copied id, archived ones included"""
+    high = f'(SELECT MAX(id) FROM {table})'
+    if table in ARCHIVED:
+        high = f'GREATEST({high}, (SELECT MAX(id) FROM {table}_archive))'
+    cursor = pg.cursor()
+    cursor.execute(f'''
+        SELECT setval(pg_get_serial_sequence('{table}', 'id'), COALESCE({high}, 1), {high} IS NOT NULL)
+    ''')
+    pg.commit()
+
+
+def table_checksum(rows, kinds):
+    """(row count, md5) over canonicalized rows in id order"""
+    digest = hashlib.md5()
+    count = 0
+    for row in rows:
+        line = '\x1f'.join(_canonical(v, k) for v, k in zip(row, kinds))
+        digest.update(line.encode('utf-8'))
+        digest.update(b'\x1e')
+        count += 1
+    return count, digest.hexdigest()
+
+
+def _iter_sqlite(lite, table, names, batch_size):
+    last_id = 0
+    select = f"SELECT {', '.join(names)} FROM {table} WHERE id > ? ORDER BY id LIMIT ?"
+    while True:
+        rows = lite.execute(select, (last_id, batch_size)).fetchall()
+        if not rows:
+            return
+        yield from rows
+        last_id = rows[-1][0]
+
+
+def _iter_postgres(pg, table, names, batch_size):
+    cursor = pg.cursor(name=f'verify_{table}')
+    cursor.itersize = batch_size
+    cursor.execute(f"SELECT {', '.join(names)} FROM {table} ORDER BY id")
+    yield from cursor
+    cursor.close()
+
+
+def verify_table(lite, pg, source, target, batch_size):
+    columns = shared_columns(lite, pg, source, target)
+    names = [name for name, _ in columns]
+    kinds = [kind for _, kind in columns]
+
+    before = table_checksum(_iter_sqlite(lite, source, names, batch_size), kinds)
+    after = table_checksum(_iter_postgres(pg, target, names, batch_size), kinds)
+    pg.commit()
+
+    if before == after:
+        print(f"✅ {target}: {before[0]} rows, checksum {before[1]}")
+        return True
+    print(f"❌ {target}: SQLite {before[0]} rows / {before[1]}  vs  PostgreSQL {after[0]} rows / {after[1]}")
+    return False
+
+
+def restart(pg):
+    cursor = pg.cursor()
+    cursor.execute('DELETE FROM migration_progress')
+    targets = [f'{table}_archive' for table in ARCHIVED] + list(reversed(TABLES))
+    cursor.execute(f"TRUNCATE {', '.join(targets)} RESTART IDENTITY CASCADE")
+    pg.commit()
+    print("🔧 Progress cleared and target tables truncated")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Copy the SQLite database into PostgreSQL")
+    parser.add_argument('--sqlite', default=SQLITE_PATH)
+    parser.add_argument('--archive', default=ARCHIVE_PATH, help="SQLite archive file, copied when it exists")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--restart', action='store_true', help="truncate targets and start over")
+    parser.add_argument('--verify-only', action='store_true')
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("SQLITE -> POSTGRESQL MIGRATION")
+    print("=" * 60)
+
+    lite = sqlite3.connect(args.sqlite)
+    if os.path.exists(args.archive):
+        lite.execute('ATTACH DATABASE ? AS archive', (args.archive,))
+    plan = copy_plan(lite)
+    pg = connect_postgres()
+    ensure_schema(pg)
+
+    if args.restart:
+        restart(pg)
+
+    started = time.time()
+    if not args.verify_only:
+        progress = load_progress(pg)
+        for source, target in plan:
+            copy_table(lite, pg, source, target, progress, args.batch_size)
+        for table in TABLES:
+            reset_sequence(pg, table)
+
+    print("\n🔍 Verifying...")
+    ok = all([verify_table(lite, pg, source, target, args.batch_size) for source, target in plan])
+
+    lite.close()
+    pg.close()
+    print("=" * 60)
+    print(f"{'✅ MIGRATION VERIFIED' if ok else '❌ VERIFICATION FAILED'} in {time.time() - started:.1f}s")
+    print("=" * 60)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
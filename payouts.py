@@ -0,0 +1,375 @@
+"""
+Payouts - batched EasyPaisa / JazzCash transfers for approved withdrawals
+
+    python payouts.py batch      # group pending payouts into batches now
+    python payouts.py status     # batches and item counts by state
+
+approve_withdrawal() adds a payout_items row in the same transaction when
+the withdrawal's method has a gateway. The 'payouts.batch' job (every
+PAYOUT_BATCH_INTERVAL seconds) groups unbatched items per payment method
+into payout_batches of up to PAYOUT_BATCH_SIZE and enqueues one
+'payouts.dispatch' job per batch on the 'payouts' queue. Dispatch sends
+the items to that method's gateway from PAYOUT_CONCURRENCY threads and
+records each result as it arrives:
+
+    pending -> paid            gateway confirmed, gateway_ref kept
+            -> failed          gateway rejected it (bad account...) or
+                               PAYOUT_MAX_ATTEMPTS transient errors
+            -> pending         timeout / 5xx: the dispatch job fails and
+                               the job queue retries it with backoff
+
+Every send carries the reference 'wd-<withdrawal id>', and gateways must
+treat it as an idempotency key, so a retry after a timeout can never pay
+twice. Methods without a configured gateway are not batched; those
+withdrawals are paid by hand as before.
+
+Env: PAYOUT_GATEWAY_URL (all methods) or PAYOUT_GATEWAY_URL_EASYPAISA /
+PAYOUT_GATEWAY_URL_JAZZCASH, PAYOUT_GATEWAY_KEY, PAYOUT_BATCH_SIZE
+(default 500), PAYOUT_CONCURRENCY (default 16), PAYOUT_MAX_ATTEMPTS
+(default 6), PAYOUT_BATCH_INTERVAL (default 60). fake_gateway.py is a
+local stand-in gateway for testing.
+"""
+
+import os
+import sys
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+
+import jobs
+from db_pool import sql
+
+METHODS = ('easypaisa', 'jazzcash')
+BATCH_SIZE = int(os.environ.get('PAYOUT_BATCH_SIZE', 500))
+CONCURRENCY = int(os.environ.get('PAYOUT_CONCURRENCY', 16))
+MAX_ATTEMPTS = int(os.environ.get('PAYOUT_MAX_ATTEMPTS', 6))
+BATCH_INTERVAL = int(os.environ.get('PAYOUT_BATCH_INTERVAL', 60))
+REQUEST_TIMEOUT = 15
+COMMIT_EVERY = 50           # results recorded per transaction while dispatching
+
+# status: 'paid', 'failed' (permanent) or 'retry' (transient, safe to resend)
+PayoutResult = namedtuple('PayoutResult', 'status gateway_ref error')
+
+
+def ensure_table(cursor, db_type):
+    if db_type == 'postgres':
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS payout_batches (
+                id SERIAL PRIMARY KEY,
+                payment_method VARCHAR(20) NOT NULL,
+                status VARCHAR(20) NOT NULL DEFAULT 'dispatching',
+                item_count INTEGER NOT NULL DEFAULT 0,
+                total DECIMAL(12,2) NOT NULL DEFAULT 0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                settled_at TIMESTAMP
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS payout_items (
+                id SERIAL PRIMARY KEY,
+                withdrawal_id INTEGER NOT NULL UNIQUE REFERENCES withdrawals(id),
+                batch_id INTEGER REFERENCES payout_batches(id),
+                payment_method VARCHAR(20) NOT NULL,
+                account_number VARCHAR(50) NOT NULL,
+                amount DECIMAL(10,2) NOT NULL,
+                status VARCHAR(20) NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                gateway_ref VARCHAR(100),
+                last_error TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                settled_at TIMESTAMP
+            )
+        ''')
+    else:
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS payout_batches (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                payment_method TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'dispatching',
+                item_count INTEGER NOT NULL DEFAULT 0,
+                total REAL NOT NULL DEFAULT 0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                settled_at TIMESTAMP
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS payout_items (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                withdrawal_id INTEGER NOT NULL UNIQUE,
+                batch_id INTEGER,
+                payment_method TEXT NOT NULL,
+                account_number TEXT NOT NULL,
+                amount REAL NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                gateway_ref TEXT,
+                last_error TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                settled_at TIMESTAMP,
+                FOREIGN KEY (withdrawal_id) REFERENCES withdrawals(id)
+            )
+        ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_payout_items_unbatched ON payout_items (payment_method, id)
+        WHERE batch_id IS NULL
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_payout_items_batch ON payout_items (batch_id, status)')
+
+
+def add_withdrawal(cursor, db_type, withdrawal_id):
+    """Queue an approved withdrawal for payout (in the approval's transaction);
+    a method with no gateway gets no item, it is paid by hand"""
+    methods = [method for method in METHODS if get_gateway(method) is not None]
+    if not methods:
+        return
+    cursor.execute(sql(db_type, f'''
+        INSERT INTO payout_items (withdrawal_id, payment_method, account_number, amount)
+        SELECT id, payment_method, account_number, amount FROM withdrawals
+        WHERE id = ? AND payment_method IN ({', '.join('?' * len(methods))})
+        ON CONFLICT (withdrawal_id) DO NOTHING
+    '''), (withdrawal_id, *methods))
+
+
+def reference(item):
+    return f"wd-{item['withdrawal_id']}"
+
+
+class Gateway:
+    """A payout provider. pay() must be idempotent on `reference`: sending the
+    same reference twice returns the first outcome instead of paying again."""
+
+    def pay(self, reference, item):
+        raise NotImplementedError
+
+
+class HttpGateway(Gateway):
+    """JSON over HTTPS: POST {url}/payouts, 200 -> paid, 4xx -> rejected, else retry"""
+
+    def __init__(self, url, api_key=None, timeout=REQUEST_TIMEOUT):
+        self.url = url.rstrip('/')
+        self.session = requests.Session()
+        # One pooled keep-alive connection per dispatch thread
+        self.session.mount(self.url, requests.adapters.HTTPAdapter(pool_maxsize=CONCURRENCY))
+        if api_key:
+            self.session.headers['Authorization'] = f'Bearer {api_key}'
+        self.timeout = timeout
+
+    def pay(self, reference, item):
+        try:
+            response = self.session.post(self.url + '/payouts', timeout=self.timeout, json={
+                'reference': reference,
+                'method': item['payment_method'],
+                'account': item['account_number'],
+                'amount': round(float(item['amount']), 2),
+            })
+        except requests.RequestException as e:
+            return PayoutResult('retry', None, f"{type(e).__name__}: {e}")
+        try:
+            body = response.json()
+        except ValueError:
+            body = {}
+        if response.status_code == 200 and body.get('status') == 'paid':
+            return PayoutResult('paid', body.get('id'), None)
+        error = body.get('error') or f"HTTP {response.status_code}"
+        if 400 <= response.status_code < 500 and response.status_code not in (408, 409, 429):
+            return PayoutResult('failed', body.get('id'), error)
+        return PayoutResult('retry', None, error)
+
+
+_gateways = {}
+
+
+def register_gateway(method, gateway):
+    """Use `gateway` for `method` instead of the one configured from the environment"""
+    _gateways[method] = gateway
+
+
+def get_gateway(method):
+    if method not in _gateways:
+        url = os.environ.get(f'PAYOUT_GATEWAY_URL_{method.upper()}') or os.environ.get('PAYOUT_GATEWAY_URL')
+        _gateways[method] = HttpGateway(url, os.environ.get('PAYOUT_GATEWAY_KEY')) if url else None
+    return _gateways[method]
+
+
+def _connection():
+    from app import get_db_connection
+    return get_db_connection()
+
+
+def create_batches(conn, db_type, batch_size=BATCH_SIZE):
+    """Group unbatched items per method; returns the new batch ids"""
+    cursor = conn.cursor()
+    skip_locked = 'FOR UPDATE SKIP LOCKED' if db_type == 'postgres' else ''
+    created = []
+    for method in METHODS:
+        if get_gateway(method) is None:
+            continue
+        while True:
+            cursor.execute(sql(db_type, f'''
+                SELECT id FROM payout_items WHERE batch_id IS NULL AND payment_method = ?
+                ORDER BY id LIMIT ? {skip_locked}
+            '''), (method, batch_size))
+            ids = [row['id'] for row in cursor.fetchall()]
+            if not ids:
+                break
+            if db_type == 'postgres':
+                cursor.execute('INSERT INTO payout_batches (payment_method) VALUES (%s) RETURNING id', (method,))
+                batch_id = cursor.fetchone()['id']
+            else:
+                cursor.execute('INSERT INTO payout_batches (payment_method) VALUES (?)', (method,))
+                batch_id = cursor.lastrowid
+            cursor.execute(sql(db_type, f'''
+                UPDATE payout_items SET batch_id = ? WHERE id IN ({', '.join('?' * len(ids))}) AND batch_id IS NULL
+                RETURNING amount
+            '''), (batch_id, *ids))
+            amounts = [float(row['amount']) for row in cursor.fetchall()]
+            cursor.execute(sql(db_type, 'UPDATE payout_batches SET item_count = ?, total = ? WHERE id = ?'),
+                           (len(amounts), round(sum(amounts), 2), batch_id))
+            jobs.enqueue(cursor, db_type, 'payouts.dispatch', {'batch_id': batch_id})
+            created.append(batch_id)
+            print(f"📤 Payout batch #{batch_id}: {len(amounts)} {method} payout(s), Rs {sum(amounts):,.2f}")
+            if len(amounts) < batch_size:
+                break
+    conn.commit()
+    return created
+
+
+def _record(cursor, db_type, results):
+    paid = [(r.gateway_ref, item['id']) for item, r in results if r.status == 'paid']
+    others = [(r.status == 'failed' or item['attempts'] + 1 >= MAX_ATTEMPTS, r.error, item['id'])
+              for item, r in results if r.status != 'paid']
+    if paid:
+        cursor.executemany(sql(db_type, '''
+            UPDATE payout_items SET status = 'paid', gateway_ref = ?, attempts = attempts + 1,
+                                    last_error = NULL, settled_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND status = 'pending'
+        '''), paid)
+    if others:
+        cursor.executemany(sql(db_type, '''
+            UPDATE payout_items SET status = CASE WHEN ? THEN 'failed' ELSE 'pending' END,
+                                    attempts = attempts + 1, last_error = ?
+            WHERE id = ? AND status = 'pending'
+        '''), others)
+    return sum(1 for failed, _, _ in others if not failed)
+
+
+def dispatch(conn, db_type, batch_id, concurrency=CONCURRENCY):
+    """Send a batch's pending items; returns (paid, failed, still pending)"""
+    cursor = conn.cursor()
+    cursor.execute(sql(db_type, 'SELECT payment_method FROM payout_batches WHERE id = ?'), (batch_id,))
+    batch = cursor.fetchone()
+    if batch is None:
+        return 0, 0, 0
+    gateway = get_gateway(batch['payment_method'])
+    if gateway is None:
+        raise RuntimeError(f"No payout gateway configured for {batch['payment_method']}")
+
+    cursor.execute(sql(db_type, '''
+        SELECT id, withdrawal_id, payment_method, account_number, amount, attempts
+        FROM payout_items WHERE batch_id = ? AND status = 'pending' ORDER BY id
+    '''), (batch_id,))
+    items = [dict(row) for row in cursor.fetchall()]
+    conn.commit()
+
+    retry = 0
+    done = []
+    with ThreadPoolExecutor(max_workers=min(concurrency, max(1, len(items)))) as pool:
+        futures = {pool.submit(gateway.pay, reference(item), item): item for item in items}
+        for future in as_completed(futures):
+            item = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:  # a gateway bug must not lose the other results
+                result = PayoutResult('retry', None, f"{type(e).__name__}: {e}")
+            done.append((item, result))
+            if len(done) >= COMMIT_EVERY:
+                retry += _record(cursor, db_type, done)
+                conn.commit()
+                done = []
+    retry += _record(cursor, db_type, done)
+
+    cursor.execute(sql(db_type, '''
+        SELECT status, COUNT(*) AS count FROM payout_items WHERE batch_id = ? GROUP BY status
+    '''), (batch_id,))
+    counts = {row['status']: row['count'] for row in cursor.fetchall()}
+    paid, failed, pending = counts.get('paid', 0), counts.get('failed', 0), counts.get('pending', 0)
+    if not pending:
+        cursor.execute(sql(db_type, '''
+            UPDATE payout_batches SET status = ?, settled_at = CURRENT_TIMESTAMP WHERE id = ?
+        '''), ('settled' if not failed else 'partial', batch_id))
+    conn.commit()
+    return paid, failed, pending
+
+
+@jobs.periodic('payouts.batch', every=BATCH_INTERVAL, max_attempts=1)
+def batch_job(payload):
+    conn, db_type = _connection()
+    try:
+        create_batches(conn, db_type)
+    finally:
+        conn.close()
+
+
+@jobs.task('payouts.dispatch', queue='payouts', max_attempts=MAX_ATTEMPTS + 2)
+def dispatch_job(payload):
+    conn, db_type = _connection()
+    try:
+        started = time.perf_counter()
+        paid, failed, pending = dispatch(conn, db_type, payload['batch_id'])
+    finally:
+        conn.close()
+    print(f"📤 Payout batch #{payload['batch_id']}: {paid} paid, {failed} failed, {pending} pending "
+          f"({time.perf_counter() - started:.1f}s)")
+    if pending:
+        raise RuntimeError(f"{pending} payout(s) hit transient gateway errors, retrying the batch")
+
+
+def retry_item(cursor, db_type, item_id):
+    """Send a failed payout again in the next batch; returns True if it was failed"""
+    cursor.execute(sql(db_type, '''
+        UPDATE payout_items SET status = 'pending', batch_id = NULL, attempts = 0, last_error = NULL
+        WHERE id = ? AND status = 'failed'
+    '''), (item_id,))
+    return cursor.rowcount == 1
+
+
+def summary(cursor, db_type, limit=20):
+    cursor.execute(sql(db_type, '''
+        SELECT id, payment_method, status, item_count, total, created_at, settled_at
+        FROM payout_batches ORDER BY id DESC LIMIT ?
+    '''), (limit,))
+    batches = [dict(row) for row in cursor.fetchall()]
+    cursor.execute('''
+        SELECT payment_method, status, COUNT(*) AS count, COALESCE(SUM(amount), 0) AS total
+        FROM payout_items GROUP BY payment_method, status ORDER BY payment_method, status
+    ''')
+    items = [dict(row) for row in cursor.fetchall()]
+    cursor.execute('''
+        SELECT id, withdrawal_id, payment_method, account_number, amount, last_error
+        FROM payout_items WHERE status = 'failed' ORDER BY id DESC LIMIT 50
+    ''')
+    failed = [dict(row) for row in cursor.fetchall()]
+    return {'batches': batches, 'items': items, 'failed': failed}
+
+
+def main():
+    command = sys.argv[1] if len(sys.argv) > 1 else 'status'
+    conn, db_type = _connection()
+    try:
+        if command == 'batch':
+            created = create_batches(conn, db_type)
+            print(f"✅ Created {len(created)} batch(es); `python jobs.py worker --queues payouts` sends them")
+        else:
+            data = summary(conn.cursor(), db_type)
+            for row in data['items']:
+                print(f"{row['payment_method']:<10} {row['status']:<8} {row['count']:>6}  Rs {float(row['total']):,.2f}")
+            for row in data['failed']:
+                print(f"❌ payout #{row['id']} (withdrawal #{row['withdrawal_id']}): {row['last_error']}")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,460 @@
+"""
+Screenshot Hashes - perceptual hashes to catch reused payment screenshots
+
+    python phash.py index [--processes 4]    # hash files already in the uploads dir
+    python phash.py bench [--size 1000000]   # lookup latency on synthetic hashes
+
+invest() queues a 'phash.check' job for every upload, so the request
+doesn't wait on the image decode. The job worker hashes the file (64-bit
+DCT pHash: unchanged by re-encoding, resizing or small edits) and looks
+it up among all earlier screenshots. A match within MAX_DISTANCE bits is
+stored on the screenshot_hashes row, pushed to connected admins as an
+'investment.duplicate' event and shown on the admin investment row. It
+is a hint for the admin, not a block: receipts from the same app can
+legitimately look alike.
+
+Lookups use multi-index hashing: the 64 bits are split into 4 chunks of
+16, and two hashes within distance 7 must agree on some chunk to within
+1 bit (pigeonhole). A lookup probes 17 values per chunk in 4 sorted
+arrays and popcounts the few candidates, well under a millisecond at a
+million hashes. New hashes go to a small unsorted tail that is merged
+in once it passes TAIL_MAX.
+
+screenshot_hashes is the source of truth. Each worker loads the index
+from a .cache snapshot and catches up on newer rows by id before each
+lookup.
+
+Env: PHASH_MAX_DISTANCE (bits, default 6, at most 7)
+"""
+
+import argparse
+import os
+import threading
+import time
+
+import numpy as np
+
+import events
+import jobs
+from db_pool import sql
+
+try:
+    from PIL import Image
+    AVAILABLE = True
+except ImportError:
+    AVAILABLE = False
+
+MAX_DISTANCE = min(7, int(os.environ.get('PHASH_MAX_DISTANCE', 6)))
+SAMPLE = 32                 # image is reduced to SAMPLE x SAMPLE before the DCT
+TAIL_MAX = 4096             # unsorted recent hashes before a merge
+OVERLAP = 200               # ids re-read on catch-up (Postgres commits out of id order)
+SNAPSHOT_MIN_ROWS = 10000   # smaller indexes load from the database quickly enough
+CHUNKS = 4
+CHUNK_BITS = 16
+
+_n = np.arange(SAMPLE)
+_DCT = np.cos(np.pi * (2 * _n[None, :] + 1) * _n[:, None] / (2 * SAMPLE))
+_POP8 = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+_FLIPS = np.array([0] + [1 << b for b in range(CHUNK_BITS)], dtype=np.uint16)
+
+
+def to_signed(h):
+    """uint64 hash -> BIGINT / SQLite INTEGER"""
+    return h - (1 << 64) if h >= 1 << 63 else h
+
+
+def to_unsigned(h):
+    return h + (1 << 64) if h < 0 else h
+
+
+def popcount(values):
+    if hasattr(np, 'bitwise_count'):  # numpy 2
+        return np.bitwise_count(values)
+    return _POP8[values.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+
+def compute(path):
+    """64-bit pHash of an image file (first frame for GIFs)"""
+    with Image.open(path) as img:
+        img.draft('L', (SAMPLE * 4, SAMPLE * 4))  # JPEG: decode at reduced size
+        pixels = np.asarray(img.convert('L').resize((SAMPLE, SAMPLE), Image.Resampling.LANCZOS),
+                            dtype=np.float64)
+    low = (_DCT @ pixels @ _DCT.T)[:8, :8].flatten()
+    bits = low > np.median(low[1:])  # DC term left out of the median
+    return int(np.packbits(bits).view('>u8')[0])
+
+
+def ensure_table(cursor, db_type):
+    if db_type == 'postgres':
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS screenshot_hashes (
+                id SERIAL PRIMARY KEY,
+                investment_id INTEGER REFERENCES investments(id),
+                user_id INTEGER,
+                screenshot_url VARCHAR(500) NOT NULL,
+                phash BIGINT NOT NULL,
+                duplicate_of INTEGER,
+                duplicate_user_id INTEGER,
+                distance INTEGER,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+    else:
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS screenshot_hashes (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                investment_id INTEGER,
+                user_id INTEGER,
+                screenshot_url TEXT NOT NULL,
+                phash INTEGER NOT NULL,
+                duplicate_of INTEGER,
+                duplicate_user_id INTEGER,
+                distance INTEGER,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (investment_id) REFERENCES investments(id)
+            )
+        ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_screenshot_hashes_investment ON screenshot_hashes (investment_id)')
+    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_screenshot_hashes_url ON screenshot_hashes (screenshot_url)')
+
+
+class HashIndex:
+    def __init__(self, max_distance=MAX_DISTANCE):
+        self.max_distance = max_distance
+        self.get_db_connection = None
+        self.snapshot_path = None
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()  # one catch-up query at a time
+        self.clear()
+
+    def init(self, get_db_connection, snapshot_path=None):
+        self.get_db_connection = get_db_connection
+        self.snapshot_path = snapshot_path
+
+    def clear(self):
+        self.ids = np.empty(0, dtype=np.int64)       # sorted
+        self.hashes = np.empty(0, dtype=np.uint64)   # aligned with ids
+        self._tables = []                            # per chunk: (sorted chunk values, positions)
+        self._tail = {}                              # id -> hash, not merged yet
+        self.last_id = 0
+        self._loaded = False
+
+    def __len__(self):
+        return len(self.ids) + len(self._tail)
+
+    def _build(self, ids, hashes):
+        order = np.argsort(ids, kind='stable')
+        self.ids, self.hashes = ids[order], hashes[order]
+        self._tables = []
+        for c in range(CHUNKS):
+            chunk = ((self.hashes >> np.uint64(c * CHUNK_BITS)) & np.uint64(0xFFFF)).astype(np.uint16)
+            positions = np.argsort(chunk, kind='stable')
+            self._tables.append((chunk[positions], positions))
+        self._tail = {}
+
+    def _merge(self):
+        if self._tail:
+            ids = np.fromiter(self._tail.keys(), dtype=np.int64, count=len(self._tail))
+            hashes = np.fromiter(self._tail.values(), dtype=np.uint64, count=len(self._tail))
+            self._build(np.concatenate([self.ids, ids]), np.concatenate([self.hashes, hashes]))
+
+    def _known(self, row_id):
+        if row_id in self._tail:
+            return True
+        i = np.searchsorted(self.ids, row_id)
+        return i < len(self.ids) and self.ids[i] == row_id
+
+    def _add(self, row_id, h):
+        if not self._known(row_id):
+            self._tail[row_id] = h
+            if len(self._tail) > TAIL_MAX:
+                self._merge()
+        self.last_id = max(self.last_id, row_id)
+
+    def add(self, row_id, h):
+        with self._lock:
+            self._add(row_id, h)
+
+    def load(self, ids, hashes):
+        """Replace the index with these (id, uint64 hash) arrays"""
+        with self._lock:
+            self._build(np.asarray(ids, dtype=np.int64), np.asarray(hashes, dtype=np.uint64))
+            self.last_id = int(self.ids[-1]) if len(self.ids) else 0
+            self._loaded = True
+
+    def lookup(self, h, max_distance=None):
+        """[(id, distance)] of stored hashes within max_distance bits, nearest first"""
+        max_distance = self.max_distance if max_distance is None else min(7, max_distance)
+        with self._lock:
+            found = {}
+            if len(self.ids):
+                candidates = []
+                for c, (values, positions) in enumerate(self._tables):
+                    probes = ((h >> (c * CHUNK_BITS)) & 0xFFFF) ^ _FLIPS
+                    left = np.searchsorted(values, probes, 'left')
+                    right = np.searchsorted(values, probes, 'right')
+                    lengths = right - left
+                    total = int(lengths.sum())
+                    if total:
+                        # Gather every [left, right) range without a Python loop
+                        starts = np.repeat(left - np.cumsum(lengths) + lengths, lengths)
+                        candidates.append(positions[starts + np.arange(total)])
+                if candidates:
+                    positions = np.unique(np.concatenate(candidates))
+                    distances = popcount(self.hashes[positions] ^ np.uint64(h))
+                    near = distances <= max_distance
+                    found = dict(zip(self.ids[positions[near]].tolist(), distances[near].tolist()))
+            for row_id, other in self._tail.items():
+                distance = (other ^ h).bit_count()
+                if distance <= max_distance:
+                    found[row_id] = distance
+        return sorted(found.items(), key=lambda item: (item[1], item[0]))
+
+    def save(self, path=None):
+        path = path or self.snapshot_path
+        with self._lock:
+            self._merge()
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.tmp.npz"
+            np.savez(tmp, ids=self.ids, hashes=self.hashes)
+            os.replace(tmp, path)
+
+    def _load_snapshot(self, max_id):
+        try:
+            with np.load(self.snapshot_path) as data:
+                ids, hashes = data['ids'], data['hashes']
+        except (OSError, ValueError, KeyError):
+            return
+        if len(ids) and ids[-1] > max_id:
+            print("⚠️  Screenshot hash snapshot is ahead of the database, reloading from the database")
+            return
+        self._build(ids, hashes)
+        self.last_id = int(ids[-1]) if len(ids) else 0
+
+    def refresh(self):
+        """Catch up with rows added by other workers (first call: load everything)"""
+        with self._refresh_lock:
+            return self._refresh()
+
+    def _refresh(self):
+        conn, db_type = self.get_db_connection()
+        try:
+            cursor = conn.cursor()
+            with self._lock:
+                first = not self._loaded
+                if first:
+                    cursor.execute('SELECT COALESCE(MAX(id), 0) AS max_id FROM screenshot_hashes')
+                    if self.snapshot_path:
+                        self._load_snapshot(cursor.fetchone()['max_id'])
+                since = max(0, self.last_id - OVERLAP)
+            cursor.execute(sql(db_type, 'SELECT id, phash FROM screenshot_hashes WHERE id > ? ORDER BY id'), (since,))
+            rows = cursor.fetchall()
+        finally:
+            conn.close()
+        with self._lock:
+            for row in rows:
+                self._add(row['id'], to_unsigned(row['phash']))
+            self._loaded = True
+        if first and self.snapshot_path and len(rows) >= SNAPSHOT_MIN_ROWS:
+            self.save()
+        return len(rows)
+
+    def best_match(self, h):
+        """Closest earlier screenshot as a dict (investment, user, distance) or None"""
+        self.refresh()
+        matches = self.lookup(h)[:10]
+        if not matches:
+            return None
+        distances = dict(matches)
+        conn, db_type = self.get_db_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(sql(db_type, f'''
+                SELECT sh.id, sh.investment_id, sh.user_id, sh.screenshot_url, u.username
+                FROM screenshot_hashes sh LEFT JOIN users u ON u.id = sh.user_id
+                WHERE sh.id IN ({', '.join('?' * len(distances))})
+            '''), list(distances))
+            rows = [dict(row) for row in cursor.fetchall()]
+        finally:
+            conn.close()
+        if not rows:
+            return None
+        best = min(rows, key=lambda row: (distances[row['id']], row['id']))
+        best['distance'] = distances[best['id']]
+        return best
+
+
+index = HashIndex()
+
+
+def record(cursor, db_type, investment_id, user_id, screenshot_url, h, match):
+    """Store a screenshot's hash (and the duplicate it matched); returns the row id"""
+    params = (investment_id, user_id, screenshot_url, to_signed(h),
+              match['investment_id'] if match else None,
+              match['user_id'] if match else None,
+              match['distance'] if match else None)
+    query = '''
+        INSERT INTO screenshot_hashes
+        (investment_id, user_id, screenshot_url, phash, duplicate_of, duplicate_user_id, distance)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    '''
+    if db_type == 'postgres':
+        cursor.execute(sql(db_type, query) + ' RETURNING id', params)
+        return cursor.fetchone()['id']
+    cursor.execute(query, params)
+    return cursor.lastrowid
+
+
+@jobs.task('phash.check', max_attempts=3)
+def check_job(payload):
+    """Hash a new investment's screenshot and flag the closest earlier one"""
+    from app import UPLOAD_FOLDER
+    investment_id = payload['investment_id']
+    h = compute(os.path.join(UPLOAD_FOLDER, os.path.basename(payload['screenshot_url'])))
+    match = index.best_match(h)
+    conn, db_type = index.get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(sql(db_type, 'SELECT 1 FROM screenshot_hashes WHERE investment_id = ?'), (investment_id,))
+        if cursor.fetchone():
+            return  # a retry of a run that already committed
+        hash_id = record(cursor, db_type, investment_id, payload['user_id'], payload['screenshot_url'], h, match)
+        if match:
+            events.publish(cursor, db_type, 'investment.duplicate', {
+                'id': investment_id,
+                'duplicate_of': match['investment_id'],
+                'duplicate_username': match['username'],
+                'duplicate_distance': match['distance'],
+            })
+        conn.commit()
+    finally:
+        conn.close()
+    index.add(hash_id, h)
+    if match:
+        print(f"⚠️  Screenshot for investment #{investment_id} looks like {match['screenshot_url']} "
+              f"(user {match['username']}, distance {match['distance']})")
+
+
+def _hash_file(path):
+    try:
+        return compute(path), None
+    except Exception as e:
+        return None, str(e)
+
+
+def _chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def bulk_index(get_db_connection, folder, url_prefix, processes=None, chunk_size=500):
+    """Hash every file in `folder` not indexed yet, oldest first within each chunk"""
+    import multiprocessing
+
+    index.init(get_db_connection, index.snapshot_path)
+    index.refresh()
+    indexed = flagged = failed = 0
+    started = time.perf_counter()
+    with multiprocessing.Pool(processes) as pool, os.scandir(folder) as entries:
+        names = (e.name for e in entries if e.is_file())
+        for chunk in _chunks(names, chunk_size):
+            chunk.sort()
+            urls = [f"{url_prefix}/{name}" for name in chunk]
+            conn, db_type = get_db_connection()
+            try:
+                cursor = conn.cursor()
+                placeholders = ', '.join('?' * len(urls))
+                cursor.execute(sql(db_type, f'SELECT screenshot_url FROM screenshot_hashes WHERE screenshot_url IN ({placeholders})'), urls)
+                done = {row['screenshot_url'] for row in cursor.fetchall()}
+                cursor.execute(sql(db_type, f'SELECT id, user_id, screenshot_url FROM investments WHERE screenshot_url IN ({placeholders})'), urls)
+                owners = {row['screenshot_url']: (row['id'], row['user_id']) for row in cursor.fetchall()}
+                todo = [(name, url) for name, url in zip(chunk, urls) if url not in done]
+                results = pool.map(_hash_file, [os.path.join(folder, name) for name, _ in todo])
+                for (name, url), (h, error) in zip(todo, results):
+                    if h is None:
+                        failed += 1
+                        print(f"⚠️  Skipped {name}: {error}")
+                        continue
+                    prefix = name.split('_', 1)[0]
+                    investment_id, user_id = owners.get(url, (None, int(prefix) if prefix.isdigit() else None))
+                    matches = index.lookup(h)
+                    match = None
+                    if matches:
+                        cursor.execute(sql(db_type, 'SELECT investment_id, user_id FROM screenshot_hashes WHERE id = ?'),
+                                       (matches[0][0],))
+                        match = dict(cursor.fetchone(), distance=matches[0][1])
+                        flagged += 1
+                        print(f"⚠️  {name} matches an earlier screenshot (user {match['user_id']}, distance {match['distance']})")
+                    index.add(record(cursor, db_type, investment_id, user_id, url, h, match), h)
+                    indexed += 1
+                conn.commit()
+            finally:
+                conn.close()
+    if index.snapshot_path and len(index) >= SNAPSHOT_MIN_ROWS:
+        index.save()
+    print(f"✅ Indexed {indexed} screenshot(s), {flagged} flagged as reused, {failed} unreadable "
+          f"({time.perf_counter() - started:.1f}s, {len(index)} in index)")
+
+
+def bench(size, queries):
+    rng = np.random.default_rng(42)
+    hashes = rng.integers(0, 2 ** 64, size, dtype=np.uint64)
+    bench_index = HashIndex()
+    started = time.perf_counter()
+    bench_index.load(np.arange(1, size + 1), hashes)
+    print(f"🔧 Built index of {size:,} hashes in {time.perf_counter() - started:.2f}s")
+
+    near, timings, hits = [], [], 0
+    for i in rng.integers(0, size, queries):
+        h = int(hashes[i])
+        for bit in rng.choice(64, int(rng.integers(1, MAX_DISTANCE + 1)), replace=False):
+            h ^= 1 << int(bit)
+        near.append((i + 1, h))
+    for row_id, h in near:
+        started = time.perf_counter()
+        result = bench_index.lookup(h)
+        timings.append(time.perf_counter() - started)
+        hits += any(found == row_id for found, _ in result)
+    misses = []
+    for h in rng.integers(0, 2 ** 64, queries, dtype=np.uint64):
+        started = time.perf_counter()
+        bench_index.lookup(int(h))
+        misses.append(time.perf_counter() - started)
+    for label, values in (('near-duplicate', timings), ('unrelated', misses)):
+        values = sorted(values)
+        print(f"{label:<16} p50 {1e6 * values[len(values) // 2]:7.0f}us  "
+              f"p99 {1e6 * values[int(len(values) * 0.99)]:7.0f}us")
+    print(f"recall within {MAX_DISTANCE} bits: {hits}/{queries}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Perceptual-hash index of payment screenshots")
+    sub = parser.add_subparsers(dest='command', required=True)
+    run = sub.add_parser('index', help="hash screenshots already on disk")
+    run.add_argument('--processes', type=int, default=None)
+    b = sub.add_parser('bench', help="lookup latency on synthetic hashes")
+    b.add_argument('--size', type=int, default=1000000)
+    b.add_argument('--queries', type=int, default=2000)
+    args = parser.parse_args()
+
+    if args.command == 'bench':
+        bench(args.size, args.queries)
+        return
+    if not AVAILABLE:
+        raise SystemExit("❌ Pillow is not installed (pip install -r requirements.txt)")
+    import app
+    app.ensure_schema()
+    bulk_index(app.get_db_connection, app.UPLOAD_FOLDER, '/' + app.UPLOAD_FOLDER.replace(os.sep, '/'),
+               args.processes)
+
+
+if __name__ == "__main__":
+    # Go through the importable module: app configures `phash.index`, not `__main__.index`
+    import phash
+    phash.main()
@@ -0,0 +1,249 @@
+"""
+Rate Limiting - token buckets shared by all gunicorn workers, plus load shedding
+
+Buckets live in a small local SQLite file (WAL, no fsync) next to the
+app, so every worker process on the machine draws from the same bucket.
+One hit is a single atomic UPSERT ... RETURNING: refill by elapsed time,
+take a token if there is one, report whether it was allowed.
+
+- every request: per-IP default bucket (RATE_LIMIT_DEFAULT)
+- login/register/invest/withdraw/admin login: tighter per-IP and
+  per-user buckets via @limiter.limit(...)
+- LoadShedder (WSGI): answers 503 straight away when a worker already
+  has too many requests in flight or the Postgres pool wait is climbing.
+  Requests queued in gunicorn's accept backlog never reach it, so by
+  default the in-flight cap only bites where the worker accepts more
+  than it can serve (gevent connections, or threads beyond the DB pool);
+  the pool wait is the queueing signal
+
+If the limiter store itself is unavailable, requests are let through:
+throttling must never take the site down.
+
+Env: RATE_LIMITS (on/off, default on), RATE_LIMIT_DEFAULT (default
+300/60 = 300 requests per 60s), RATE_LIMIT_DB, SHED_MAX_INFLIGHT
+(default: the worker's concurrency from gunicorn.conf.py, capped at
+DB_POOL_SIZE on Postgres), SHED_POOL_WAIT (seconds, default 0.5)
+"""
+
+import os
+import random
+import sqlite3
+import threading
+import time
+from functools import wraps
+
+from flask import Response, request, session
+
+import db_pool
+
+ENABLED = os.environ.get('RATE_LIMITS', 'on').lower() not in ('0', 'off', 'false', 'no')
+DEFAULT_LIMIT = os.environ.get('RATE_LIMIT_DEFAULT', '300/60')
+RATE_LIMIT_DB = os.environ.get('RATE_LIMIT_DB', os.path.join('.cache', 'ratelimit.db'))
+
+
+def _default_max_inflight():
+    """Requests a worker can serve at once (same env as gunicorn.conf.py), or
+    as many as there are DB connections if that's fewer"""
+    mode = os.environ.get('WORKER_MODE', 'gthread')
+    if mode == 'gevent':
+        concurrency = int(os.environ.get('WORKER_CONNECTIONS', 100))
+    elif mode == 'gthread':
+        concurrency = int(os.environ.get('WORKER_THREADS', 8))
+    else:
+        concurrency = 1
+    limit = concurrency
+    if os.environ.get('DATABASE_URL'):
+        limit = min(limit, db_pool.POOL_SIZE)
+    return max(1, limit)
+
+
+SHED_MAX_INFLIGHT = int(os.environ.get('SHED_MAX_INFLIGHT') or _default_max_inflight())
+SHED_POOL_WAIT = float(os.environ.get('SHED_POOL_WAIT', 0.5))
+BUSY_TIMEOUT_MS = 200
+PRUNE_EVERY = 5000          # on average, one stale-bucket cleanup per this many hits
+STALE_SECONDS = 24 * 3600
+
+# Paths that never count against limits or get shed
+EXEMPT_PREFIXES = ('/static/', '/screenshots/', '/admin/events')
+
+
+def parse_limit(spec):
+    """'10/60' -> (capacity 10, refill 10 tokens per 60 seconds)"""
+    count, _, period = spec.partition('/')
+    return int(count), float(period or 1)
+
+
+class RateLimiter:
+    def __init__(self, path=RATE_LIMIT_DB, default=DEFAULT_LIMIT):
+        self.path = path
+        self.default = parse_limit(default) if default else None
+        self._local = threading.local()
+        self._pid = os.getpid()
+        self.limited = 0
+
+    def _conn(self):
+        if self._pid != os.getpid():
+            self._local = threading.local()  # forked: don't reuse the parent's handle
+            self._pid = os.getpid()
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_MS / 1000, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=OFF')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS buckets (
+                    key TEXT PRIMARY KEY,
+                    tokens REAL NOT NULL,
+                    allowed INTEGER NOT NULL,
+                    updated REAL NOT NULL
+                )
+            ''')
+            self._local.conn = conn
+        return conn
+
+    def hit(self, key, capacity, period):
+        """Take one token from `key`; returns (allowed, seconds until a token is available)"""
+        rate = capacity / period
+        now = time.time()
+        refilled = 'MIN(:capacity, tokens + (:now - updated) * :rate)'
+        try:
+            conn = self._conn()
+            tokens, allowed = conn.execute(f'''
+                INSERT INTO buckets (key, tokens, allowed, updated) VALUES (:key, :capacity - 1, 1, :now)
+                ON CONFLICT (key) DO UPDATE SET
+                    tokens = {refilled} - ({refilled} >= 1),
+                    allowed = {refilled} >= 1,
+                    updated = :now
+                RETURNING tokens, allowed
+            ''', {'key': key, 'capacity': capacity, 'now': now, 'rate': rate}).fetchone()
+            if random.randrange(PRUNE_EVERY) == 0:
+                conn.execute('DELETE FROM buckets WHERE updated < ?', (now - STALE_SECONDS,))
+        except sqlite3.Error as e:
+            print(f"⚠️  Rate limiter unavailable, allowing request: {str(e)}")
+            return True, 0
+        if allowed:
+            return True, 0
+        return False, (1 - tokens) / rate
+
+    def check(self, name, spec_ip=None, spec_user=None):
+        """Apply the per-IP and per-user buckets for `name`; returns a 429 response or None"""
+        checks = []
+        if spec_ip:
+            checks.append((f"{name}:ip:{request.remote_addr}", spec_ip))
+        if spec_user and 'user_id' in session:
+            checks.append((f"{name}:user:{session['user_id']}", spec_user))
+        for key, (capacity, period) in checks:
+            allowed, retry_after = self.hit(key, capacity, period)
+            if not allowed:
+                self.limited += 1
+                print(f"⚠️  Rate limited {key} (retry in {retry_after:.0f}s)")
+                return too_many_requests(retry_after)
+        return None
+
+    def limit(self, name, per_ip=None, per_user=None, methods=('POST',)):
+        """Decorator: tighter buckets for one route, e.g. per_ip='10/60'"""
+        spec_ip = parse_limit(per_ip) if per_ip else None
+        spec_user = parse_limit(per_user) if per_user else None
+
+        def decorator(view):
+            @wraps(view)
+            def wrapped(*args, **kwargs):
+                if ENABLED and request.method in methods:
+                    limited = self.check(name, spec_ip, spec_user)
+                    if limited is not None:
+                        return limited
+                return view(*args, **kwargs)
+            return wrapped
+        return decorator
+
+    def init_app(self, app):
+        """Default per-IP bucket in front of every route"""
+        @app.before_request
+        def default_rate_limit():
+            if not ENABLED or self.default is None or request.path.startswith(EXEMPT_PREFIXES):
+                return None
+            return self.check('all', self.default)
+
+
+def too_many_requests(retry_after):
+    seconds = max(1, int(retry_after + 0.999))
+    if request.path.startswith('/api/'):
+        body, mimetype = f'{{"error":"Too many requests","retry_after":{seconds}}}', 'application/json'
+    else:
+        body, mimetype = f"Too many requests - please wait {seconds} seconds and try again.", 'text/plain'
+    return Response(body, status=429, mimetype=mimetype, headers={'Retry-After': str(seconds)})
+
+
+class LoadShedder:
+    """WSGI middleware: fail fast with 503 instead of queueing behind an overloaded worker"""
+
+    def __init__(self, app, pool_wait=None, max_inflight=SHED_MAX_INFLIGHT, max_pool_wait=SHED_POOL_WAIT):
+        self.app = app
+        self.pool_wait = pool_wait          # callable -> recent DB pool wait in seconds
+        self.max_inflight = max_inflight
+        self.max_pool_wait = max_pool_wait
+        self.inflight = 0
+        self.shed = 0
+        self._lock = threading.Lock()
+
+    def _admit(self):
+        """Count the request in; the reason it's refused instead, if it is"""
+        if self.pool_wait is not None and self.pool_wait() > self.max_pool_wait:
+            return 'database busy'
+        with self._lock:
+            self.inflight += 1
+            if self.inflight > self.max_inflight:
+                self.inflight -= 1
+                return 'busy'
+        return None
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        if not ENABLED or path.startswith(EXEMPT_PREFIXES) or path.startswith('/admin'):
+            return self.app(environ, start_response)
+
+        reason = self._admit()
+        if reason:
+            with self._lock:
+                self.shed += 1
+            start_response('503 Service Unavailable', [('Content-Type', 'text/plain'),
+                                                       ('Retry-After', '5')])
+            return [f"Server {reason} - please try again in a few seconds.".encode()]
+
+        try:
+            body = self.app(environ, start_response)
+        except BaseException:
+            self._done()
+            raise
+        return _ClosingIterator(body, self._done)
+
+    def _done(self):
+        with self._lock:
+            self.inflight -= 1
+
+
+class _ClosingIterator:
+    """Counts a request as finished when the server closes its body"""
+
+    def __init__(self, body, on_close):
+        self._body = body
+        self._iter = iter(body)
+        self._on_close = on_close
+        self._closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._iter)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            if hasattr(self._body, 'close'):
+                self._body.close()
+        finally:
+            self._on_close()
@@ -0,0 +1,102 @@
+"""
+Render Cache - serve mostly-static pages from pre-rendered bytes
+
+Templates are compiled once at startup into a persistent Jinja bytecode
+cache, so a restarted worker skips parsing. Pages whose only dynamic
+values are a few plain strings (the landing page's username, nothing at
+all for login/register) are rendered once with marker values, split
+into static byte chunks around the markers, and from then on answered
+by joining those chunks with the escaped per-user values.
+
+Requests carrying flash messages fall back to a normal render, and an
+entry is dropped as soon as its template file changes on disk.
+"""
+
+import os
+import re
+import threading
+
+from flask import Response, render_template, session
+from jinja2 import FileSystemBytecodeCache
+from markupsafe import escape
+
+CACHE_DIR = os.environ.get('JINJA_CACHE_DIR', '.cache/jinja')
+
+_MARKER = '\x1e{}\x1e'
+_MARKER_RE = re.compile('\x1e([A-Za-z_][A-Za-z0-9_]*)\x1e')
+
+
+class _Entry:
+    __slots__ = ('chunks', 'names', 'uptodate')
+
+    def __init__(self, chunks, names, uptodate):
+        self.chunks = chunks    # static bytes between fragments, or None if uncacheable
+        self.names = names      # fragment name at each gap, in output order
+        self.uptodate = uptodate
+
+
+class PageCache:
+    def __init__(self, app=None):
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Persistent bytecode cache + eager compilation of every page template"""
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(CACHE_DIR)
+        self.app = app
+        compiled = 0
+        for name in app.jinja_env.list_templates(extensions=['html']):
+            app.jinja_env.get_template(name)
+            compiled += 1
+        print(f"✅ Precompiled {compiled} template(s) (bytecode cache: {CACHE_DIR})")
+
+    def _build(self, template_name, names):
+        """Render once with markers and cut the output into static chunks"""
+        env = self.app.jinja_env
+        _, _, uptodate = env.loader.get_source(env, template_name)
+        html = render_template(template_name, **{name: _MARKER.format(name) for name in names})
+
+        pieces = _MARKER_RE.split(html)
+        found = tuple(pieces[1::2])
+        # Every fragment must come through untouched (no filters, not only
+        # used in a condition), otherwise the page can't be spliced safely.
+        if set(found) != set(names):
+            print(f"⚠️  {template_name} can't be fragment-cached, rendering normally")
+            return _Entry(None, (), uptodate)
+        return _Entry([p.encode('utf-8') for p in pieces[0::2]], found, uptodate)
+
+    def render(self, template_name, **fragments):
+        """Response for a template whose context is only the given string fragments"""
+        if session.get('_flashes'):
+            return render_template(template_name, **fragments)
+
+        key = (template_name, tuple(sorted(fragments)))
+        entry = self._entries.get(key)
+        if entry is not None and entry.uptodate is not None and not entry.uptodate():
+            entry = None  # template edited on disk
+        if entry is None:
+            self.misses += 1
+            entry = self._build(template_name, key[1])
+            with self._lock:
+                self._entries[key] = entry
+        else:
+            self.hits += 1
+
+        if entry.chunks is None:
+            return render_template(template_name, **fragments)
+
+        chunks = entry.chunks
+        out = [chunks[0]]
+        for name, chunk in zip(entry.names, chunks[1:]):
+            out.append(str(escape(fragments[name])).encode('utf-8'))
+            out.append(chunk)
+        return Response(b''.join(out), mimetype='text/html')
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,226 @@
+"""
+Daily Rollups - per-day aggregates for admin reporting
+Recomputes only the days touched since the last run (high-water mark)
+
+Run manually or from cron:
+    python rollups.py            # incremental refresh
+    python rollups.py --rebuild  # recompute every day from scratch
+
+Archived investments and withdrawals (archive.py) still count: the queries
+read archive.source(), the live table plus its archive.
+"""
+
+import sys
+from datetime import date, datetime, timedelta
+
+import archive
+from db_pool import sql
+
+# Each metric is one grouped query over a single day: (metric, dimension, count, total)
+METRIC_QUERIES = {
+    'investment_new': '''
+        SELECT plan_name AS dimension, COUNT(*) AS count, COALESCE(SUM(amount), 0) AS total
+        FROM {investments} investments WHERE created_at >= ? AND created_at < ?
+        GROUP BY plan_name
+    ''',
+    'investment_approved': '''
+        SELECT plan_name AS dimension, COUNT(*) AS count, COALESCE(SUM(amount), 0) AS total
+        FROM {investments} investments WHERE approved_at >= ? AND approved_at < ?
+        GROUP BY plan_name
+    ''',
+    'withdrawal': '''
+        SELECT payment_method || ':' || status AS dimension, COUNT(*) AS count,
+               COALESCE(SUM(amount), 0) AS total
+        FROM {withdrawals} withdrawals WHERE created_at >= ? AND created_at < ?
+        GROUP BY payment_method, status
+    ''',
+    'registration': '''
+        SELECT '' AS dimension, COUNT(*) AS count, 0 AS total
+        FROM users WHERE created_at >= ? AND created_at < ?
+    ''',
+    'referral_signup': '''
+        SELECT '' AS dimension, COUNT(*) AS count, 0 AS total
+        FROM users WHERE created_at >= ? AND created_at < ? AND referred_by IS NOT NULL
+    ''',
+}
+
+# Where to look for days touched since the last run: (table, created columns, changed columns)
+# New rows are found by id above the high-water mark; status changes by the timestamp
+# the write path sets (approved_at, processed_at).
+SOURCES = (
+    ('users', ('created_at',), ()),
+    ('investments', ('created_at',), ('approved_at',)),
+    ('withdrawals', ('created_at',), ('processed_at',)),
+)
+
+
+def ensure_tables(cursor, db_type):
+    """Create rollup tables and the indexes the per-day queries rely on"""
+    if db_type == 'postgres':
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS daily_rollups (
+                day DATE NOT NULL,
+                metric VARCHAR(50) NOT NULL,
+                dimension VARCHAR(100) NOT NULL DEFAULT '',
+                count INTEGER NOT NULL DEFAULT 0,
+                total DECIMAL(14,2) NOT NULL DEFAULT 0,
+                PRIMARY KEY (day, metric, dimension)
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS rollup_state (
+                source VARCHAR(50) PRIMARY KEY,
+                last_id INTEGER NOT NULL DEFAULT 0,
+                last_run TIMESTAMP
+            )
+        ''')
+    else:
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS daily_rollups (
+                day DATE NOT NULL,
+                metric TEXT NOT NULL,
+                dimension TEXT NOT NULL DEFAULT '',
+                count INTEGER NOT NULL DEFAULT 0,
+                total REAL NOT NULL DEFAULT 0,
+                PRIMARY KEY (day, metric, dimension)
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS rollup_state (
+                source TEXT PRIMARY KEY,
+                last_id INTEGER NOT NULL DEFAULT 0,
+                last_run TIMESTAMP
+            )
+        ''')
+
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_created_at ON users (created_at)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_investments_created_at ON investments (created_at)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_investments_approved_at ON investments (approved_at)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_withdrawals_created_at ON withdrawals (created_at)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_withdrawals_processed_at ON withdrawals (processed_at)')
+
+
+def _as_day(value):
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+
+def _touched_days(cursor, db_type, state, sources):
+    """Days whose aggregates may have changed since the last run"""
+    days = set()
+    for table, created_cols, changed_cols in SOURCES:
+        last_id, last_run = state.get(table, (0, None))
+        from_sql = f'{sources.get(table, table)} {table}'
+        for col in created_cols:
+            cursor.execute(sql(db_type, f'SELECT DISTINCT DATE({col}) AS day FROM {from_sql} WHERE id > ?'),
+                           (last_id,))
+            days.update(_as_day(r['day']) for r in cursor.fetchall())
+        for col in changed_cols:
+            # >= rather than > so a write in the same second as the last run is not lost;
+            # recomputing a day twice is harmless. Metrics counted on the creation day
+            # (withdrawal by status, investment_new) change there too
+            select = f'SELECT DISTINCT DATE({col}) AS day, DATE(created_at) AS created_day FROM {from_sql}'
+            if last_run is None:
+                cursor.execute(f'{select} WHERE {col} IS NOT NULL')
+            else:
+                cursor.execute(sql(db_type, f'{select} WHERE {col} >= ?'), (last_run,))
+            for r in cursor.fetchall():
+                days.update((_as_day(r['day']), _as_day(r['created_day'])))
+    days.discard(None)
+    return sorted(days)
+
+
+def _rebuild_day(cursor, db_type, day, sources):
+    start = day.isoformat()
+    end = (day + timedelta(days=1)).isoformat()
+    cursor.execute(sql(db_type, 'DELETE FROM daily_rollups WHERE day = ?'), (start,))
+    for metric, query in METRIC_QUERIES.items():
+        cursor.execute(sql(db_type, query.format(**sources)), (start, end))
+        for row in cursor.fetchall():
+            if not row['count']:
+                continue
+            cursor.execute(sql(db_type, '''
+                INSERT INTO daily_rollups (day, metric, dimension, count, total)
+                VALUES (?, ?, ?, ?, ?)
+            '''), (start, metric, row['dimension'] or '', row['count'], row['total']))
+
+
+def refresh(conn, db_type, rebuild=False):
+    """Bring daily_rollups up to date; returns the list of recomputed days"""
+    cursor = conn.cursor()
+    ensure_tables(cursor, db_type)
+
+    state = {}
+    if not rebuild:
+        cursor.execute('SELECT source, last_id, last_run FROM rollup_state')
+        state = {r['source']: (r['last_id'], r['last_run']) for r in cursor.fetchall()}
+
+    cursor.execute('SELECT CURRENT_TIMESTAMP AS now')
+    now = cursor.fetchone()['now']
+
+    # Archived investments / withdrawals still count towards their days
+    sources = {table: archive.source(conn, db_type, table) for table in ('investments', 'withdrawals')}
+
+    max_ids = {}
+    for table, _, _ in SOURCES:
+        cursor.execute(f'SELECT COALESCE(MAX(id), 0) AS max_id FROM {sources.get(table, table)} {table}')
+        max_ids[table] = cursor.fetchone()['max_id']
+
+    if rebuild:
+        cursor.execute('DELETE FROM daily_rollups')
+    days = _touched_days(cursor, db_type, state, sources)
+    for day in days:
+        _rebuild_day(cursor, db_type, day, sources)
+
+    for table, max_id in max_ids.items():
+        cursor.execute(sql(db_type, 'DELETE FROM rollup_state WHERE source = ?'), (table,))
+        cursor.execute(sql(db_type, 'INSERT INTO rollup_state (source, last_id, last_run) VALUES (?, ?, ?)'),
+                       (table, max_id, now))
+    conn.commit()
+    return days
+
+
+def fetch_rollups(cursor, db_type, since, until=None, metrics=None):
+    """Read rollup rows for [since, until] as dicts, optionally limited to some metrics"""
+    query = 'SELECT day, metric, dimension, count, total FROM daily_rollups WHERE day >= ?'
+    params = [str(since)]
+    if until is not None:
+        query += ' AND day <= ?'
+        params.append(str(until))
+    if metrics:
+        query += ' AND metric IN (' + ', '.join('?' for _ in metrics) + ')'
+        params.extend(metrics)
+    query += ' ORDER BY day, metric, dimension'
+    cursor.execute(sql(db_type, query), params)
+    return [{
+        'day': _as_day(r['day']),
+        'metric': r['metric'],
+        'dimension': r['dimension'],
+        'count': int(r['count']),
+        'total': float(r['total']),
+    } for r in cursor.fetchall()]
+
+
+def main():
+    from app import get_db_connection
+
+    rebuild = '--rebuild' in sys.argv
+    conn, db_type = get_db_connection()
+    try:
+        days = refresh(conn, db_type, rebuild=rebuild)
+    finally:
+        conn.close()
+
+    if days:
+        print(f"✅ Rolled up {len(days)} day(s): {days[0]} .. {days[-1]}")
+    else:
+        print("✅ Rollups already up to date")
+
+
+if __name__ == "__main__":
+    main()
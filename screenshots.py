@@ -0,0 +1,127 @@
+"""
+Screenshot Serving - owner/admin only, without a Python worker copying bytes
+
+Payment screenshots used to be plain static files: anyone who guessed
+/static/uploads/screenshots/{user_id}_{timestamp}_... could fetch them.
+That prefix now 404s and pages link to /screenshots/<name>?exp=..&sig=..
+instead (the `screenshot_src` template filter / signed_url()).
+
+- sig is an HMAC of (file name, viewer, expiry) with the app's secret
+  key, where the viewer is 'admin' or the owner's user id. The route
+  recomputes it for whoever the session says is asking, so checking
+  access costs one HMAC and no query, and a copied link is useless to
+  anyone else. Owner links only ever cover files named {user_id}_...
+- expiry is rounded up to a TTL boundary, so a page rendered twice in
+  the same window links the same URL and the browser cache gets reused
+- send_file() hands the open file to gunicorn's wsgi.file_wrapper
+  (sendfile(2), zero-copy; the compression middleware leaves it alone),
+  answers Range requests and sets ETag / Last-Modified for 304s
+- with a front proxy, SCREENSHOT_SENDFILE=x-accel (nginx) or x-sendfile
+  (Apache/lighttpd) returns just a header and the proxy sends the file
+
+Env: SCREENSHOT_URL_TTL (seconds, default 3600; links live 1-2x that),
+SCREENSHOT_SENDFILE (x-accel / x-sendfile, default off),
+SCREENSHOT_ACCEL_PREFIX (nginx internal location, default /_protected/screenshots/)
+"""
+
+import base64
+import hashlib
+import hmac
+import mimetypes
+import os
+import time
+
+from flask import Response, abort, current_app, request, session
+from werkzeug.security import safe_join
+from werkzeug.utils import send_from_directory
+
+URL_TTL = int(os.environ.get('SCREENSHOT_URL_TTL', 3600))
+SENDFILE = os.environ.get('SCREENSHOT_SENDFILE', '').strip().lower()
+ACCEL_PREFIX = os.environ.get('SCREENSHOT_ACCEL_PREFIX', '/_protected/screenshots/')
+PUBLIC_PREFIX = '/static/uploads/'
+
+_config = {'key': None, 'folder': None}
+
+
+def _sign(filename, viewer, expires):
+    message = f'{filename}\n{viewer}\n{expires}'.encode()
+    digest = hmac.new(_config['key'], message, hashlib.sha256).digest()[:16]
+    return base64.urlsafe_b64encode(digest).decode().rstrip('=')
+
+
+def _viewers():
+    """Who the current session may view screenshots as"""
+    viewers = []
+    if 'admin' in session:
+        viewers.append('admin')
+    if 'user_id' in session:
+        viewers.append(str(session['user_id']))
+    return viewers
+
+
+def signed_url(stored_url, viewer=None):
+    """Serving URL for a stored screenshot_url, for `viewer` ('admin' or a
+    user id; defaults to the current session, admin first)"""
+    if not stored_url:
+        return None
+    filename = os.path.basename(stored_url)
+    if viewer is None:
+        viewers = _viewers()
+        if not viewers:
+            return None
+        viewer = viewers[0]
+    viewer = str(viewer)
+    if viewer != 'admin' and not filename.startswith(f'{viewer}_'):
+        return None
+    expires = (int(time.time()) // URL_TTL + 2) * URL_TTL
+    return f'/screenshots/{filename}?exp={expires}&sig={_sign(filename, viewer, expires)}'
+
+
+def _authorized(filename):
+    try:
+        expires = int(request.args.get('exp', ''))
+    except ValueError:
+        return False
+    sig = request.args.get('sig', '')
+    if expires < time.time():
+        return False
+    for viewer in _viewers():
+        if viewer != 'admin' and not filename.startswith(f'{viewer}_'):
+            continue
+        if hmac.compare_digest(sig, _sign(filename, viewer, expires)):
+            return True
+    return False
+
+
+def serve(filename):
+    if not _authorized(filename):
+        abort(404)  # same answer for "missing" and "not yours"
+    path = safe_join(_config['folder'], filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+
+    max_age = max(0, int(request.args['exp']) - int(time.time()))
+    if SENDFILE == 'x-accel':
+        response = Response(mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+        response.headers['X-Accel-Redirect'] = ACCEL_PREFIX + filename
+    else:
+        # werkzeug's own helper: Flask's wrapper would override use_x_sendfile app-wide
+        response = send_from_directory(os.path.abspath(_config['folder']), filename, request.environ,
+                                       conditional=True, max_age=max_age,
+                                       use_x_sendfile=(SENDFILE == 'x-sendfile'),
+                                       response_class=current_app.response_class)
+    response.headers['Cache-Control'] = f'private, max-age={max_age}'
+    response.headers['X-Content-Type-Options'] = 'nosniff'
+    return response
+
+
+def init_app(app, folder):
+    _config['key'] = hmac.new(app.secret_key.encode(), b'screenshots', hashlib.sha256).digest()
+    _config['folder'] = folder
+    app.add_url_rule('/screenshots/<filename>', 'screenshot', serve)
+    app.add_template_filter(signed_url, 'screenshot_src')
+
+    @app.before_request
+    def block_public_uploads():
+        if request.path.startswith(PUBLIC_PREFIX):
+            abort(404)
@@ -0,0 +1,59 @@
+"""
+Background Tasks - the app's jobs and schedules, run by `python jobs.py worker`
+
+- rollups.refresh (every 5 minutes): keeps daily_rollups current, so the
+  analytics page's own refresh only has a few minutes to catch up on
+- jobs.cleanup (hourly): deletes finished jobs past their retention
+- payouts.batch / payouts.dispatch: see payouts.py
+- phash.check (queued by invest()): hashes a new screenshot, flags duplicates, see phash.py
+- uploads.gc (daily): removes orphaned screenshots, see upload_gc.py
+- archive.run (daily): moves closed rows to the archive, see archive.py
+- earnings.accrue (hourly, with EARNINGS_ACCRUAL=on): credits daily earnings, see earnings.py
+"""
+
+import os
+import time
+
+import archive  # noqa: F401  registers archive.run
+import earnings  # noqa: F401  registers earnings.accrue (when enabled)
+import jobs
+import payouts  # noqa: F401  registers payouts.batch / payouts.dispatch
+import phash  # noqa: F401  registers phash.check
+import rollups
+import upload_gc  # noqa: F401  registers uploads.gc
+
+DONE_RETENTION_DAYS = int(os.environ.get('JOBS_DONE_RETENTION_DAYS', 7))
+FAILED_RETENTION_DAYS = int(os.environ.get('JOBS_FAILED_RETENTION_DAYS', 30))
+
+
+def _connection():
+    from app import get_db_connection
+    return get_db_connection()
+
+
+@jobs.periodic('rollups.refresh', every=300, max_attempts=1)
+def refresh_rollups(payload):
+    conn, db_type = _connection()
+    try:
+        days = rollups.refresh(conn, db_type, rebuild=payload.get('rebuild', False))
+        if days:
+            print(f"✅ Rollups refreshed for {len(days)} day(s)")
+    finally:
+        conn.close()
+
+
+@jobs.periodic('jobs.cleanup', every=3600, max_attempts=1)
+def cleanup_jobs(payload):
+    now = time.time()
+    conn, db_type = _connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(jobs._sql(db_type, '''
+            DELETE FROM jobs WHERE (status = 'done' AND finished_at < ?) OR (status = 'failed' AND finished_at < ?)
+        '''), (now - DONE_RETENTION_DAYS * 86400, now - FAILED_RETENTION_DAYS * 86400))
+        removed = cursor.rowcount
+        conn.commit()
+    finally:
+        conn.close()
+    if removed:
+        print(f"✅ Removed {removed} old job(s)")
@@ -0,0 +1,274 @@
+"""
+Upload GC - delete (or archive) screenshots nothing points at any more
+
+    python upload_gc.py run [--dry-run]   # one pass now
+    python upload_gc.py manifest          # rebuild the manifest, print totals
+
+Orphans are files in the upload folder older than UPLOAD_GC_RETENTION_DAYS
+that no live investment references: rows that failed to insert or were
+deleted by hand, investments the admin rejected, and .part files left by
+uploads that died mid-request.
+
+A pass never holds the folder or the table in memory:
+
+1. os.scandir streams the folder into sorted runs of RUN_SIZE entries,
+   heapq.merge'd into the manifest: one "name<TAB>size<TAB>mtime" line
+   per file, in name order (.cache/upload-manifest.tsv, replaced at the end)
+2. referenced names come from one query ORDER BY screenshot_url over
+   live and archived investments (archive.source), read chunk by chunk
+   (a server-side cursor on Postgres, byte order via COLLATE "C" so it
+   sorts like Python)
+3. a merge-join walks both sorted streams once; manifest names with no
+   reference are orphans
+
+Orphans are removed in chunks: files first, then one transaction that
+subtracts them from upload_usage and clears screenshot_url on their
+rejected investments. The 'uploads.gc' job runs a pass every
+UPLOAD_GC_INTERVAL seconds.
+
+Env: UPLOAD_GC_RETENTION_DAYS (default 7), UPLOAD_GC_ACTION (delete or
+archive, default delete), UPLOAD_GC_ARCHIVE (archive folder, default
+archive/screenshots), UPLOAD_GC_INTERVAL (default 86400)
+"""
+
+import heapq
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import archive
+import jobs
+from db_pool import sql
+
+URL_PREFIX = '/static/uploads/screenshots/'
+RETENTION_DAYS = float(os.environ.get('UPLOAD_GC_RETENTION_DAYS', 7))
+ACTION = os.environ.get('UPLOAD_GC_ACTION', 'delete')
+ARCHIVE_FOLDER = os.environ.get('UPLOAD_GC_ARCHIVE', os.path.join('archive', 'screenshots'))
+GC_INTERVAL = int(os.environ.get('UPLOAD_GC_INTERVAL', 86400))
+MANIFEST_PATH = os.path.join('.cache', 'upload-manifest.tsv')
+RUN_SIZE = 100_000          # manifest entries sorted in memory at a time
+CHUNK_SIZE = 1000           # referenced names per fetch / orphans per transaction
+
+
+def _connection():
+    from app import get_db_connection
+    return get_db_connection()
+
+
+def _managed(name):
+    """Files this GC may touch: {user_id}_... uploads and .part leftovers"""
+    if name.startswith('.upload-'):
+        return name.endswith('.part')
+    prefix = name.split('_', 1)[0]
+    return prefix.isdigit() and '\t' not in name and '\n' not in name
+
+
+def _owner(name):
+    prefix = name.split('_', 1)[0]
+    return int(prefix) if prefix.isdigit() else None
+
+
+def _scan(folder):
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            if _managed(entry.name) and entry.is_file(follow_symlinks=False):
+                stat = entry.stat(follow_symlinks=False)
+                yield f'{entry.name}\t{stat.st_size}\t{int(stat.st_mtime)}\n'
+
+
+def _write_run(lines, directory):
+    lines.sort()
+    run = tempfile.TemporaryFile('w+', dir=directory)
+    run.writelines(lines)
+    run.seek(0)
+    return run
+
+
+def build_manifest(folder, path=MANIFEST_PATH, run_size=RUN_SIZE):
+    """Rewrite the manifest from the folder; returns (files, bytes)"""
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    runs, lines = [], []
+    try:
+        for line in _scan(folder):
+            lines.append(line)
+            if len(lines) >= run_size:
+                runs.append(_write_run(lines, directory))
+                lines = []
+        lines.sort()
+        files = total = 0
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'w') as out:
+            for line in heapq.merge(*runs, lines):
+                out.write(line)
+                files += 1
+                total += int(line.split('\t', 2)[1])
+        os.replace(tmp, path)
+    finally:
+        for run in runs:
+            run.close()
+    return files, total
+
+
+def read_manifest(path=MANIFEST_PATH):
+    """(name, size, mtime) in name order"""
+    with open(path) as f:
+        for line in f:
+            name, size, mtime = line.rstrip('\n').split('\t')
+            yield name, int(size), int(mtime)
+
+
+def referenced_names(conn, db_type, chunk_size=CHUNK_SIZE):
+    """Names of the files live investments point at, sorted (may repeat).
+    Archived investments count: their screenshots are still payment proof"""
+    query = f'''
+        SELECT screenshot_url FROM {archive.source(conn, db_type, 'investments')} investments
+        WHERE screenshot_url LIKE ? AND status <> 'rejected'
+        ORDER BY screenshot_url
+    '''
+    if db_type == 'postgres':
+        query = query.replace('ORDER BY screenshot_url', 'ORDER BY screenshot_url COLLATE "C"')
+        cursor = conn.cursor(name=f'upload_gc_{os.getpid()}')
+        cursor.itersize = chunk_size
+    else:
+        cursor = conn.cursor()
+    try:
+        cursor.execute(sql(db_type, query), (URL_PREFIX + '%',))
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            for row in rows:
+                yield row[0][len(URL_PREFIX):]
+    finally:
+        cursor.close()
+
+
+def find_orphans(manifest, referenced, cutoff):
+    """Merge-join two name-sorted streams; yields manifest entries older
+    than cutoff with no reference"""
+    referenced = iter(referenced)
+    ref = next(referenced, None)
+    for name, size, mtime in manifest:
+        while ref is not None and ref < name:
+            ref = next(referenced, None)
+        if ref == name or mtime >= cutoff:
+            continue
+        yield name, size, mtime
+
+
+def _remove(folder, name, action):
+    path = os.path.join(folder, name)
+    if action == 'archive' and not name.endswith('.part'):
+        os.makedirs(ARCHIVE_FOLDER, exist_ok=True)
+        shutil.move(path, os.path.join(ARCHIVE_FOLDER, name))
+    else:
+        os.remove(path)
+
+
+def _release(conn, db_type, removed):
+    """Give the quota back and drop links to files that are gone"""
+    freed = {}
+    for name, size in removed:
+        owner = _owner(name)
+        if owner is not None:
+            total, count = freed.get(owner, (0, 0))
+            freed[owner] = (total + size, count + 1)
+    cursor = conn.cursor()
+    if db_type == 'postgres':
+        cursor.executemany('''
+            UPDATE upload_usage SET bytes_stored = GREATEST(bytes_stored - %s, 0),
+                                    files_stored = GREATEST(files_stored - %s, 0)
+            WHERE user_id = %s
+        ''', [(size, count, user_id) for user_id, (size, count) in freed.items()])
+    else:
+        cursor.executemany('''
+            UPDATE upload_usage SET bytes_stored = MAX(bytes_stored - ?, 0),
+                                    files_stored = MAX(files_stored - ?, 0)
+            WHERE user_id = ?
+        ''', [(size, count, user_id) for user_id, (size, count) in freed.items()])
+    cursor.executemany(sql(db_type, '''
+        UPDATE investments SET screenshot_url = NULL WHERE screenshot_url = ? AND status = 'rejected'
+    '''), [(URL_PREFIX + name,) for name, _ in removed if _owner(name) is not None])
+    conn.commit()
+
+
+def collect(conn, db_type, folder, retention_days=RETENTION_DAYS, action=ACTION,
+            dry_run=False, manifest_path=MANIFEST_PATH):
+    """One GC pass; returns a report dict"""
+    started = time.perf_counter()
+    files, total = build_manifest(folder, manifest_path)
+    cutoff = time.time() - retention_days * 86400
+    report = {'files': files, 'bytes': total, 'orphans': 0, 'reclaimed_bytes': 0, 'errors': 0,
+              'action': 'dry-run' if dry_run else action}
+
+    # Spool the join's output so the read cursor is closed before the first
+    # commit (a Postgres server-side cursor doesn't survive one)
+    with tempfile.TemporaryFile('w+', dir=os.path.dirname(manifest_path) or '.') as orphans:
+        for name, size, _ in find_orphans(read_manifest(manifest_path), referenced_names(conn, db_type), cutoff):
+            orphans.write(f'{name}\t{size}\n')
+        orphans.seek(0)
+
+        batch = []
+        for line in orphans:
+            name, size = line.rstrip('\n').split('\t')
+            if not dry_run:
+                try:
+                    _remove(folder, name, action)
+                except OSError as e:
+                    print(f"⚠️  Could not remove {name}: {str(e)}")
+                    report['errors'] += 1
+                    continue
+                batch.append((name, int(size)))
+                if len(batch) >= CHUNK_SIZE:
+                    _release(conn, db_type, batch)
+                    batch = []
+            report['orphans'] += 1
+            report['reclaimed_bytes'] += int(size)
+        if batch:
+            _release(conn, db_type, batch)
+
+    report['seconds'] = round(time.perf_counter() - started, 2)
+    return report
+
+
+def _print_report(report):
+    verb = {'delete': 'deleted', 'archive': 'archived'}.get(report['action'], 'would remove')
+    print(f"✅ Upload GC: {report['files']} file(s), {report['bytes'] / 1024 / 1024:.1f} MB on disk; "
+          f"{verb} {report['orphans']} orphan(s), {report['reclaimed_bytes'] / 1024 / 1024:.1f} MB "
+          f"reclaimed ({report['seconds']}s)")
+
+
+@jobs.periodic('uploads.gc', every=GC_INTERVAL, max_attempts=1)
+def gc_job(payload):
+    from app import UPLOAD_FOLDER
+    conn, db_type = _connection()
+    try:
+        report = collect(conn, db_type, UPLOAD_FOLDER, dry_run=payload.get('dry_run', False))
+    finally:
+        conn.close()
+    _print_report(report)
+
+
+def main():
+    command = sys.argv[1] if len(sys.argv) > 1 else 'run'
+    import app
+    app.ensure_schema()
+    if command == 'manifest':
+        files, total = build_manifest(app.UPLOAD_FOLDER)
+        print(f"✅ Manifest: {files} file(s), {total / 1024 / 1024:.1f} MB -> {MANIFEST_PATH}")
+        return
+    if command != 'run':
+        raise SystemExit("usage: python upload_gc.py run [--dry-run] | manifest")
+    conn, db_type = app.get_db_connection()
+    try:
+        report = collect(conn, db_type, app.UPLOAD_FOLDER, dry_run='--dry-run' in sys.argv)
+    finally:
+        conn.close()
+    _print_report(report)
+
+
+if __name__ == "__main__":
+    main()
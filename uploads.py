@@ -0,0 +1,278 @@
+"""
+Screenshot Uploads - validate while the body streams in, write straight to disk
+
+Werkzeug normally buffers each uploaded file (memory, then a temp file)
+before the view even sees it. For the endpoints in STREAMED_ENDPOINTS,
+UploadRequest hands the multipart parser a StreamedUpload instead:
+
+- before any file byte is read: per-user quota check (one primary-key
+  lookup in upload_usage) against the request's Content-Length
+- first chunks: magic bytes (PNG / JPEG / GIF only) and image
+  dimensions from the header; anything else raises UploadRejected
+  right there and the rest of the body is never parsed or written
+- after that, chunks go straight into a .part file in the upload folder,
+  renamed into place by commit() (no temp copy); uncommitted parts are
+  deleted when the request closes
+
+invest() catches UploadRejected and flashes the reason. upload_usage
+counts stored bytes and uploads per day per user;
+`python uploads.py recount` rebuilds it from the files on disk.
+
+Env: UPLOAD_MAX_DIMENSION (px, default 8000), UPLOAD_MAX_PIXELS
+(default 40000000), UPLOAD_QUOTA_MB (stored per user, default 50),
+UPLOADS_PER_DAY (per user, default 20)
+"""
+
+import os
+import struct
+import sys
+import uuid
+from datetime import date
+
+from flask import Request, session
+from werkzeug.exceptions import BadRequest
+
+from db_pool import sql
+
+MAX_DIMENSION = int(os.environ.get('UPLOAD_MAX_DIMENSION', 8000))
+MAX_PIXELS = int(os.environ.get('UPLOAD_MAX_PIXELS', 40_000_000))
+QUOTA_BYTES = int(float(os.environ.get('UPLOAD_QUOTA_MB', 50)) * 1024 * 1024)
+UPLOADS_PER_DAY = int(os.environ.get('UPLOADS_PER_DAY', 20))
+HEADER_LIMIT = 256 * 1024   # JPEG EXIF can push the size marker back this far
+STREAMED_ENDPOINTS = {'invest'}
+
+SIGNATURES = {
+    b'\x89PNG\r\n\x1a\n': 'png',
+    b'\xff\xd8\xff': 'jpg',
+    b'GIF87a': 'gif',
+    b'GIF89a': 'gif',
+}
+# JPEG start-of-frame markers (the ones carrying the image size)
+_SOF = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+_config = {'get_db_connection': None, 'folder': None, 'max_bytes': None}
+
+
+class UploadRejected(BadRequest):
+    """Raised from inside form parsing; `description` is shown to the user"""
+
+
+def ensure_table(cursor, db_type):
+    if db_type == 'postgres':
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS upload_usage (
+                user_id INTEGER PRIMARY KEY,
+                bytes_stored BIGINT NOT NULL DEFAULT 0,
+                files_stored INTEGER NOT NULL DEFAULT 0,
+                day VARCHAR(10),
+                day_uploads INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+    else:
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS upload_usage (
+                user_id INTEGER PRIMARY KEY,
+                bytes_stored INTEGER NOT NULL DEFAULT 0,
+                files_stored INTEGER NOT NULL DEFAULT 0,
+                day TEXT,
+                day_uploads INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+
+
+def sniff(head):
+    """(kind, width, height) from the first bytes of an image, None if more
+    bytes are needed; raises UploadRejected for anything that isn't one"""
+    for signature, kind in SIGNATURES.items():
+        if head[:len(signature)] == signature[:len(head)]:
+            if len(head) < len(signature):
+                return None
+            break
+    else:
+        raise UploadRejected('Only PNG, JPG and GIF images are allowed!')
+
+    if kind == 'png':
+        if len(head) < 24:
+            return None
+        if head[12:16] != b'IHDR':
+            raise UploadRejected('Damaged PNG image!')
+        width, height = struct.unpack('>II', head[16:24])
+        return kind, width, height
+    if kind == 'gif':
+        if len(head) < 10:
+            return None
+        width, height = struct.unpack('<HH', head[6:10])
+        return kind, width, height
+
+    # JPEG: walk the segments until a start-of-frame marker
+    i = 2
+    while True:
+        while i < len(head) and head[i] == 0xFF:
+            i += 1  # fill bytes
+        if i + 1 > len(head):
+            return None
+        marker = head[i]
+        i += 1
+        if marker == 0x01 or 0xD0 <= marker <= 0xD7:
+            continue  # no length field
+        if marker == 0xD9 or marker == 0xDA:
+            raise UploadRejected('Damaged JPG image!')  # end / scan before any frame header
+        if i + 2 > len(head):
+            return None
+        length = struct.unpack('>H', head[i:i + 2])[0]
+        if marker in _SOF:
+            if i + 7 > len(head):
+                return None
+            height, width = struct.unpack('>HH', head[i + 3:i + 7])
+            return kind, width, height
+        i += length
+
+
+def check_dimensions(width, height):
+    if not width or not height:
+        raise UploadRejected('Damaged image!')
+    if width > MAX_DIMENSION or height > MAX_DIMENSION or width * height > MAX_PIXELS:
+        raise UploadRejected(f'Image is too large ({width}x{height}) - please upload a normal screenshot!')
+
+
+class StreamedUpload:
+    """Write target for one uploaded file (what FileStorage.stream becomes)"""
+
+    def __init__(self, folder, max_bytes=None):
+        self.path = os.path.join(folder, f'.upload-{uuid.uuid4().hex}.part')
+        self.max_bytes = max_bytes
+        self.kind = self.width = self.height = None
+        self.size = 0
+        self.committed = False
+        self._head = bytearray()
+        self._file = None
+
+    def write(self, data):
+        self.size += len(data)
+        if self.max_bytes and self.size > self.max_bytes:
+            raise UploadRejected(f'Screenshot is larger than {self.max_bytes // (1024 * 1024)} MB!')
+        if self._file is not None:
+            self._file.write(data)
+            return
+        self._head += data
+        info = sniff(bytes(self._head))
+        if info is None:
+            if len(self._head) > HEADER_LIMIT:
+                raise UploadRejected('Damaged image!')
+            return
+        self.kind, self.width, self.height = info
+        check_dimensions(self.width, self.height)
+        self._file = open(self.path, 'wb')
+        self._file.write(self._head)
+        self._head = None
+
+    def seek(self, offset, whence=0):
+        if self._file is not None:
+            self._file.flush()
+
+    def tell(self):
+        return self.size
+
+    def read(self, size=-1):
+        raise OSError('Streamed uploads are written to disk; use commit()')
+
+    def commit(self, destination):
+        """Move the finished upload to `destination`; returns its size"""
+        if self.kind is None:
+            raise UploadRejected('Only PNG, JPG and GIF images are allowed!')
+        self._file.close()
+        os.replace(self.path, destination)
+        self.committed = True
+        return self.size
+
+    def close(self):
+        if self._file is not None and not self._file.closed:
+            self._file.close()
+        if not self.committed and self._file is not None:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+
+def usage(user_id):
+    conn, db_type = _config['get_db_connection']()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(sql(db_type, 'SELECT bytes_stored, day, day_uploads FROM upload_usage WHERE user_id = ?'),
+                       (user_id,))
+        row = cursor.fetchone()
+    finally:
+        conn.close()
+    if row is None:
+        return 0, 0
+    return row['bytes_stored'], row['day_uploads'] if row['day'] == date.today().isoformat() else 0
+
+
+def check_quota(user_id, incoming_bytes):
+    stored, today = usage(user_id)
+    if today >= UPLOADS_PER_DAY:
+        raise UploadRejected(f'Upload limit reached ({UPLOADS_PER_DAY} screenshots per day) - please try tomorrow!')
+    if stored + (incoming_bytes or 0) > QUOTA_BYTES:
+        raise UploadRejected('Your screenshot storage is full - please contact support!')
+
+
+def record_usage(cursor, db_type, user_id, size):
+    """Count a stored upload (in the same transaction as the row that references it)"""
+    cursor.execute(sql(db_type, '''
+        INSERT INTO upload_usage (user_id, bytes_stored, files_stored, day, day_uploads) VALUES (?, ?, 1, ?, 1)
+        ON CONFLICT (user_id) DO UPDATE SET
+            bytes_stored = upload_usage.bytes_stored + excluded.bytes_stored,
+            files_stored = upload_usage.files_stored + 1,
+            day_uploads = CASE WHEN upload_usage.day = excluded.day THEN upload_usage.day_uploads + 1 ELSE 1 END,
+            day = excluded.day
+    '''), (user_id, size, date.today().isoformat()))
+
+
+class UploadRequest(Request):
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if self.endpoint not in STREAMED_ENDPOINTS or not filename or _config['folder'] is None:
+            return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+        if 'user_id' not in session:
+            raise UploadRejected('Please login first!')
+        check_quota(session['user_id'], total_content_length)
+        return StreamedUpload(_config['folder'], _config['max_bytes'])
+
+
+def init_app(app, get_db_connection, folder):
+    _config.update(get_db_connection=get_db_connection, folder=folder,
+                   max_bytes=app.config.get('MAX_CONTENT_LENGTH'))
+    app.request_class = UploadRequest
+
+
+def recount(get_db_connection, folder):
+    """Rebuild upload_usage.bytes_stored / files_stored from the files on disk"""
+    totals = {}
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            prefix = entry.name.split('_', 1)[0]
+            if entry.is_file() and prefix.isdigit():
+                size, count = totals.get(int(prefix), (0, 0))
+                totals[int(prefix)] = (size + entry.stat().st_size, count + 1)
+    conn, db_type = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute('UPDATE upload_usage SET bytes_stored = 0, files_stored = 0')
+        cursor.executemany(sql(db_type, '''
+            INSERT INTO upload_usage (user_id, bytes_stored, files_stored) VALUES (?, ?, ?)
+            ON CONFLICT (user_id) DO UPDATE SET bytes_stored = excluded.bytes_stored,
+                                                files_stored = excluded.files_stored
+        '''), [(user_id, size, count) for user_id, (size, count) in totals.items()])
+        conn.commit()
+    finally:
+        conn.close()
+    print(f"✅ Upload usage recounted for {len(totals)} user(s), "
+          f"{sum(size for size, _ in totals.values()) / 1024 / 1024:.1f} MB on disk")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ['recount']:
+        raise SystemExit("usage: python uploads.py recount")
+    import app
+    app.ensure_schema()
+    recount(app.get_db_connection, app.UPLOAD_FOLDER)
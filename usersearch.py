@@ -0,0 +1,199 @@
+"""
+User Search - find users by username, email or payout number for the admin
+
+    python usersearch.py search <text>     # ranked matches, as the API returns them
+    python usersearch.py rebuild           # re-index every user
+
+Substring and prefix search over username, email, whatsapp_number,
+easypaisa_number and jazzcash_number, answered from trigram indexes:
+
+- Postgres: pg_trgm GIN indexes on each column; one ILIKE '%text%' per
+  column, OR'ed, becomes a BitmapOr over the indexes
+- SQLite: users_fts, an FTS5 table with the trigram tokenizer that reads
+  its text from users (content='users'); triggers on users keep it in
+  step with every INSERT / UPDATE / DELETE
+
+Trigrams need at least MIN_QUERY characters; a shorter query (a
+two-letter username like "u1") only finds exact username/email matches,
+through their UNIQUE indexes. Otherwise the index returns up to
+CANDIDATE_LIMIT matches plus any exact username/email match; those are
+ranked here - exact beats prefix beats the start of a word (after
+@ . _ - + or a space) beats a substring, username before email before
+the numbers, shorter values first - and paged by offset.
+A search touching more users than that says so (truncated) and asks
+for more characters instead of scoring millions of rows.
+
+Env: USER_SEARCH_CANDIDATES (default 1000)
+"""
+
+import os
+import re
+import sys
+import time
+
+from db_pool import sql
+
+MIN_QUERY = 3
+CANDIDATE_LIMIT = int(os.environ.get('USER_SEARCH_CANDIDATES', 1000))
+
+# column -> rank weight
+COLUMNS = {
+    'username': 1.0,
+    'email': 0.9,
+    'whatsapp_number': 0.8,
+    'easypaisa_number': 0.8,
+    'jazzcash_number': 0.8,
+}
+
+_WORD_START = re.compile(r'[@._\-\s+]')
+
+
+def ensure_table(cursor, db_type):
+    if db_type == 'postgres':
+        # pg_trgm ships with Postgres but needs CREATE on the database; without
+        # it search still works, as sequential scans
+        cursor.execute('SAVEPOINT usersearch_trgm')
+        try:
+            cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        except Exception as e:
+            cursor.execute('ROLLBACK TO SAVEPOINT usersearch_trgm')
+            print(f"⚠️  pg_trgm unavailable, user search will scan: {str(e).strip()}")
+            return
+        cursor.execute('RELEASE SAVEPOINT usersearch_trgm')
+        for column in COLUMNS:
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_users_{column}_trgm '
+                           f'ON users USING gin ({column} gin_trgm_ops)')
+        return
+
+    columns = ', '.join(COLUMNS)
+    new = ', '.join(f'new.{c}' for c in COLUMNS)
+    old = ', '.join(f'old.{c}' for c in COLUMNS)
+    cursor.execute(f'''
+        CREATE VIRTUAL TABLE IF NOT EXISTS users_fts USING fts5(
+            {columns}, content='users', content_rowid='id', tokenize='trigram'
+        )
+    ''')
+    # init_db() may have recreated users, which drops its triggers: the index
+    # is stale whenever they're missing
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='trigger' AND name='users_fts_insert'")
+    if cursor.fetchone():
+        return
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS users_fts_insert AFTER INSERT ON users BEGIN
+            INSERT INTO users_fts (rowid, {columns}) VALUES (new.id, {new});
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS users_fts_delete AFTER DELETE ON users BEGIN
+            INSERT INTO users_fts (users_fts, rowid, {columns}) VALUES ('delete', old.id, {old});
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS users_fts_update AFTER UPDATE OF {columns} ON users BEGIN
+            INSERT INTO users_fts (users_fts, rowid, {columns}) VALUES ('delete', old.id, {old});
+            INSERT INTO users_fts (rowid, {columns}) VALUES (new.id, {new});
+        END
+    ''')
+    cursor.execute("INSERT INTO users_fts (users_fts) VALUES ('rebuild')")
+    print("🔧 Built user search index (users_fts)")
+
+
+def _like_pattern(text):
+    return '%' + re.sub(r'([\\%_])', r'\\\1', text) + '%'
+
+
+def _candidates(cursor, db_type, text, limit):
+    if len(text) < MIN_QUERY:
+        cursor.execute(sql(db_type, f'''
+            SELECT id, {', '.join(COLUMNS)} FROM users WHERE username = ? OR email = ?
+        '''), (text, text))
+    elif db_type == 'postgres':
+        pattern = _like_pattern(text)
+        matches = ' OR '.join(f"{c} ILIKE %s ESCAPE '\\'" for c in COLUMNS)
+        cursor.execute(f'''
+            SELECT id, {', '.join(COLUMNS)} FROM (
+                SELECT * FROM users WHERE {matches} LIMIT %s
+            ) hits
+            UNION
+            SELECT id, {', '.join(COLUMNS)} FROM users WHERE username = %s OR email = %s
+        ''', [pattern] * len(COLUMNS) + [limit, text, text])
+    else:
+        # one quoted FTS5 string: with the trigram tokenizer it matches as a substring
+        phrase = '"' + text.replace('"', '""') + '"'
+        cursor.execute(f'''
+            SELECT u.id, {', '.join('u.' + c for c in COLUMNS)} FROM users u
+            JOIN (SELECT rowid FROM users_fts WHERE users_fts MATCH ? ORDER BY rowid DESC LIMIT ?) hits
+              ON hits.rowid = u.id
+            UNION
+            SELECT id, {', '.join(COLUMNS)} FROM users WHERE username = ? OR email = ?
+        ''', (phrase, limit, text, text))
+    return cursor.fetchall()
+
+
+def _score(row, text):
+    """(score, length of the best-matching value) for one candidate"""
+    best = (0.0, 0)
+    for column, weight in COLUMNS.items():
+        value = (row[column] or '').lower()
+        if value == text:
+            score = 4
+        elif value.startswith(text):
+            score = 3
+        elif any(value.startswith(text, m.end()) for m in _WORD_START.finditer(value)):
+            score = 2
+        elif text in value:
+            score = 1
+        else:
+            continue
+        best = max(best, (score * weight, -len(value)))
+    return best
+
+
+def search(conn, db_type, text, limit=CANDIDATE_LIMIT):
+    """Ranked ids of the users matching text; returns (ids, truncated)"""
+    text = text.strip()
+    cursor = conn.cursor()
+    rows = _candidates(cursor, db_type, text, limit)
+    needle = text.lower()
+    ranked = sorted(rows, key=lambda row: (_score(row, needle), row['id']), reverse=True)
+    return [row['id'] for row in ranked], len(rows) >= limit
+
+
+def rebuild(conn, db_type):
+    cursor = conn.cursor()
+    if db_type == 'postgres':
+        for column in COLUMNS:
+            cursor.execute(f'REINDEX INDEX idx_users_{column}_trgm')
+    else:
+        cursor.execute("INSERT INTO users_fts (users_fts) VALUES ('rebuild')")
+    conn.commit()
+
+
+def main():
+    command = sys.argv[1] if len(sys.argv) > 1 else ''
+    import app
+    app.ensure_schema()
+    conn, db_type = app.get_db_connection()
+    try:
+        if command == 'rebuild':
+            started = time.perf_counter()
+            rebuild(conn, db_type)
+            print(f"✅ User search index rebuilt in {time.perf_counter() - started:.2f}s")
+        elif command == 'search' and len(sys.argv) > 2 and sys.argv[2].strip():
+            started = time.perf_counter()
+            ids, truncated = search(conn, db_type, sys.argv[2])
+            elapsed = (time.perf_counter() - started) * 1000
+            cursor = conn.cursor()
+            for user_id in ids[:20]:
+                cursor.execute(sql(db_type, f"SELECT id, {', '.join(COLUMNS)} FROM users WHERE id = ?"), (user_id,))
+                row = cursor.fetchone()
+                print('#{}  '.format(row['id']) + '  '.join(str(row[c]) for c in COLUMNS if row[c]))
+            print(f"{len(ids)}{'+' if truncated else ''} match(es) in {elapsed:.1f}ms")
+        else:
+            raise SystemExit("usage: python usersearch.py search <text> | rebuild")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()